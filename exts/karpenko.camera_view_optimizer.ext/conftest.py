@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The tests import the extension as karpenko.camera_view_optimizer, like Kit does, so pytest needs its folder on the
+# path wherever it is started from.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
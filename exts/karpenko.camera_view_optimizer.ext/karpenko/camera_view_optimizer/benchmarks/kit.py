@@ -0,0 +1,154 @@
+import importlib
+import sys
+import types
+
+# The Kit modules the extension imports, in the order parents come before their children.
+KIT_MODULES = (
+    "carb",
+    "carb.profiler",
+    "omni",
+    "omni.ext",
+    "omni.kit",
+    "omni.kit.commands",
+    "omni.kit.undo",
+    "omni.kit.viewport",
+    "omni.kit.viewport.utility",
+    "omni.timeline",
+    "omni.ui",
+    "omni.usd",
+)
+
+
+class _Anything:
+    """
+    Whatever is read from or called on a Kit module that has no stand-in, it does nothing and returns itself
+    """
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+class _StandInModule(types.ModuleType):
+    """
+    A Kit module that is not available headless, the names that are not defined on it do nothing
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Anything()
+
+
+class Command:
+    """
+    Stand-in of omni.kit.commands.Command, subclasses are registered by their name the way Kit registers them
+    """
+
+    registry = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Command.registry[cls.__name__] = cls
+
+    def do(self):
+        pass
+
+    def undo(self):
+        pass
+
+
+class KitStandIns:
+    """
+    Headless stand-ins of the Kit modules, so the extension and its commands can run on a plain pxr stage
+
+    The commands run against the stage of the stand-in USD context, executed commands go to an undo history and undo
+    groups are undone as a whole, like in Kit. Everything else (the UI, the viewport, the timeline) does nothing.
+    """
+
+    def __init__(self):
+        self.stage = None
+        self.history = []
+        self._groups = []
+
+    def install(self):
+        """
+        It registers the stand-in modules, unless Kit itself is available
+
+        :return: True if the stand-ins were installed, False if the real Kit modules are used.
+        """
+        try:
+            importlib.import_module("omni.kit.commands")
+            return False
+        except ImportError:
+            pass
+        modules = {name: _StandInModule(name) for name in KIT_MODULES}
+        for name, module in modules.items():
+            parent, _, child = name.rpartition(".")
+            if parent:
+                setattr(modules[parent], child, module)
+        modules["omni.ext"].IExt = type("IExt", (), {})
+        modules["omni.kit.commands"].Command = Command
+        modules["omni.kit.commands"].create = self.create
+        modules["omni.kit.commands"].execute = self.execute
+        modules["omni.kit.undo"].begin_group = self.begin_group
+        modules["omni.kit.undo"].end_group = self.end_group
+        modules["omni.kit.undo"].undo = self.undo
+        modules["omni.usd"].get_context = lambda: self
+        sys.modules.update(modules)
+        return True
+
+    def get_stage(self):
+        """
+        It returns the stage the commands run against, like omni.usd.UsdContext.get_stage
+
+        :return: Usd.Stage
+        """
+        return self.stage
+
+    def create(self, command_name, **kwargs):
+        """
+        It creates a registered command without running it, like omni.kit.commands.create
+
+        :param command_name: Name of the command class
+        :param kwargs: Arguments of the command
+        :return: The command.
+        """
+        return Command.registry[command_name](**kwargs)
+
+    def execute(self, command_name, **kwargs):
+        """
+        It runs a registered command and adds it to the undo history, like omni.kit.commands.execute
+
+        :param command_name: Name of the command class
+        :param kwargs: Arguments of the command
+        :return: A tuple of True and what the command returned.
+        """
+        command = self.create(command_name, **kwargs)
+        result = command.do()
+        self.history.append(command)
+        return True, result
+
+    def begin_group(self):
+        self._groups.append(len(self.history))
+
+    def end_group(self):
+        start = self._groups.pop()
+        self.history[start:] = [self.history[start:]]
+
+    def undo(self):
+        """
+        It undoes the last command, or all the commands of the last group
+        """
+        if self.history:
+            _undo(self.history.pop())
+
+
+def _undo(entry):
+    if isinstance(entry, list):
+        for child in reversed(entry):
+            _undo(child)
+    else:
+        entry.undo()
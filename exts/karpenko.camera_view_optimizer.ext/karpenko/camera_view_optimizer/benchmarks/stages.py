@@ -0,0 +1,238 @@
+import math
+
+import numpy as np
+from pxr import Gf, Sdf, Usd, UsdGeom, Vt
+
+
+def build_deep_stage(depth=8, breadth=2, root_path="/World"):
+    """
+    It builds an in-memory stage with a deep hierarchy of Xforms, every leaf Xform has a cube
+
+    Every level is offset from its parent, so the world bounds depend on all ancestor transforms.
+
+    :param depth: Number of nested Xform levels
+    :param breadth: Number of children of every Xform
+    :param root_path: Path of the default prim
+    :return: Usd.Stage
+    """
+    stage = Usd.Stage.CreateInMemory()
+    UsdGeom.SetStageUpAxis(stage, UsdGeom.Tokens.y)
+    root = UsdGeom.Xform.Define(stage, root_path)
+    stage.SetDefaultPrim(root.GetPrim())
+
+    parents = [root.GetPath()]
+    for level in range(depth):
+        children = []
+        for parent_path in parents:
+            for index in range(breadth):
+                xform = UsdGeom.Xform.Define(stage, parent_path.AppendChild(f"Xform_{level}_{index}"))
+                xform.AddTranslateOp().Set(Gf.Vec3d(index * 10.0, 0.0, -level * 10.0))
+                children.append(xform.GetPath())
+        parents = children
+
+    for parent_path in parents:
+        UsdGeom.Cube.Define(stage, parent_path.AppendChild("Cube"))
+    return stage
+
+
+def build_flat_stage(count, root_path="/World"):
+    """
+    It builds an in-memory stage with count cubes directly under the default prim
+
+    The prims are authored with the Sdf API in one change block, so even millions of prims are created quickly.
+
+    :param count: Number of cubes
+    :param root_path: Path of the default prim
+    :return: A tuple of the Usd.Stage and the list of cube paths.
+    """
+    layer = Sdf.Layer.CreateAnonymous(".usda")
+    root_spec = Sdf.CreatePrimInLayer(layer, root_path)
+    root_spec.specifier = Sdf.SpecifierDef
+    root_spec.typeName = "Xform"
+    layer.defaultPrim = root_spec.name
+    paths = []
+    with Sdf.ChangeBlock():
+        for index in range(count):
+            prim_spec = Sdf.PrimSpec(root_spec, f"Cube_{index}", Sdf.SpecifierDef, "Cube")
+            paths.append(prim_spec.path)
+    return Usd.Stage.Open(layer), paths
+
+
+def build_scattered_stage(count, extent=5000.0, seed=0, root_path="/World"):
+    """
+    It builds an in-memory stage with count cubes scattered around a camera at the origin
+
+    :param count: Number of cubes
+    :param extent: The cubes are placed within this distance from the origin on the X and Z axes
+    :param seed: Seed of the random placement
+    :param root_path: Path of the default prim
+    :return: A tuple of the Usd.Stage, the list of cube paths and the path of the camera.
+    """
+    stage, paths = build_flat_stage(count, root_path)
+    layer = stage.GetRootLayer()
+    with Sdf.ChangeBlock():
+        _author_translations(layer, paths, get_scattered_positions(count, extent, seed))
+        camera_path = _define_camera(layer, root_path)
+    return stage, paths, camera_path
+
+
+def get_scattered_positions(count, extent=5000.0, seed=0):
+    """
+    It returns count random positions on a flat square around the origin
+
+    :param count: Number of positions
+    :param extent: The positions are within this distance from the origin on the X and Z axes
+    :param seed: Seed of the random placement
+    :return: A (count, 3) array.
+    """
+    random = np.random.default_rng(seed)
+    positions = random.uniform(-extent, extent, (count, 3))
+    positions[:, 1] *= 0.01
+    return positions
+
+
+def build_deep_scene(count, breadth=4, root_path="/World"):
+    """
+    It builds a deep hierarchy with about count cubes and a camera, see build_deep_stage
+
+    :param count: Approximate number of cubes, the hierarchy is as deep as needed to hold them
+    :param breadth: Number of children of every Xform
+    :param root_path: Path of the default prim
+    :return: A tuple of the Usd.Stage and the path of the camera.
+    """
+    depth = max(1, int(round(math.log(max(count, 1), breadth))))
+    stage = build_deep_stage(depth, breadth, root_path)
+    return stage, _define_camera(stage.GetRootLayer(), root_path)
+
+
+def build_instancer_scene(count, instancers=10, extent=5000.0, seed=0, root_path="/World"):
+    """
+    It builds point instancers with count instances of cubes and spheres in total, scattered around a camera
+
+    :param count: Number of instances, split evenly between the instancers
+    :param instancers: Number of point instancers
+    :param extent: The instances are placed within this distance from the origin on the X and Z axes
+    :param seed: Seed of the random placement
+    :param root_path: Path of the default prim
+    :return: A tuple of the Usd.Stage and the path of the camera.
+    """
+    stage = Usd.Stage.CreateInMemory()
+    root = UsdGeom.Xform.Define(stage, root_path)
+    stage.SetDefaultPrim(root.GetPrim())
+    random = np.random.default_rng(seed)
+    for index, instance_count in enumerate(np.diff(np.linspace(0, count, instancers + 1).astype(np.int64))):
+        instancer = UsdGeom.PointInstancer.Define(stage, root.GetPath().AppendChild(f"Instancer_{index}"))
+        prototypes_path = instancer.GetPath().AppendChild("Prototypes")
+        prototypes = [
+            UsdGeom.Cube.Define(stage, prototypes_path.AppendChild("Cube")).GetPath(),
+            UsdGeom.Sphere.Define(stage, prototypes_path.AppendChild("Sphere")).GetPath(),
+        ]
+        instancer.CreatePrototypesRel().SetTargets(prototypes)
+        positions = get_scattered_positions(int(instance_count), extent, seed + index)
+        instancer.CreatePositionsAttr(Vt.Vec3fArray.FromNumpy(positions.astype(np.float32)))
+        proto_indices = random.integers(0, len(prototypes), int(instance_count)).astype(np.int32)
+        instancer.CreateProtoIndicesAttr(Vt.IntArray.FromNumpy(proto_indices))
+    return stage, _define_camera(stage.GetRootLayer(), root_path)
+
+
+def build_payload_scene(count, extent=5000.0, seed=0, root_path="/World"):
+    """
+    It builds count models scattered around a camera, every model loads the same cube asset through a
+    payload
+
+    :param count: Number of models
+    :param extent: The models are placed within this distance from the origin on the X and Z axes
+    :param seed: Seed of the random placement
+    :param root_path: Path of the default prim
+    :return: A tuple of the Usd.Stage and the path of the camera.
+    """
+    layer = Sdf.Layer.CreateAnonymous(".usda")
+    root_spec = Sdf.CreatePrimInLayer(layer, root_path)
+    root_spec.specifier = Sdf.SpecifierDef
+    root_spec.typeName = "Xform"
+    layer.defaultPrim = root_spec.name
+    # The asset is a class in the same layer, so the payloads don't need a file and it is never traversed.
+    asset_spec = Sdf.CreatePrimInLayer(layer, "/_Asset")
+    asset_spec.specifier = Sdf.SpecifierClass
+    asset_spec.typeName = "Xform"
+    Sdf.PrimSpec(asset_spec, "Cube", Sdf.SpecifierDef, "Cube")
+    paths = []
+    with Sdf.ChangeBlock():
+        for index in range(count):
+            prim_spec = Sdf.PrimSpec(root_spec, f"Model_{index}", Sdf.SpecifierDef, "Xform")
+            prim_spec.payloadList.Prepend(Sdf.Payload(primPath=asset_spec.path))
+            paths.append(prim_spec.path)
+        _author_translations(layer, paths, get_scattered_positions(count, extent, seed))
+        camera_path = _define_camera(layer, root_path)
+    return Usd.Stage.Open(layer), camera_path
+
+
+def build_light_scene(count, light_ratio=0.1, extent=5000.0, seed=0, root_path="/World"):
+    """
+    It builds count scattered prims around a camera, a share of them are sphere lights and the rest are cubes
+
+    :param count: Number of prims
+    :param light_ratio: Share of the prims that are lights
+    :param extent: The prims are placed within this distance from the origin on the X and Z axes
+    :param seed: Seed of the random placement
+    :param root_path: Path of the default prim
+    :return: A tuple of the Usd.Stage and the path of the camera.
+    """
+    stage, paths, camera_path = build_scattered_stage(count, extent, seed, root_path)
+    layer = stage.GetRootLayer()
+    with Sdf.ChangeBlock():
+        for path in paths[:int(count * light_ratio)]:
+            layer.GetPrimAtPath(path).typeName = "SphereLight"
+    return stage, camera_path
+
+
+def build_flat_scene(count, extent=5000.0, seed=0, root_path="/World"):
+    """
+    It builds count cubes directly under the default prim, scattered around a camera, see build_scattered_stage
+
+    :param count: Number of cubes
+    :param extent: The cubes are placed within this distance from the origin on the X and Z axes
+    :param seed: Seed of the random placement
+    :param root_path: Path of the default prim
+    :return: A tuple of the Usd.Stage and the path of the camera.
+    """
+    stage, _, camera_path = build_scattered_stage(count, extent, seed, root_path)
+    return stage, camera_path
+
+
+# The shapes of the benchmark stages, by name. Every builder takes the number of prims and returns the stage and
+# the path of its camera.
+SCENE_BUILDERS = {
+    "flat": build_flat_scene,
+    "deep": build_deep_scene,
+    "instancers": build_instancer_scene,
+    "payloads": build_payload_scene,
+    "lights": build_light_scene,
+}
+
+
+def build_scene(shape, count):
+    """
+    It builds a benchmark stage of the given shape
+
+    :param shape: One of SCENE_BUILDERS
+    :param count: Number of prims, or of instances for the "instancers" shape
+    :return: A tuple of the Usd.Stage and the path of the camera.
+    """
+    if shape not in SCENE_BUILDERS:
+        raise ValueError(f"unknown stage shape {shape!r}, expected one of {', '.join(SCENE_BUILDERS)}")
+    return SCENE_BUILDERS[shape](count)
+
+
+def _author_translations(layer, paths, positions):
+    for path, position in zip(paths, positions):
+        prim_spec = layer.GetPrimAtPath(path)
+        translate = Sdf.AttributeSpec(prim_spec, "xformOp:translate", Sdf.ValueTypeNames.Double3)
+        translate.default = Gf.Vec3d(*position)
+        op_order = Sdf.AttributeSpec(prim_spec, "xformOpOrder", Sdf.ValueTypeNames.TokenArray)
+        op_order.default = ["xformOp:translate"]
+
+
+def _define_camera(layer, root_path):
+    camera_spec = Sdf.PrimSpec(layer.GetPrimAtPath(root_path), "Camera", Sdf.SpecifierDef, "Camera")
+    return camera_spec.path.pathString
@@ -0,0 +1,380 @@
+import argparse
+import importlib
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+from pxr import Gf, Usd, UsdGeom
+
+from ..core.authoring import clear_visibility_opinions, restore_visibility_opinions, set_visibility_opinions
+from ..core.bounds import SceneBounds
+from ..core.culling import find_hidden_paths
+from ..core.incremental import IncrementalOptimizer
+from ..core.instancers import find_culled_instances
+from ..core.lights import find_culled_lights
+from ..core.rules import HIDE, SHOW, FilterRule, compile_rules
+from ..core.settings import OptimizerSettings
+from ..core.traversal import get_base_prim
+from .kit import KitStandIns
+from .stages import SCENE_BUILDERS, build_flat_stage, build_scene
+
+# Version of the JSON written by the suite, bumped when a field changes meaning.
+RESULTS_FORMAT = 1
+
+# The phases of an optimize pass, in the order they run, then the updates of live culling while the camera moves.
+# uncached_bounds and per_prim_hide time the per-prim approaches the batched phases replaced, for comparison.
+PHASES = (
+    "traversal", "snapshot", "uncached_bounds", "bounds", "world_bounds", "culling", "lights", "instances", "rules",
+    "hide", "undo", "per_prim_hide", "delete", "deactivate", "update", "camera_move",
+)
+
+# Numbers of prims hidden and restored by the authoring benchmark when --authoring-counts is given without values.
+AUTHORING_COUNTS = (10000, 100000, 1000000)
+
+# Rules on every field that is cheap to read, so the filter matching is measured with a realistic mix.
+BENCHMARK_RULES = (
+    FilterRule(SHOW, "name", r"Cube_1\d*$"),
+    FilterRule(HIDE, "type", "Sphere"),
+    FilterRule(SHOW, "kind", "component"),
+    FilterRule(HIDE, "purpose", "proxy"),
+    FilterRule(SHOW, "path", "/World/Camera"),
+)
+
+# Irradiance the influence of the lights ends at, so the default sphere lights of the stages reach a few units.
+BENCHMARK_LIGHT_CUTOFF = 0.01
+
+# Number of small moves of the camera the incremental updates are timed on, and the distance of every move.
+CAMERA_MOVES = 10
+CAMERA_MOVE_DISTANCE = 1.0
+
+# Timings below this are noise, they are never reported as regressions.
+MIN_COMPARED_SECONDS = 0.005
+
+
+class PhaseTimer:
+    """
+    Times the phases of a benchmark, every phase keeps its fastest run
+
+    Args:
+        repeat (int): Number of runs of every phase.
+    """
+
+    def __init__(self, repeat=1):
+        self.repeat = max(1, repeat)
+        self.timings = {}
+
+    def measure(self, phase, fn):
+        """
+        It runs fn repeat times and keeps its fastest time under the name of the phase
+
+        :param phase: Name of the phase
+        :param fn: The function to time, called without arguments
+        :return: What the last run of fn returned.
+        """
+        result = None
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            result = fn()
+            self.record(phase, time.perf_counter() - start)
+        return result
+
+    def record(self, phase, elapsed):
+        """
+        It keeps the time of a run of the phase if it is the fastest one
+
+        :param phase: Name of the phase
+        :param elapsed: Time of the run in seconds
+        """
+        self.timings[phase] = min(self.timings.get(phase, elapsed), elapsed)
+
+
+def compute_bounds_per_prim(prims):
+    """
+    It computes the world bound of every prim with its own BBoxCache, the way get_prim_size did before the bounds of
+    a pass were cached, so nothing computed for an ancestor is reused for its descendants
+
+    :param prims: A list of Usd.Prim
+    """
+    for prim in prims:
+        bbox_cache = UsdGeom.BBoxCache(Usd.TimeCode.Default(), includedPurposes=[UsdGeom.Tokens.default_])
+        bbox_cache.ComputeWorldBound(prim).ComputeAlignedRange().GetSize()
+
+
+def run_shape(shape, count, repeat, stand_ins):
+    """
+    It builds a stage of the given shape and times every phase of an optimize pass on it
+
+    Traversal and bounds go through CameraViewOptimizer.get_all_children_of_prim and get_prim_size, the snapshot the
+    window lists the objects from is taken with IncrementalOptimizer.refresh, and the hidden prims are written and
+    undone through HideSelectedPrimsCommand, then deleted and deactivated through the commands of Delete hidden, the
+    way the window does it. Last, the camera is moved a little at a time and the incremental optimizer of live
+    culling updates the result after every move.
+
+    :param shape: One of SCENE_BUILDERS
+    :param count: Number of prims of the stage
+    :param repeat: Number of runs of every phase, the fastest one is kept
+    :param stand_ins: KitStandIns the commands run with
+    :return: A dict with the prim count, the hidden count, the memory of the snapshot in bytes, the average number of
+        prims tested again after a camera move, how many times faster the bounds of all prims are computed at once
+        than one BBoxCache per prim, and the timing of every phase in seconds.
+    """
+    # The extension can only be imported once the stand-ins of Kit are installed.
+    extension = importlib.import_module("..ext.extension", __package__)
+    stage, camera_path = build_scene(shape, count)
+    stand_ins.stage = stage
+    optimizer = extension.CameraViewOptimizer()
+    settings = OptimizerSettings(
+        focal_length=20.0, max_distance=3000.0, rules=BENCHMARK_RULES, light_cutoff=BENCHMARK_LIGHT_CUTOFF
+    )
+    timer = PhaseTimer(repeat)
+
+    prims = timer.measure("traversal", lambda: optimizer.get_all_children_of_prim(get_base_prim(stage, "")))
+
+    def take_snapshot():
+        snapshot = IncrementalOptimizer(stage)
+        snapshot.refresh(get_base_prim(stage, ""))
+        snapshot.revoke()
+        return snapshot.get_stats()
+
+    snapshot_stats = timer.measure("snapshot", take_snapshot)
+
+    def compute_sizes():
+        scene_bounds = SceneBounds()
+        for prim in prims:
+            optimizer.get_prim_size(prim, scene_bounds)
+
+    timer.measure("uncached_bounds", lambda: compute_bounds_per_prim(prims))
+    timer.measure("bounds", compute_sizes)
+    # The bounds of all prims at once, the way the culling computes them.
+    timer.measure("world_bounds", lambda: SceneBounds().compute_world_bounds(prims))
+    hidden_paths = timer.measure("culling", lambda: find_hidden_paths(stage, [camera_path], settings))
+    timer.measure("lights", lambda: find_culled_lights(stage, [camera_path], settings, hidden_paths))
+    timer.measure("instances", lambda: find_culled_instances(stage, [camera_path], settings, hidden_paths))
+
+    def match_rules():
+        rules = compile_rules(settings)
+        for prim in prims:
+            rules.evaluate(prim)
+
+    timer.measure("rules", match_rules)
+    selected_paths = [path.pathString for path in hidden_paths]
+    # Every hide is undone before the next run, so all runs start from the same stage.
+    for _ in range(timer.repeat):
+        start = time.perf_counter()
+        stand_ins.execute("HideSelectedPrimsCommand", selected_paths=selected_paths)
+        timer.record("hide", time.perf_counter() - start)
+        start = time.perf_counter()
+        stand_ins.undo()
+        timer.record("undo", time.perf_counter() - start)
+    # Delete hidden runs on the same prims, in both of its modes, and is undone the same way.
+    delete_commands = (("delete", "DeleteSelectedPrimsCommand"), ("deactivate", "DeactivateSelectedPrimsCommand"))
+    for phase, command_name in delete_commands:
+        for _ in range(timer.repeat):
+            start = time.perf_counter()
+            stand_ins.execute(command_name, selected_paths=selected_paths)
+            timer.record(phase, time.perf_counter() - start)
+            stand_ins.undo()
+
+    translate_op = UsdGeom.Xformable(stage.GetPrimAtPath(camera_path)).AddTranslateOp()
+    retested = 0
+    for _ in range(timer.repeat):
+        translate_op.Set(Gf.Vec3d(0.0, 0.0, 0.0))
+        live_optimizer = IncrementalOptimizer(stage)
+        start = time.perf_counter()
+        live_optimizer.update([camera_path], settings)
+        timer.record("update", time.perf_counter() - start)
+        retested = 0
+        start = time.perf_counter()
+        for move in range(1, CAMERA_MOVES + 1):
+            translate_op.Set(Gf.Vec3d(move * CAMERA_MOVE_DISTANCE, 0.0, 0.0))
+            live_optimizer.update([camera_path], settings)
+            retested += live_optimizer.retested_count
+        timer.record("camera_move", (time.perf_counter() - start) / CAMERA_MOVES)
+        live_optimizer.revoke()
+    return {
+        "prims": len(prims),
+        "hidden": len(hidden_paths),
+        "snapshot_bytes": snapshot_stats["bytes"],
+        "retested": retested / CAMERA_MOVES,
+        "bounds_speedup": timer.timings["uncached_bounds"] / max(timer.timings["world_bounds"], 1e-9),
+        "phases": timer.timings,
+    }
+
+
+def run_authoring(count, repeat, legacy_limit):
+    """
+    It times hiding count prims in one batch and restoring them, the way the hide command and its undo do, and
+    hiding them with one MakeInvisible() call per prim if count is within legacy_limit
+
+    :param count: Number of prims to hide
+    :param repeat: Number of runs of every phase, the fastest one is kept
+    :param legacy_limit: Largest count the per-prim approach is timed for
+    :return: A dict with the prim count and the timing of every phase in seconds.
+    """
+    stage, paths = build_flat_stage(count)
+    timer = PhaseTimer(repeat)
+    for _ in range(timer.repeat):
+        start = time.perf_counter()
+        undo_state = set_visibility_opinions(stage, paths, UsdGeom.Tokens.invisible)
+        timer.record("hide", time.perf_counter() - start)
+        start = time.perf_counter()
+        restore_visibility_opinions(paths, undo_state)
+        timer.record("undo", time.perf_counter() - start)
+    if count <= legacy_limit:
+        for _ in range(timer.repeat):
+            start = time.perf_counter()
+            for path in paths:
+                UsdGeom.Imageable(stage.GetPrimAtPath(path)).MakeInvisible()
+            timer.record("per_prim_hide", time.perf_counter() - start)
+            clear_visibility_opinions(stage, paths)
+    return {"prims": count, "phases": timer.timings}
+
+
+def run_suite(shapes, count, repeat=3, authoring_counts=(), legacy_limit=100000):
+    """
+    It runs the benchmarks of every shape headless and returns the results as a JSON serializable dict
+
+    :param shapes: Names of the shapes of SCENE_BUILDERS
+    :param count: Number of prims of every stage
+    :param repeat: Number of runs of every phase, the fastest one is kept
+    :param authoring_counts: Numbers of prims the authoring benchmark hides and restores, their results are named
+        authoring_<count>
+    :param legacy_limit: Largest count of the authoring benchmark the per-prim MakeInvisible() is timed for
+    :return: A dict with the environment, the parameters and the results of every shape.
+    """
+    stand_ins = KitStandIns()
+    if not stand_ins.install():
+        raise RuntimeError("the benchmark suite runs headless, run it with Python instead of Kit")
+    # Importing the commands registers them, like Kit does for the modules of the extension.
+    importlib.import_module("..ext.commands.usd_commands", __package__)
+    results = {shape: run_shape(shape, count, repeat, stand_ins) for shape in shapes}
+    for authoring_count in authoring_counts:
+        results[f"authoring_{authoring_count}"] = run_authoring(authoring_count, repeat, legacy_limit)
+    return {
+        "format": RESULTS_FORMAT,
+        "environment": {
+            "python": platform.python_version(),
+            "usd": ".".join(str(part) for part in Usd.GetVersion()),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "count": count,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    It compares the timings of two runs of the suite, phase by phase
+
+    :param results: The results of run_suite
+    :param baseline: The results of an earlier run, usually read from a file
+    :param tolerance: How much slower than the baseline a phase may be before it is a regression, 0.2 is 20%
+    :return: A list of dicts with the shape, the phase, both timings, their ratio and whether it regressed, for the
+        phases present in both runs.
+    """
+    comparison = []
+    for shape, result in results["results"].items():
+        baseline_phases = baseline.get("results", {}).get(shape, {}).get("phases", {})
+        for phase, current in result["phases"].items():
+            previous = baseline_phases.get(phase)
+            if previous is None:
+                continue
+            # JSON has no infinity, a phase that took no time before has no ratio.
+            ratio = current / previous if previous > 0 else None
+            comparison.append({
+                "shape": shape,
+                "phase": phase,
+                "baseline": previous,
+                "current": current,
+                "ratio": ratio,
+                "regressed": current - previous > MIN_COMPARED_SECONDS and (ratio is None or ratio > 1.0 + tolerance),
+            })
+    return comparison
+
+
+def format_results(results, comparison=None):
+    """
+    It formats the results as a table, one line per shape and phase
+
+    :param results: The results of run_suite
+    :param comparison: The comparison of compare_results, adds the baseline columns
+    :return: The table as a string.
+    """
+    compared = {(item["shape"], item["phase"]): item for item in comparison or ()}
+    lines = [f"{'shape':>17} {'prims':>9} {'phase':>15} {'time (s)':>10} {'baseline (s)':>13} {'ratio':>7}"]
+    for shape, result in results["results"].items():
+        for phase in PHASES:
+            if phase not in result["phases"]:
+                continue
+            line = f"{shape:>17} {result['prims']:>9} {phase:>15} {result['phases'][phase]:>10.4f}"
+            item = compared.get((shape, phase))
+            if item is not None:
+                ratio = f"{item['ratio']:.2f}x" if item["ratio"] is not None else "-"
+                line += f" {item['baseline']:>13.4f} {ratio:>7}"
+                if item["regressed"]:
+                    line += " REGRESSED"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time every phase of an optimize pass on synthetic stages, headless, and compare to a baseline."
+    )
+    parser.add_argument("--shapes", nargs="+", choices=list(SCENE_BUILDERS), default=list(SCENE_BUILDERS))
+    parser.add_argument("--count", type=int, default=100000, help="Prims of every stage")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every phase, the fastest one is kept")
+    parser.add_argument(
+        "--authoring-counts",
+        type=int,
+        nargs="*",
+        help="Also time hiding and restoring this many prims in one batch, 10000, 100000 and 1000000 if no value "
+        "is given",
+    )
+    parser.add_argument(
+        "--legacy-limit",
+        type=int,
+        default=100000,
+        help="Largest authoring count hiding one prim at a time with MakeInvisible is timed for",
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file instead of the standard output")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare to")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="How much slower than the baseline a phase may be, 0.2 is 20%%",
+    )
+    args = parser.parse_args()
+
+    try:
+        authoring_counts = args.authoring_counts
+        if authoring_counts is not None and not authoring_counts:
+            authoring_counts = AUTHORING_COUNTS
+        results = run_suite(args.shapes, args.count, args.repeat, authoring_counts or (), args.legacy_limit)
+    except RuntimeError as error:
+        parser.error(str(error))
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            comparison = compare_results(results, json.load(baseline_file), args.tolerance)
+        results["comparison"] = comparison
+
+    # The table goes to the standard error, so the standard output only holds the JSON.
+    print(format_results(results, comparison), file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if comparison and any(item["regressed"] for item in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
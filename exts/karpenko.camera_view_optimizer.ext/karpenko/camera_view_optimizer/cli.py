@@ -0,0 +1,543 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pxr import Sdf, Usd, UsdGeom
+
+from .core.authoring import set_invisible_ids_opinions, set_visibility_opinions
+from .core.culling import find_hidden_paths
+from .core.instancers import find_culled_instances
+from .core.layers import get_or_create_optimization_layer
+from .core.lights import find_culled_lights
+from .core.payloads import find_culled_payloads, get_unload_rules, plan_payload_loading
+from .core.report import OptimizationReport
+from .core.rules import FilterRule, load_filter_rules
+from .core.settings import OptimizerSettings
+from .core.sharding import (filter_shard_paths, find_shard_roots, get_shard_split_paths, open_masked_stage,
+                            split_shards)
+
+USD_EXTENSIONS = (".usd", ".usda", ".usdc")
+
+# Stage metadata that only has an effect when it is authored on the root layer.
+ROOT_LAYER_METADATA = (
+    "defaultPrim",
+    "upAxis",
+    "metersPerUnit",
+    "startTimeCode",
+    "endTimeCode",
+    "timeCodesPerSecond",
+    "framesPerSecond",
+)
+
+
+def get_output_path(input_path, output_dir="", suffix=".optimized"):
+    """
+    It returns the path of the optimized file, next to the input file unless an output directory is given
+
+    :param input_path: Path of the source file
+    :param output_dir: Directory to write to
+    :param suffix: Text inserted before the file extension
+    :return: The output path.
+    """
+    directory, file_name = os.path.split(os.path.abspath(input_path))
+    name, extension = os.path.splitext(file_name)
+    return os.path.join(output_dir or directory, f"{name}{suffix}{extension}")
+
+
+def write_sublayer_output(stage, input_path, output_path, hidden_paths, invisible_ids=None):
+    """
+    It writes a new root layer that sublayers the source file and holds the visibility opinions
+
+    Opening the output file gives the optimized stage, the source file is not modified.
+
+    :param stage: The opened source Usd.Stage
+    :param input_path: Path of the source file
+    :param output_path: Path of the file to write
+    :param hidden_paths: Paths of the prims to hide
+    :param invisible_ids: Ids of the instances to hide, by point instancer path
+    """
+    source_layer = stage.GetRootLayer()
+    layer = Sdf.Layer.CreateNew(output_path)
+    relative_path = os.path.relpath(os.path.abspath(input_path), os.path.dirname(os.path.abspath(output_path)))
+    layer.subLayerPaths.append(relative_path.replace(os.sep, "/"))
+    for key in ROOT_LAYER_METADATA:
+        if source_layer.pseudoRoot.HasInfo(key):
+            layer.pseudoRoot.SetInfo(key, source_layer.pseudoRoot.GetInfo(key))
+    set_visibility_opinions(layer, hidden_paths, UsdGeom.Tokens.invisible)
+    if invisible_ids:
+        set_invisible_ids_opinions(layer, invisible_ids)
+    layer.Save()
+
+
+def write_flattened_output(stage, output_path, hidden_paths, invisible_ids=None):
+    """
+    It writes the whole optimized stage flattened into a single file, payloads that are not loaded are left out
+
+    :param stage: The opened source Usd.Stage
+    :param output_path: Path of the file to write
+    :param hidden_paths: Paths of the prims to hide
+    :param invisible_ids: Ids of the instances to hide, by point instancer path
+    """
+    optimization_layer = get_or_create_optimization_layer(stage)
+    set_visibility_opinions(optimization_layer, hidden_paths, UsdGeom.Tokens.invisible)
+    if invisible_ids:
+        set_invisible_ids_opinions(optimization_layer, invisible_ids)
+    stage.Export(output_path)
+
+
+def optimize_file(
+    input_path,
+    output_path,
+    camera_paths,
+    settings,
+    flatten=False,
+    unload_payloads=False,
+    plan_payloads=False,
+    cull_instances=False,
+    report=False,
+):
+    """
+    It opens a file with plain pxr, optimizes it and writes the result, it runs in a worker process
+
+    :param input_path: Path of the source file
+    :param output_path: Path of the file to write
+    :param camera_paths: Paths of the cameras to scan from
+    :param settings: OptimizerSettings of the pass
+    :param flatten: Write a flattened file instead of a sublayer
+    :param unload_payloads: Unload the payloads that only bring in hidden prims, only has an effect on the
+        flattened file
+    :param plan_payloads: Open the stage without payloads and load only the ones that can be visible
+    :param cull_instances: Hide the instances of point instancers one by one
+    :param report: Add the OptimizationReport of the pass to the result, as "report"
+    :return: A dict with the result, "error" is set if the file could not be optimized.
+    """
+    result = {
+        "input": input_path,
+        "output": output_path,
+        "hidden": 0,
+        "loaded_payloads": [],
+        "unloaded_payloads": [],
+        "culled_instances": 0,
+        "culled_lights": 0,
+        "seconds": 0.0,
+        "error": None,
+    }
+    start = time.perf_counter()
+    optimization_report = OptimizationReport()
+    try:
+        stage = Usd.Stage.Open(input_path, Usd.Stage.LoadNone if plan_payloads else Usd.Stage.LoadAll)
+        if not stage:
+            raise RuntimeError("the file could not be opened")
+        existing_cameras = [
+            path for path in camera_paths
+            if stage.GetPrimAtPath(path) and stage.GetPrimAtPath(path).IsA(UsdGeom.Camera)
+        ]
+        if not existing_cameras:
+            raise RuntimeError(f"none of the cameras exist: {', '.join(camera_paths)}")
+        if plan_payloads:
+            with optimization_report.measure("payloads"):
+                loaded_paths, _ = plan_payload_loading(stage, existing_cameras, settings)
+            result["loaded_payloads"] = [path.pathString for path in loaded_paths]
+        hidden_paths = find_hidden_paths(stage, existing_cameras, settings, report=optimization_report)
+        if settings.light_cutoff > 0:
+            with optimization_report.measure("lights"):
+                light_paths = find_culled_lights(stage, existing_cameras, settings, hidden_paths)
+            hidden_paths.extend(light_paths)
+            result["culled_lights"] = len(light_paths)
+        invisible_ids = {}
+        if cull_instances:
+            with optimization_report.measure("instances"):
+                invisible_ids = find_culled_instances(stage, existing_cameras, settings, hidden_paths)
+            result["culled_instances"] = sum(len(ids) for ids in invisible_ids.values())
+        if unload_payloads:
+            with optimization_report.measure("payloads"):
+                payload_paths = find_culled_payloads(stage, hidden_paths)
+                stage.SetLoadRules(get_unload_rules(stage, payload_paths))
+            result["unloaded_payloads"] = [path.pathString for path in payload_paths]
+        with optimization_report.measure("authoring", len(hidden_paths)):
+            if flatten:
+                write_flattened_output(stage, output_path, hidden_paths, invisible_ids)
+            else:
+                write_sublayer_output(stage, input_path, output_path, hidden_paths, invisible_ids)
+        result["hidden"] = len(hidden_paths)
+    except Exception as error:  # reported per file, so one broken file doesn't stop the whole batch
+        result["error"] = str(error)
+    result["seconds"] = time.perf_counter() - start
+    if report:
+        optimization_report.finish()
+        result["report"] = optimization_report.to_dict()
+    return result
+
+
+def optimize_shard(
+    input_path,
+    root_paths,
+    split_paths,
+    camera_paths,
+    settings,
+    unload_payloads=False,
+    plan_payloads=False,
+    cull_instances=False,
+):
+    """
+    It culls one shard of a file, it runs in a worker process
+
+    The file is opened with a population mask of the roots of the shard and the cameras, so the worker only holds
+    its own subtrees, and every worker evaluates the same cameras. Only paths are sent back, the parent process
+    writes them all at once.
+
+    :param input_path: Path of the source file
+    :param root_paths: Paths of the roots of the shard
+    :param split_paths: Paths of the prims above the roots whose children are split into several shards
+    :param camera_paths: Paths of the cameras to scan from
+    :param settings: OptimizerSettings of the pass
+    :param unload_payloads: Find the payloads of the shard that only bring in hidden prims
+    :param plan_payloads: Open the shard without payloads and load only the ones that can be visible
+    :param cull_instances: Hide the instances of point instancers one by one
+    :return: A dict with the hidden paths, the invisible ids by instancer path, the loaded and unloaded payload
+        paths and the report of the shard, all as strings and lists, "error" is set if the shard failed.
+    """
+    result = {
+        "hidden": [],
+        "culled_lights": 0,
+        "invisible_ids": {},
+        "loaded_payloads": [],
+        "unloaded_payloads": [],
+        "report": None,
+        "error": None,
+    }
+    optimization_report = OptimizationReport()
+    try:
+        load = Usd.Stage.LoadNone if plan_payloads else Usd.Stage.LoadAll
+        stage = open_masked_stage(input_path, list(root_paths) + list(camera_paths), load)
+        if not stage:
+            raise RuntimeError("the file could not be opened")
+        existing_cameras = [
+            path for path in camera_paths
+            if stage.GetPrimAtPath(path) and stage.GetPrimAtPath(path).IsA(UsdGeom.Camera)
+        ]
+        if not existing_cameras:
+            raise RuntimeError(f"none of the cameras exist: {', '.join(camera_paths)}")
+        roots = [Sdf.Path(path) for path in root_paths]
+        split_paths = [Sdf.Path(path) for path in split_paths]
+        if plan_payloads:
+            with optimization_report.measure("payloads"):
+                loaded_paths, _ = plan_payload_loading(stage, existing_cameras, settings, split_paths=split_paths)
+            result["loaded_payloads"] = [path.pathString for path in loaded_paths]
+        hidden_paths = filter_shard_paths(
+            find_hidden_paths(stage, existing_cameras, settings, report=optimization_report, split_paths=split_paths),
+            roots,
+        )
+        if settings.light_cutoff > 0:
+            with optimization_report.measure("lights"):
+                # The geometry of the other shards is not populated, so only the views are checked.
+                light_paths = filter_shard_paths(
+                    find_culled_lights(stage, existing_cameras, settings, hidden_paths, check_geometry=False), roots
+                )
+            hidden_paths.extend(light_paths)
+            result["culled_lights"] = len(light_paths)
+        result["hidden"] = [path.pathString for path in hidden_paths]
+        if cull_instances:
+            with optimization_report.measure("instances"):
+                invisible_ids = find_culled_instances(stage, existing_cameras, settings, hidden_paths)
+            result["invisible_ids"] = {
+                path.pathString: invisible_ids[path].tolist() for path in filter_shard_paths(invisible_ids, roots)
+            }
+        if unload_payloads:
+            with optimization_report.measure("payloads"):
+                # Payloads above the roots also bring in the subtrees of other shards.
+                payload_paths = filter_shard_paths(find_culled_payloads(stage, hidden_paths), roots)
+            result["unloaded_payloads"] = [path.pathString for path in payload_paths]
+    except Exception as error:  # reported with the file, so one broken shard doesn't stop the whole batch
+        result["error"] = str(error)
+    optimization_report.finish()
+    result["report"] = optimization_report.to_dict()
+    return result
+
+
+def optimize_file_sharded(
+    executor,
+    input_path,
+    output_path,
+    camera_paths,
+    settings,
+    shard_count,
+    flatten=False,
+    unload_payloads=False,
+    plan_payloads=False,
+    cull_instances=False,
+    report=False,
+):
+    """
+    It optimizes a single file in several worker processes, each one culls a shard of the subtree under the base
+    prim, and writes the merged result once
+
+    The shards are found with find_shard_roots, without composing the whole stage. The flattened output is the only
+    step that opens the whole stage in this process.
+
+    :param executor: ProcessPoolExecutor the shards are culled in
+    :param input_path: Path of the source file
+    :param output_path: Path of the file to write
+    :param camera_paths: Paths of the cameras to scan from
+    :param settings: OptimizerSettings of the pass
+    :param shard_count: Number of shards to split the stage into
+    :param flatten: Write a flattened file instead of a sublayer
+    :param unload_payloads: Unload the payloads that only bring in hidden prims, only has an effect on the
+        flattened file
+    :param plan_payloads: Open the stage without payloads and load only the ones that can be visible
+    :param cull_instances: Hide the instances of point instancers one by one
+    :param report: Add the OptimizationReport of the pass to the result, as "report"
+    :return: A dict with the result, like optimize_file(), with the number of shards as "shards".
+    """
+    result = {
+        "input": input_path,
+        "output": output_path,
+        "hidden": 0,
+        "loaded_payloads": [],
+        "unloaded_payloads": [],
+        "culled_instances": 0,
+        "culled_lights": 0,
+        "shards": 0,
+        "seconds": 0.0,
+        "error": None,
+    }
+    start = time.perf_counter()
+    optimization_report = OptimizationReport()
+    try:
+        with optimization_report.measure("sharding"):
+            base_path, root_paths, split_paths = find_shard_roots(input_path, settings.base_path, shard_count)
+            if base_path is None:
+                raise RuntimeError("the file could not be opened or has no default prim")
+            shards = split_shards(root_paths, shard_count)
+        result["shards"] = len(shards)
+        futures = [
+            executor.submit(
+                optimize_shard,
+                input_path,
+                [path.pathString for path in shard],
+                [path.pathString for path in get_shard_split_paths(shard, split_paths)],
+                camera_paths,
+                settings,
+                unload_payloads,
+                plan_payloads,
+                cull_instances,
+            )
+            for shard in shards
+        ]
+        hidden_paths = []
+        invisible_ids = {}
+        loaded_paths = []
+        payload_paths = []
+        errors = []
+        for future in futures:
+            shard_result = future.result()
+            if shard_result["error"] is not None:
+                errors.append(shard_result["error"])
+            hidden_paths.extend(Sdf.Path(path) for path in shard_result["hidden"])
+            result["culled_lights"] += shard_result["culled_lights"]
+            invisible_ids.update(shard_result["invisible_ids"])
+            loaded_paths.extend(Sdf.Path(path) for path in shard_result["loaded_payloads"])
+            payload_paths.extend(Sdf.Path(path) for path in shard_result["unloaded_payloads"])
+            optimization_report.merge(shard_result["report"])
+        if errors:
+            raise RuntimeError(errors[0])
+        hidden_paths.sort()
+        # Payloads above the roots, like the ones of the cameras, may be loaded by several shards.
+        loaded_paths = sorted(set(loaded_paths))
+
+        with optimization_report.measure("authoring", len(hidden_paths)):
+            if flatten:
+                stage = Usd.Stage.Open(input_path, Usd.Stage.LoadNone)
+                rules = Usd.StageLoadRules.LoadAll()
+                if plan_payloads:
+                    rules = Usd.StageLoadRules.LoadNone()
+                    for path in loaded_paths:
+                        rules.AddRule(path, Usd.StageLoadRules.OnlyRule)
+                for path in payload_paths:
+                    rules.AddRule(path, Usd.StageLoadRules.NoneRule)
+                stage.SetLoadRules(rules)
+                write_flattened_output(stage, output_path, hidden_paths, invisible_ids)
+            else:
+                # Only the root layer is needed to write the sublayer, an empty mask populates no prim.
+                stage = open_masked_stage(input_path, [], Usd.Stage.LoadNone)
+                write_sublayer_output(stage, input_path, output_path, hidden_paths, invisible_ids)
+        result["hidden"] = len(hidden_paths)
+        result["loaded_payloads"] = [path.pathString for path in loaded_paths]
+        result["unloaded_payloads"] = [path.pathString for path in payload_paths]
+        result["culled_instances"] = sum(len(ids) for ids in invisible_ids.values())
+    except Exception as error:  # reported per file, so one broken file doesn't stop the whole batch
+        result["error"] = str(error)
+    result["seconds"] = time.perf_counter() - start
+    if report:
+        optimization_report.finish()
+        result["report"] = optimization_report.to_dict()
+    return result
+
+
+def collect_input_files(paths, suffix=".optimized"):
+    """
+    It expands the directories in paths to the USD files they contain
+
+    Files of the directories whose name ends with the suffix are skipped, they are the outputs of an earlier run.
+
+    :param paths: Files and directories
+    :param suffix: Text the output file names have before their extension
+    :return: A sorted list of file paths.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, file_names in os.walk(path):
+                files.extend(
+                    os.path.join(directory, file_name)
+                    for file_name in file_names
+                    if file_name.lower().endswith(USD_EXTENSIONS)
+                    and not (suffix and os.path.splitext(file_name)[0].endswith(suffix))
+                )
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m karpenko.camera_view_optimizer.cli",
+        description="Hide objects that are not visible from the cameras in USD files, without Kit.",
+    )
+    parser.add_argument("inputs", nargs="+", help="USD files (.usd, .usda, .usdc) or directories containing them")
+    parser.add_argument("--camera", dest="cameras", action="append", required=True,
+                        help="Path of a camera prim, can be used several times")
+    parser.add_argument("--focal-length", type=float, default=4.0, help="Scan focal length (mm)")
+    parser.add_argument("--max-size", type=float, default=150.0,
+                        help="Objects bigger than this in any dimension are never hidden, 0 to disable")
+    parser.add_argument("--max-distance", type=float, default=10000.0,
+                        help="Objects further from the camera are hidden")
+    parser.add_argument("--min-pixel-coverage", type=float, default=0.0,
+                        help="Objects that would cover fewer pixels than this on the render are hidden, 0 to disable")
+    parser.add_argument("--resolution", type=int, nargs=2, default=(1920, 1080), metavar=("WIDTH", "HEIGHT"),
+                        help="Resolution of the render the pixel coverage is measured on")
+    parser.add_argument("--ignore-size-distant-objects", action="store_true",
+                        help="Hide distant objects no matter their size")
+    parser.add_argument("--hide-pattern", default="", help="Hide objects whose name contains or matches this regex")
+    parser.add_argument("--show-pattern", default="", help="Never hide objects whose name contains or matches this")
+    parser.add_argument("--rule", dest="rules", nargs=3, action="append", default=[],
+                        metavar=("ACTION", "FIELD", "PATTERN"),
+                        help="Show or hide objects whose name, path, type, kind, purpose or attribute:<name> contains "
+                             "or matches the pattern, can be used several times, the first matching rule wins")
+    parser.add_argument("--rules-file", default="",
+                        help="JSON file with a list of rules, checked after the --rule rules")
+    parser.add_argument("--process-lights", action="store_true", help="Hide lights like any other object")
+    parser.add_argument("--light-cutoff", type=float, default=0.0,
+                        help="Hide lights whose influence, which ends where their intensity falls below this, can't "
+                             "reach anything visible, instead of deciding by their position, 0 to disable")
+    parser.add_argument("--base-path", default="", help="Prim to search for objects under, the default prim if empty")
+    parser.add_argument("--occlusion-culling", action="store_true",
+                        help="Also hide objects behind objects bigger than the max size")
+    parser.add_argument("--time-range", type=float, nargs=2, metavar=("START", "END"),
+                        help="Scan the cameras between these time codes")
+    parser.add_argument("--time-stride", type=float, default=1.0, help="Time codes between two scanned poses")
+    parser.add_argument("--swept-time-range", type=float, nargs=2, metavar=("START", "END"),
+                        help="Sweep the bounds of animated objects over these time codes, sampled with the time stride")
+    parser.add_argument("--flatten", action="store_true",
+                        help="Write a flattened file instead of a layer that sublayers the source file")
+    parser.add_argument("--unload-payloads", action="store_true",
+                        help="Unload the payloads that only bring in hidden objects, they are left out of the "
+                             "flattened file")
+    parser.add_argument("--plan-payloads", action="store_true",
+                        help="Open the files without payloads and load only the ones that can be visible, using the "
+                             "extents hints of the models")
+    parser.add_argument("--cull-instances", action="store_true",
+                        help="Hide the instances of point instancers one by one with their invisible ids")
+    parser.add_argument("--report", action="store_true",
+                        help="Add the time of every phase, the decisions by reason and the peak memory to the result")
+    parser.add_argument("--output-dir", default="", help="Directory to write to, next to the source files if empty")
+    parser.add_argument("--suffix", default=".optimized", help="Text added to the output file names")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="Split every file into this many shards under the base prim, culled in parallel by the "
+                             "worker processes with population masks, 0 to optimize every file in one process")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        rules = [FilterRule.parse(*words) for words in args.rules]
+        if args.rules_file:
+            rules.extend(load_filter_rules(args.rules_file))
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        parser.error(f"invalid rules: {error}")
+    settings = OptimizerSettings(
+        focal_length=args.focal_length,
+        max_size=args.max_size,
+        max_distance=args.max_distance,
+        ignore_size_distant_objects=args.ignore_size_distant_objects,
+        hide_pattern=args.hide_pattern,
+        show_pattern=args.show_pattern,
+        process_lights=args.process_lights,
+        light_cutoff=args.light_cutoff,
+        base_path=args.base_path,
+        occlusion_culling=args.occlusion_culling,
+        time_range=tuple(args.time_range) if args.time_range else None,
+        time_stride=args.time_stride,
+        swept_time_range=tuple(args.swept_time_range) if args.swept_time_range else None,
+        rules=rules,
+        min_pixel_coverage=args.min_pixel_coverage,
+        resolution=tuple(args.resolution),
+    )
+    input_files = collect_input_files(args.inputs, args.suffix)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    if args.shards > 1:
+        # The files are optimized one after the other, the shards of a file in parallel with their own memory.
+        with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, args.shards))) as executor:
+            for input_file in input_files:
+                result = optimize_file_sharded(
+                    executor,
+                    input_file,
+                    get_output_path(input_file, args.output_dir, args.suffix),
+                    args.cameras,
+                    settings,
+                    args.shards,
+                    args.flatten,
+                    args.unload_payloads,
+                    args.plan_payloads,
+                    args.cull_instances,
+                    args.report,
+                )
+                failed += result["error"] is not None
+                print(json.dumps(result), flush=True)
+        return 1 if failed else 0
+
+    # One stage per worker process, so every file is optimized in parallel with its own memory.
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(input_files) or 1))) as executor:
+        futures = [
+            executor.submit(
+                optimize_file,
+                input_file,
+                get_output_path(input_file, args.output_dir, args.suffix),
+                args.cameras,
+                settings,
+                args.flatten,
+                args.unload_payloads,
+                args.plan_payloads,
+                args.cull_instances,
+                args.report,
+            )
+            for input_file in input_files
+        ]
+        for future in futures:
+            result = future.result()
+            failed += result["error"] is not None
+            print(json.dumps(result), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+from .authoring import *
+from .bounds import *
+from .cache import *
+from .coverage import *
+from .culling import *
+from .frustum import *
+from .incremental import *
+from .instancers import *
+from .layers import *
+from .lights import *
+from .namespace import *
+from .occlusion import *
+from .payloads import *
+from .progress import *
+from .registry import *
+from .report import *
+from .rules import *
+from .settings import *
+from .sharding import *
+from .snapshot import *
+from .traversal import *
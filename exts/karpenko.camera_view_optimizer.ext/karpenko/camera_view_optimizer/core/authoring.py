@@ -0,0 +1,401 @@
+import numpy as np
+from pxr import Sdf, Usd, UsdGeom, Vt
+
+
+class VisibilityUndoState:
+    """
+    What is needed to revert a batch of visibility opinions, without a copy of the authored paths
+
+    Args:
+        edit_target (Usd.EditTarget): Where the opinions were authored.
+        prior_values (Dict[Sdf.Path, str]): Visibility values that were authored before, by spec path. Paths that
+            are not in the dict had no visibility value.
+        created_specs (List[Sdf.Path]): Top-most prim specs that were created to hold the opinions.
+    """
+
+    def __init__(self, edit_target, prior_values, created_specs):
+        self.edit_target = edit_target
+        self.prior_values = prior_values
+        self.created_specs = created_specs
+
+
+def get_edit_target(stage_or_edit_target):
+    """
+    It returns the edit target to author to, the current edit target for a stage
+
+    :param stage_or_edit_target: Usd.Stage, Usd.EditTarget or Sdf.Layer
+    :return: Usd.EditTarget
+    """
+    if isinstance(stage_or_edit_target, Usd.EditTarget):
+        return stage_or_edit_target
+    if isinstance(stage_or_edit_target, Sdf.Layer):
+        return Usd.EditTarget(stage_or_edit_target)
+    return stage_or_edit_target.GetEditTarget()
+
+
+def set_visibility_opinions(stage_or_edit_target, paths, visibility):
+    """
+    It writes the same visibility value for all paths directly to the layer, inside a single Sdf.ChangeBlock
+
+    Compared to UsdGeom.Imageable.MakeInvisible() or MakeVisible() per prim, the stage and every listener receive
+    only one change notification for the whole batch. Ancestors of the paths are not changed.
+
+    :param stage_or_edit_target: Usd.Stage (its current edit target is used), Usd.EditTarget or Sdf.Layer
+    :param paths: Prim paths
+    :param visibility: UsdGeom.Tokens.invisible or UsdGeom.Tokens.inherited
+    :return: VisibilityUndoState to pass to restore_visibility_opinions.
+    """
+    edit_target = get_edit_target(stage_or_edit_target)
+    layer = edit_target.GetLayer()
+    prior_values = {}
+    created_specs = []
+    seen_paths = set()
+    with Sdf.ChangeBlock():
+        for spec_path in _iter_spec_paths(edit_target, paths):
+            # A path listed twice would otherwise record the value of the batch as its prior value.
+            if spec_path in seen_paths:
+                continue
+            seen_paths.add(spec_path)
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if not prim_spec:
+                created_specs.append(_get_first_missing_spec_path(layer, spec_path))
+                prim_spec = Sdf.CreatePrimInLayer(layer, spec_path)
+            attr_spec = prim_spec.attributes.get(UsdGeom.Tokens.visibility)
+            if attr_spec is None:
+                attr_spec = Sdf.AttributeSpec(prim_spec, UsdGeom.Tokens.visibility, Sdf.ValueTypeNames.Token)
+            elif attr_spec.HasDefaultValue():
+                prior_values[spec_path] = attr_spec.default
+            attr_spec.default = visibility
+    return VisibilityUndoState(edit_target, prior_values, created_specs)
+
+
+def restore_visibility_opinions(paths, undo_state):
+    """
+    It reverts set_visibility_opinions for the same paths, inside a single Sdf.ChangeBlock
+
+    Visibility specs without any opinion left and prim specs that were created only for the batch are removed,
+    so the layer looks the same as before.
+
+    :param paths: The prim paths that were passed to set_visibility_opinions
+    :param undo_state: VisibilityUndoState returned by set_visibility_opinions
+    """
+    edit_target = undo_state.edit_target
+    layer = edit_target.GetLayer()
+    with Sdf.ChangeBlock():
+        for spec_path in _iter_spec_paths(edit_target, paths):
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if not prim_spec:
+                continue
+            attr_spec = prim_spec.attributes.get(UsdGeom.Tokens.visibility)
+            if attr_spec is None:
+                continue
+            if spec_path in undo_state.prior_values:
+                attr_spec.default = undo_state.prior_values[spec_path]
+                continue
+            attr_spec.ClearDefaultValue()
+            if not attr_spec.HasInfo("timeSamples") and not attr_spec.HasInfo("connectionPaths"):
+                prim_spec.RemoveProperty(attr_spec)
+
+        for spec_path in undo_state.created_specs:
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if prim_spec:
+                _remove_inert_specs(layer, prim_spec)
+
+
+def clear_visibility_opinions(stage_or_edit_target, paths):
+    """
+    It removes the visibility values of the paths from the layer, inside a single Sdf.ChangeBlock
+
+    Prim specs that hold no other opinion afterwards are removed too, with their ancestors that become empty. It is
+    meant for a layer that only the optimizer writes to, as there is nothing to undo.
+
+    :param stage_or_edit_target: Usd.Stage (its current edit target is used), Usd.EditTarget or Sdf.Layer
+    :param paths: Prim paths
+    """
+    edit_target = get_edit_target(stage_or_edit_target)
+    layer = edit_target.GetLayer()
+    with Sdf.ChangeBlock():
+        for spec_path in _iter_spec_paths(edit_target, paths):
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if not prim_spec:
+                continue
+            attr_spec = prim_spec.attributes.get(UsdGeom.Tokens.visibility)
+            if attr_spec is not None:
+                attr_spec.ClearDefaultValue()
+                if not attr_spec.HasInfo("timeSamples") and not attr_spec.HasInfo("connectionPaths"):
+                    prim_spec.RemoveProperty(attr_spec)
+            while prim_spec and not prim_spec.nameChildren and prim_spec.IsInert(False):
+                parent_spec = prim_spec.nameParent
+                siblings = parent_spec.nameChildren if parent_spec else layer.rootPrims
+                del siblings[prim_spec.name]
+                prim_spec = parent_spec
+
+
+def get_make_visible_paths(stage, paths):
+    """
+    It returns the visibility values UsdGeom.Imageable.MakeVisible() would author for the paths, so they can be
+    written in one batch with set_visibility_opinions
+
+    Like MakeVisible(), invisible ancestors of a path are made visible, and then every sibling along the way down from
+    the first of them is made invisible, so only the path shows up under it. Siblings that are on the way to another
+    of the paths are left alone.
+
+    :param stage: Usd.Stage
+    :param paths: Prim paths to make visible
+    :return: A tuple of two lists of Sdf.Path, the paths to make inherited, which include all the paths, and the
+        paths to make invisible.
+    """
+    paths = [path if isinstance(path, Sdf.Path) else Sdf.Path(path) for path in paths]
+    chain_paths = set()
+    for path in paths:
+        chain_paths.update(path.GetPrefixes())
+    predicate = Usd.PrimIsDefined & ~Usd.PrimIsAbstract
+    # Most paths share their ancestors, so the visibility of each one is only read once.
+    invisible_ancestors = {}
+    # Dicts keep the order of the paths and drop the duplicates.
+    shown_paths = {}
+    hidden_paths = {}
+    for path in paths:
+        prefixes = path.GetPrefixes()
+        has_invisible_ancestor = False
+        for parent_path, child_path in zip(prefixes, prefixes[1:]):
+            if parent_path not in invisible_ancestors:
+                parent = stage.GetPrimAtPath(parent_path)
+                invisible_ancestors[parent_path] = bool(parent) and _get_visibility(parent) == UsdGeom.Tokens.invisible
+            if invisible_ancestors[parent_path]:
+                shown_paths[parent_path] = None
+                has_invisible_ancestor = True
+            if not has_invisible_ancestor:
+                continue
+            parent = stage.GetPrimAtPath(parent_path)
+            if not parent:
+                break
+            for sibling in parent.GetFilteredChildren(predicate):
+                sibling_path = sibling.GetPath()
+                if (
+                    sibling_path != child_path
+                    and sibling_path not in chain_paths
+                    and _get_visibility(sibling) not in (None, UsdGeom.Tokens.invisible)
+                ):
+                    hidden_paths[sibling_path] = None
+        shown_paths[path] = None
+    return list(shown_paths), list(hidden_paths)
+
+
+class InvisibleIdsUndoState:
+    """
+    What is needed to revert a batch of invisible ids opinions of point instancers
+
+    Args:
+        edit_target (Usd.EditTarget): Where the opinions were authored.
+        paths (List[Sdf.Path]): Paths of the instancers.
+        prior_values (Dict[Sdf.Path, Vt.Int64Array]): Invisible ids that were authored before, by spec path. Paths
+            that are not in the dict had no invisible ids value.
+        created_specs (List[Sdf.Path]): Top-most prim specs that were created to hold the opinions.
+    """
+
+    def __init__(self, edit_target, paths, prior_values, created_specs):
+        self.edit_target = edit_target
+        self.paths = paths
+        self.prior_values = prior_values
+        self.created_specs = created_specs
+
+
+def set_invisible_ids_opinions(stage_or_edit_target, invisible_ids):
+    """
+    It writes the invisible ids of point instancers directly to the layer, one attribute value per instancer,
+    inside a single Sdf.ChangeBlock
+
+    :param stage_or_edit_target: Usd.Stage (its current edit target is used), Usd.EditTarget or Sdf.Layer
+    :param invisible_ids: A dict of instancer path to the ids of the instances to hide
+    :return: InvisibleIdsUndoState to pass to restore_invisible_ids_opinions.
+    """
+    edit_target = get_edit_target(stage_or_edit_target)
+    layer = edit_target.GetLayer()
+    paths = [Sdf.Path(path) for path in invisible_ids]
+    values = [Vt.Int64Array.FromNumpy(np.asarray(ids, dtype=np.int64)) for ids in invisible_ids.values()]
+    prior_values = {}
+    created_specs = []
+    seen_paths = set()
+    with Sdf.ChangeBlock():
+        for spec_path, value in zip(_iter_spec_paths(edit_target, paths), values):
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if not prim_spec:
+                created_specs.append(_get_first_missing_spec_path(layer, spec_path))
+                prim_spec = Sdf.CreatePrimInLayer(layer, spec_path)
+            attr_spec = prim_spec.attributes.get(UsdGeom.Tokens.invisibleIds)
+            if attr_spec is None:
+                attr_spec = Sdf.AttributeSpec(prim_spec, UsdGeom.Tokens.invisibleIds, Sdf.ValueTypeNames.Int64Array)
+            elif attr_spec.HasDefaultValue() and spec_path not in seen_paths:
+                # Only the first time, when two instancer paths map to the same spec, the last value is kept.
+                prior_values[spec_path] = attr_spec.default
+            seen_paths.add(spec_path)
+            attr_spec.default = value
+    return InvisibleIdsUndoState(edit_target, paths, prior_values, created_specs)
+
+
+def restore_invisible_ids_opinions(undo_state):
+    """
+    It reverts set_invisible_ids_opinions, inside a single Sdf.ChangeBlock
+
+    :param undo_state: InvisibleIdsUndoState returned by set_invisible_ids_opinions
+    """
+    edit_target = undo_state.edit_target
+    layer = edit_target.GetLayer()
+    with Sdf.ChangeBlock():
+        for spec_path in _iter_spec_paths(edit_target, undo_state.paths):
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            attr_spec = prim_spec.attributes.get(UsdGeom.Tokens.invisibleIds) if prim_spec else None
+            if attr_spec is None:
+                continue
+            if spec_path in undo_state.prior_values:
+                attr_spec.default = undo_state.prior_values[spec_path]
+                continue
+            attr_spec.ClearDefaultValue()
+            if not attr_spec.HasInfo("timeSamples"):
+                prim_spec.RemoveProperty(attr_spec)
+
+        for spec_path in undo_state.created_specs:
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if prim_spec:
+                _remove_inert_specs(layer, prim_spec)
+
+
+class ActiveUndoState:
+    """
+    What is needed to revert a batch of active opinions
+
+    Args:
+        edit_target (Usd.EditTarget): Where the opinions were authored.
+        prior_values (Dict[Sdf.Path, bool]): Active values that were authored before, by spec path. Paths that are
+            not in the dict had no active value.
+        created_specs (List[Sdf.Path]): Top-most prim specs that were created to hold the opinions.
+    """
+
+    def __init__(self, edit_target, prior_values, created_specs):
+        self.edit_target = edit_target
+        self.prior_values = prior_values
+        self.created_specs = created_specs
+
+
+def set_active_opinions(stage_or_edit_target, paths, active):
+    """
+    It writes the same active value for all paths directly to the layer, inside a single Sdf.ChangeBlock
+
+    A deactivated prim keeps its specs but is no longer composed with its descendants, which frees their memory
+    like deleting them, and activating it again brings everything back.
+
+    :param stage_or_edit_target: Usd.Stage (its current edit target is used), Usd.EditTarget or Sdf.Layer
+    :param paths: Prim paths
+    :param active: False to deactivate the prims
+    :return: ActiveUndoState to pass to restore_active_opinions.
+    """
+    edit_target = get_edit_target(stage_or_edit_target)
+    layer = edit_target.GetLayer()
+    prior_values = {}
+    created_specs = []
+    seen_paths = set()
+    with Sdf.ChangeBlock():
+        for spec_path in _iter_spec_paths(edit_target, paths):
+            # A path listed twice would otherwise record the value of the batch as its prior value.
+            if spec_path in seen_paths:
+                continue
+            seen_paths.add(spec_path)
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if not prim_spec:
+                created_specs.append(_get_first_missing_spec_path(layer, spec_path))
+                prim_spec = Sdf.CreatePrimInLayer(layer, spec_path)
+            elif prim_spec.HasInfo("active"):
+                prior_values[spec_path] = prim_spec.active
+            prim_spec.active = active
+    return ActiveUndoState(edit_target, prior_values, created_specs)
+
+
+def restore_active_opinions(paths, undo_state):
+    """
+    It reverts set_active_opinions for the same paths, inside a single Sdf.ChangeBlock
+
+    :param paths: The prim paths that were passed to set_active_opinions
+    :param undo_state: ActiveUndoState returned by set_active_opinions
+    """
+    edit_target = undo_state.edit_target
+    layer = edit_target.GetLayer()
+    with Sdf.ChangeBlock():
+        for spec_path in _iter_spec_paths(edit_target, paths):
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if not prim_spec:
+                continue
+            if spec_path in undo_state.prior_values:
+                prim_spec.active = undo_state.prior_values[spec_path]
+            else:
+                prim_spec.ClearInfo("active")
+
+        for spec_path in undo_state.created_specs:
+            prim_spec = layer.GetPrimAtPath(spec_path)
+            if prim_spec:
+                _remove_inert_specs(layer, prim_spec)
+
+
+def _iter_spec_paths(edit_target, paths):
+    """
+    It maps the prim paths to the paths of their specs in the layer of the edit target
+
+    :param edit_target: Usd.EditTarget
+    :param paths: Prim paths
+    :return: A generator of Sdf.Path
+    """
+    # Most edit targets are a plain layer, where the stage and the layer paths are the same.
+    if edit_target.GetMapFunction().isIdentity:
+        for path in paths:
+            yield path if isinstance(path, Sdf.Path) else Sdf.Path(path)
+    else:
+        for path in paths:
+            yield edit_target.MapToSpecPath(Sdf.Path(path))
+
+
+def _get_first_missing_spec_path(layer, spec_path):
+    """
+    It returns the top-most ancestor of the path (or the path itself) that has no prim spec in the layer
+
+    :param layer: Sdf.Layer
+    :param spec_path: Sdf.Path without a prim spec
+    :return: Sdf.Path
+    """
+    missing_path = spec_path
+    parent_path = spec_path.GetParentPath()
+    while parent_path != Sdf.Path.absoluteRootPath and not layer.GetPrimAtPath(parent_path):
+        missing_path = parent_path
+        parent_path = parent_path.GetParentPath()
+    return missing_path
+
+
+def _remove_inert_specs(layer, prim_spec):
+    """
+    It removes the prim spec and its descendants, bottom up, as long as they hold no opinions
+
+    :param layer: Sdf.Layer of the prim spec
+    :param prim_spec: Sdf.PrimSpec
+    """
+    stack = [(prim_spec, False)]
+    while stack:
+        spec, children_done = stack.pop()
+        if children_done:
+            if spec.IsInert(False):
+                siblings = spec.nameParent.nameChildren if spec.nameParent else layer.rootPrims
+                del siblings[spec.name]
+            continue
+        stack.append((spec, True))
+        stack.extend((child, False) for child in spec.nameChildren)
+
+
+def _get_visibility(prim):
+    """
+    It returns the visibility value of a prim, at the default time
+
+    :param prim: Usd.Prim
+    :return: UsdGeom.Tokens.inherited or UsdGeom.Tokens.invisible, None if the prim is not imageable.
+    """
+    imageable = UsdGeom.Imageable(prim)
+    if not imageable:
+        return None
+    return imageable.GetVisibilityAttr().Get() or UsdGeom.Tokens.inherited
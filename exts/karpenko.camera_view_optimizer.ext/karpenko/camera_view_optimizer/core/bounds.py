@@ -0,0 +1,304 @@
+import numpy as np
+from pxr import Usd, UsdGeom
+
+
+class SceneBounds:
+    """
+    Bounds and transforms of the stage, cached for a single optimize pass
+
+    One UsdGeom.BBoxCache and one UsdGeom.XformCache are shared by the size, distance and culling checks, so the
+    bounds of children and the transforms of ancestors are computed only once per pass.
+
+    With time codes, the bounds of animated prims are swept: they are the union of their bounds at every time code,
+    so a moving object is kept while any of its poses can be seen. Whether a prim is animated is found first from its
+    attributes, the ones of its descendants and the transforms of its ancestors, so the other prims only get their
+    bounds at the default time. A group with animated descendants gets the union of the bounds of its children, and
+    the other animated prims are computed a time code at a time for a whole batch, with a BBoxCache and an XformCache
+    kept for every time code, so every animated prim is computed once per time code.
+
+    Args:
+        time (Usd.TimeCode): The time code the bounds are computed at.
+        purposes (List[str]): Purposes included in the bounds, defaults to the default purpose only.
+        use_extents_hint (bool): Use the extents hints authored on models, which are the only bounds of payloads
+            that are not loaded.
+        time_codes (List[Usd.TimeCode]): Time codes the bounds of animated prims are swept over, none by default.
+    """
+
+    def __init__(self, time=Usd.TimeCode.Default(), purposes=None, use_extents_hint=False, time_codes=None):
+        self.time = time
+        self.purposes = purposes or [UsdGeom.Tokens.default_]
+        self.use_extents_hint = use_extents_hint
+        self.time_codes = list(time_codes or ())
+        self.bbox_cache = UsdGeom.BBoxCache(time, includedPurposes=self.purposes, useExtentsHint=use_extents_hint)
+        self.xform_cache = UsdGeom.XformCache(time)
+        self._time_caches = None
+        # The prims with time varying attributes in their subtree, and the prims whose world bound may change over
+        # time, None until the stage is checked.
+        self._varying_subtrees = None
+        self._varying_bounds = None
+        # Swept range of every animated prim that was computed, as two arrays, infinite if it is empty.
+        self._swept_ranges = {}
+
+    def clear(self):
+        """
+        It drops everything that was cached, should be called when the stage was edited during the pass
+        """
+        self.bbox_cache.Clear()
+        self.xform_cache.Clear()
+        self._time_caches = None
+        self._varying_subtrees = None
+        self._varying_bounds = None
+        self._swept_ranges.clear()
+
+    def get_world_transform(self, prim):
+        """
+        It returns the local to world transform of the prim
+
+        :param prim: Usd.Prim
+        :return: Gf.Matrix4d
+        """
+        return self.xform_cache.GetLocalToWorldTransform(prim)
+
+    def get_world_range(self, prim):
+        """
+        It returns the world space axis aligned range of the prim
+
+        :param prim: Usd.Prim
+        :return: Gf.Range3d, empty if the prim has no geometry.
+        """
+        return self.bbox_cache.ComputeWorldBound(prim).ComputeAlignedRange()
+
+    def get_size(self, prim):
+        """
+        It returns the size of the prim in world space
+
+        :param prim: Usd.Prim
+        :return: Gf.Vec3d
+        """
+        return self.get_world_range(prim).GetSize()
+
+    def get_center(self, prim):
+        """
+        It returns the center of the prim in world space, or its world position if it has no geometry
+
+        :param prim: Usd.Prim
+        :return: Gf.Vec3d
+        """
+        prim_range = self.get_world_range(prim)
+        if not prim_range.IsEmpty():
+            return prim_range.GetMidpoint()
+        return self.get_world_transform(prim).ExtractTranslation()
+
+    def compute_world_bounds(self, prims):
+        """
+        It returns the world space axis aligned bounds of the prims as two numpy arrays, swept over the time codes
+        for the animated prims
+
+        Prims without any geometry are represented by a point at their world position. Prims that have neither
+        geometry nor a transform, and payloads that are not loaded, get an infinite box, so they are never culled or
+        treated as distant.
+
+        :param prims: An iterable of Usd.Prim
+        :return: A tuple of (N, 3) arrays with the minimum and maximum corners.
+        """
+        prims = list(prims)
+        if not self.time_codes:
+            return _compute_bounds(prims, self.bbox_cache, self.xform_cache)
+        is_animated = np.array([self.is_time_varying(prim) for prim in prims], dtype=bool)
+        static = np.flatnonzero(~is_animated)
+        animated = np.flatnonzero(is_animated)
+        mins = np.empty((len(prims), 3), dtype=np.float64)
+        maxs = np.empty((len(prims), 3), dtype=np.float64)
+        static_prims = [prims[index] for index in static]
+        mins[static], maxs[static] = _compute_bounds(static_prims, self.bbox_cache, self.xform_cache)
+        if not len(animated):
+            return mins, maxs
+        self._compute_swept_ranges([prims[index] for index in animated])
+        for index in animated:
+            prim = prims[index]
+            mins[index], maxs[index] = self._swept_ranges[prim.GetPath()]
+            if np.all(mins[index] <= maxs[index]):
+                continue
+            if prim.IsA(UsdGeom.Xformable) and prim.IsLoaded():
+                positions = [
+                    xform_cache.GetLocalToWorldTransform(prim).ExtractTranslation()
+                    for _, xform_cache in self._get_time_caches()
+                ]
+                mins[index], maxs[index] = np.min(positions, axis=0), np.max(positions, axis=0)
+            else:
+                mins[index] = -np.inf
+                maxs[index] = np.inf
+        return mins, maxs
+
+    def _compute_swept_ranges(self, prims):
+        """
+        It computes the swept ranges of animated prims, and of the animated prims under the groups among them
+
+        :param prims: List of animated Usd.Prim
+        """
+        # Groups come before their children, the other prims are computed at every time code.
+        groups = []
+        computed = []
+        found = set()
+        stack = list(prims)
+        while stack:
+            prim = stack.pop()
+            path = prim.GetPath()
+            if path in self._swept_ranges or path in found:
+                continue
+            found.add(path)
+            if prim.IsA(UsdGeom.Boundable) or path not in self._varying_subtrees:
+                computed.append(prim)
+                continue
+            children = prim.GetFilteredChildren(Usd.TraverseInstanceProxies(Usd.PrimDefaultPredicate))
+            groups.append((path, children))
+            stack.extend(child for child in children if self.is_time_varying(child))
+
+        if computed:
+            ranges = [_get_world_ranges(computed, bbox_cache) for bbox_cache, _ in self._get_time_caches()]
+            mins = np.min([time_mins for time_mins, _ in ranges], axis=0)
+            maxs = np.max([time_maxs for _, time_maxs in ranges], axis=0)
+            for index, prim in enumerate(computed):
+                self._swept_ranges[prim.GetPath()] = (mins[index], maxs[index])
+        for path, children in reversed(groups):
+            child_mins, child_maxs = _get_world_ranges(children, self.bbox_cache)
+            for index, child in enumerate(children):
+                swept_range = self._swept_ranges.get(child.GetPath())
+                if swept_range is not None:
+                    child_mins[index], child_maxs[index] = swept_range
+            self._swept_ranges[path] = (child_mins.min(axis=0, initial=np.inf), child_maxs.max(axis=0, initial=-np.inf))
+
+    def is_time_varying(self, prim):
+        """
+        It checks if the world bound of the prim may change over the time codes
+
+        The first prim that is checked has the whole stage checked in one walk, unless none of its layers has time
+        samples at all.
+
+        :param prim: Usd.Prim
+        :return: True if the prim, one of its descendants or the transform of one of its ancestors is animated, always
+            False without time codes.
+        """
+        if not self.time_codes:
+            return False
+        if self._varying_bounds is None:
+            self._find_time_varying(prim.GetStage())
+        return prim.GetPath() in self._varying_bounds
+
+    def _find_time_varying(self, stage):
+        """
+        It walks the stage and records the prims whose subtree has time varying attributes and the prims whose world
+        bound may change over time
+
+        :param stage: Usd.Stage
+        """
+        self._varying_subtrees = set()
+        self._varying_bounds = set()
+        # Value clips are opened with the stage, their layers have time samples too.
+        if not any(layer.ListAllTimeSamples() for layer in stage.GetUsedLayers()):
+            return
+        # Parents come before their children: the transforms are checked on the way down, the subtrees on the way up.
+        visited = []
+        moving_paths = set()
+        predicate = Usd.TraverseInstanceProxies(Usd.PrimDefaultPredicate)
+        for descendant in Usd.PrimRange(stage.GetPseudoRoot(), predicate):
+            path = descendant.GetPath()
+            is_varying = _has_time_varying_attributes(descendant)
+            parent_moving = path.GetParentPath() in moving_paths
+            if parent_moving or (
+                is_varying
+                and descendant.IsA(UsdGeom.Xformable)
+                and UsdGeom.Xformable(descendant).TransformMightBeTimeVarying()
+            ):
+                moving_paths.add(path)
+            visited.append((path, is_varying, parent_moving))
+        for path, is_varying, parent_moving in reversed(visited):
+            if is_varying or path in self._varying_subtrees:
+                self._varying_subtrees.add(path)
+                self._varying_subtrees.add(path.GetParentPath())
+                self._varying_bounds.add(path)
+            elif parent_moving:
+                self._varying_bounds.add(path)
+
+    def _get_time_caches(self):
+        """
+        It returns a bounds cache and a transform cache for every time code, they are kept for the whole pass
+
+        :return: A list of tuples of UsdGeom.BBoxCache and UsdGeom.XformCache.
+        """
+        if self._time_caches is None:
+            self._time_caches = [
+                (
+                    UsdGeom.BBoxCache(time, includedPurposes=self.purposes, useExtentsHint=self.use_extents_hint),
+                    UsdGeom.XformCache(time),
+                )
+                for time in self.time_codes
+            ]
+        return self._time_caches
+
+
+def _compute_bounds(prims, bbox_cache, xform_cache):
+    """
+    It returns the world space axis aligned bounds of the prims at the time of the caches, see
+    SceneBounds.compute_world_bounds
+
+    :param prims: List of Usd.Prim
+    :param bbox_cache: UsdGeom.BBoxCache
+    :param xform_cache: UsdGeom.XformCache at the same time
+    :return: A tuple of (N, 3) arrays with the minimum and maximum corners.
+    """
+    mins = np.empty((len(prims), 3), dtype=np.float64)
+    maxs = np.empty((len(prims), 3), dtype=np.float64)
+    for index, prim in enumerate(prims):
+        prim_range = bbox_cache.ComputeWorldBound(prim).ComputeAlignedRange()
+        if not prim_range.IsEmpty():
+            mins[index] = prim_range.GetMin()
+            maxs[index] = prim_range.GetMax()
+        elif prim.IsA(UsdGeom.Xformable) and prim.IsLoaded():
+            mins[index] = maxs[index] = xform_cache.GetLocalToWorldTransform(prim).ExtractTranslation()
+        else:
+            mins[index] = -np.inf
+            maxs[index] = np.inf
+    return mins, maxs
+
+
+def _get_world_ranges(prims, bbox_cache):
+    """
+    It returns the world space axis aligned ranges of the prims at the time of the cache, without any fallback
+
+    :param prims: List of Usd.Prim
+    :param bbox_cache: UsdGeom.BBoxCache
+    :return: A tuple of (N, 3) arrays with the minimum and maximum corners, inverted infinite ones for empty ranges.
+    """
+    mins = np.full((len(prims), 3), np.inf)
+    maxs = np.full((len(prims), 3), -np.inf)
+    for index, prim in enumerate(prims):
+        prim_range = bbox_cache.ComputeWorldBound(prim).ComputeAlignedRange()
+        if not prim_range.IsEmpty():
+            mins[index] = prim_range.GetMin()
+            maxs[index] = prim_range.GetMax()
+    return mins, maxs
+
+
+def _has_time_varying_attributes(prim):
+    """
+    It checks if any attribute authored on the prim may have different values at different times
+
+    :param prim: Usd.Prim
+    :return: True if an attribute has several time samples or value clips.
+    """
+    return any(attribute.ValueMightBeTimeVarying() for attribute in prim.GetAuthoredAttributes())
+
+
+def get_distances_to_point(point, mins, maxs):
+    """
+    It returns the distance from a point to the center of every box
+
+    :param point: The point, usually the camera position
+    :param mins: A (N, 3) array with the minimum corner of every box
+    :param maxs: A (N, 3) array with the maximum corner of every box
+    :return: A (N,) array of distances, NaN for unbounded boxes.
+    """
+    with np.errstate(invalid="ignore"):
+        centers = (np.asarray(mins) + np.asarray(maxs)) * 0.5
+    return np.linalg.norm(centers - np.asarray(point, dtype=np.float64), axis=1)
@@ -0,0 +1,353 @@
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+from pxr import Ar, Sdf, UsdGeom
+
+# Version of the cache files, bumped when their layout or what the snapshot holds changes. Other versions are ignored.
+CACHE_FORMAT = 1
+CACHE_MAGIC = b"CVOSNAP\0"
+# The cache is saved next to the root layer, with this suffix after its file name.
+CACHE_SUFFIX = ".cvo_snapshot"
+# Every array starts at a multiple of this offset, so it can be mapped from the file as it is.
+ARRAY_ALIGNMENT = 64
+
+
+def get_cache_path(stage):
+    """
+    It returns where the snapshot cache of the stage is saved, next to its root layer
+
+    :param stage: Usd.Stage
+    :return: The file path, or None if the root layer is not a file.
+    """
+    root_layer = stage.GetRootLayer()
+    if root_layer.anonymous or not root_layer.realPath:
+        return None
+    return root_layer.realPath + CACHE_SUFFIX
+
+
+def get_stage_key(stage):
+    """
+    It describes what else than its layers decides which prims a stage has: its load rules and its population mask
+
+    :param stage: Usd.Stage
+    :return: A JSON serializable dict.
+    """
+    return {
+        "load_rules": [[str(path), str(rule)] for path, rule in stage.GetLoadRules().GetRules()],
+        "population_mask": [str(path) for path in stage.GetPopulationMask().GetPaths()],
+    }
+
+
+def get_layer_signatures(stage, skip_layer=None):
+    """
+    It identifies the content of every layer the stage uses
+
+    A layer saved to disk is identified by the modification time its resolver gives, an anonymous layer by a hash of
+    its content, as its identifier changes with every session. A layer with unsaved changes has no signature, so it
+    never matches.
+
+    :param stage: Usd.Stage
+    :param skip_layer: Sdf.Layer to leave out, like the optimization layer
+    :return: A dict of layer key to signature, str or None.
+    """
+    return {_get_layer_key(layer): _get_layer_signature(layer) for layer in _get_used_layers(stage, skip_layer)}
+
+
+def get_layer_roots(layer):
+    """
+    It returns the top-most prim specs of a layer that have opinions of their own
+
+    Overs that only hold children don't change their prim, so the walk goes on under them. A prim spec with
+    properties, metadata, variants or a def specifier is a root, the specs under it are not visited.
+
+    :param layer: Sdf.Layer of the layer stack of the stage
+    :return: A sorted list of path strings, without variant selections.
+    """
+    roots = set()
+    stack = list(layer.rootPrims.values())
+    while stack:
+        prim_spec = stack.pop()
+        if (
+            prim_spec.specifier != Sdf.SpecifierOver
+            or prim_spec.properties
+            or prim_spec.variantSets
+            or set(prim_spec.ListInfoKeys()) != {"specifier"}
+        ):
+            roots.add(prim_spec.path.StripAllVariantSelections().pathString)
+        else:
+            stack.extend(prim_spec.nameChildren.values())
+    return sorted(roots)
+
+
+def get_optimization_roots(layer):
+    """
+    It returns the prims the optimization layer deactivates and the instancers it hides instances of, which change
+    what the snapshot holds, unlike the prims it hides
+
+    :param layer: The optimization layer, or None
+    :return: A sorted list of path strings.
+    """
+    if layer is None:
+        return []
+    roots = set()
+
+    def visit(path):
+        if path.IsPropertyPath():
+            if path.name == UsdGeom.Tokens.invisibleIds:
+                roots.add(path.GetPrimPath().pathString)
+        elif path.IsPrimPath() and layer.GetPrimAtPath(path).HasInfo("active"):
+            roots.add(path.pathString)
+
+    layer.Traverse(Sdf.Path.absoluteRootPath, visit)
+    return sorted(roots)
+
+
+def get_cache_header(stage, base_path, skip_layer=None):
+    """
+    It describes the state of the stage a snapshot is taken from, what find_changed_roots compares to
+
+    :param stage: Usd.Stage
+    :param base_path: Sdf.Path of the base prim of the snapshot
+    :param skip_layer: The optimization layer, its opinions are compared apart from the other layers
+    :return: A JSON serializable dict.
+    """
+    layer_stack = [layer for layer in stage.GetLayerStack(includeSessionLayers=True) if layer != skip_layer]
+    return {
+        "base_path": base_path.pathString,
+        "stage": get_stage_key(stage),
+        "layers": get_layer_signatures(stage, skip_layer),
+        "layer_roots": {_get_layer_key(layer): get_layer_roots(layer) for layer in layer_stack},
+        "optimization_roots": get_optimization_roots(skip_layer),
+    }
+
+
+def find_changed_roots(stage, header, skip_layer=None):
+    """
+    It finds the subtrees of the stage that may have changed since the header of a cache was written
+
+    The subtrees of a layer of the layer stack are its roots, the ones it had and the ones it has, so removed specs
+    count too. A layer that is referenced, or sublayered by a referenced layer, changes the prims that reference it,
+    found by walking the arcs of the layers the stage uses.
+
+    :param stage: Usd.Stage
+    :param header: The header of the cache, as get_cache_header returned it
+    :param skip_layer: The optimization layer
+    :return: A set of Sdf.Path, or None if the changes can't be located and the whole snapshot has to be taken again.
+    """
+    if header.get("stage") != get_stage_key(stage):
+        return None
+    saved_signatures = header["layers"]
+    saved_roots = header["layer_roots"]
+    used_layers = {_get_layer_key(layer): layer for layer in _get_used_layers(stage, skip_layer)}
+    layer_stack = {
+        _get_layer_key(layer): layer
+        for layer in stage.GetLayerStack(includeSessionLayers=True)
+        if layer != skip_layer
+    }
+    changed_keys = [
+        key
+        for key in set(saved_signatures) | set(used_layers)
+        if key not in used_layers
+        or saved_signatures.get(key) is None
+        or saved_signatures[key] != _get_layer_signature(used_layers[key])
+    ]
+    roots = set()
+    referenced_keys = []
+    for key in changed_keys:
+        if key in saved_roots or key in layer_stack:
+            roots.update(saved_roots.get(key, ()))
+            if key in layer_stack:
+                roots.update(get_layer_roots(layer_stack[key]))
+        elif key in used_layers:
+            referenced_keys.append(key)
+        # A referenced layer that is no longer used was removed by a change of the layer that referenced it.
+    if referenced_keys:
+        user_roots = _find_user_roots(used_layers, layer_stack, referenced_keys)
+        if user_roots is None:
+            return None
+        roots.update(user_roots)
+    roots.update(set(header.get("optimization_roots", ())) ^ set(get_optimization_roots(skip_layer)))
+    return {Sdf.Path(root) for root in roots}
+
+
+def write_cache(path, header, arrays):
+    """
+    It writes a cache file: a JSON header followed by the arrays, aligned so they can be mapped
+
+    The file is written next to its final path and moved over it, so a cache is never read half written.
+
+    :param path: File path
+    :param header: JSON serializable dict
+    :param arrays: A dict of name to numpy array
+    """
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        entries[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += _align(array.nbytes)
+    header = dict(header, format=CACHE_FORMAT, arrays=entries)
+    header_data = json.dumps(header).encode()
+    data_start = _align(len(CACHE_MAGIC) + 8 + len(header_data))
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as cache_file:
+        cache_file.write(CACHE_MAGIC)
+        cache_file.write(len(header_data).to_bytes(8, "little"))
+        cache_file.write(header_data)
+        for name, array in arrays.items():
+            cache_file.seek(data_start + entries[name]["offset"])
+            cache_file.write(np.ascontiguousarray(array).tobytes())
+        cache_file.truncate(data_start + offset)
+    os.replace(temporary_path, path)
+
+
+def read_cache(path):
+    """
+    It reads a cache file written by write_cache, the arrays are mapped from the file instead of read
+
+    The arrays are mapped copy on write: they can be modified like any array, the file never is.
+
+    :param path: File path
+    :return: A tuple of the header and a dict of name to numpy array, or None if the file is missing, of another
+        version or damaged.
+    """
+    try:
+        with open(path, "rb") as cache_file:
+            if cache_file.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            header_size = int.from_bytes(cache_file.read(8), "little")
+            header = json.loads(cache_file.read(header_size).decode())
+        if header.get("format") != CACHE_FORMAT:
+            return None
+        data_start = _align(len(CACHE_MAGIC) + 8 + header_size)
+        arrays = {}
+        for name, entry in header["arrays"].items():
+            dtype, shape = np.dtype(entry["dtype"]), tuple(entry["shape"])
+            if not np.prod(shape, dtype=np.int64):
+                # An empty file region can't be mapped.
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode="c", offset=data_start + entry["offset"], shape=shape)
+        return header, arrays
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def is_mapped(array):
+    """
+    It checks if an array is mapped from a file, like the arrays read_cache returns and the views of them
+
+    A mapped file can't be replaced on Windows, the arrays have to be copied to memory before it is written again.
+
+    :param array: numpy array
+    :return: True if the array is mapped.
+    """
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return isinstance(array, mmap.mmap)
+
+
+def _align(size):
+    """
+    It rounds a size up to the alignment of the arrays
+
+    :param size: Size in bytes
+    :return: int
+    """
+    return -(-size // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+def _get_used_layers(stage, skip_layer=None):
+    """
+    It returns the layers the stage uses, without the skipped one
+
+    :param stage: Usd.Stage
+    :param skip_layer: Sdf.Layer to leave out
+    :return: A list of Sdf.Layer.
+    """
+    return [layer for layer in stage.GetUsedLayers() if layer != skip_layer]
+
+
+def _get_layer_key(layer):
+    """
+    It returns what a layer is known by in a cache: its identifier, or a hash of its content if it is anonymous
+
+    :param layer: Sdf.Layer
+    :return: str
+    """
+    if layer.anonymous:
+        return "anonymous:" + hashlib.sha1(layer.ExportToString().encode()).hexdigest()
+    return layer.identifier
+
+
+def _get_layer_signature(layer):
+    """
+    It returns what identifies the content of a layer, see get_layer_signatures
+
+    :param layer: Sdf.Layer
+    :return: str, or None if the layer has unsaved changes or no modification time.
+    """
+    if layer.anonymous:
+        return _get_layer_key(layer)
+    if layer.dirty:
+        return None
+    timestamp = Ar.GetResolver().GetModificationTimestamp(layer.identifier, layer.resolvedPath)
+    if not timestamp.IsValid():
+        return None
+    return repr(timestamp.GetTime())
+
+
+def _find_user_roots(used_layers, layer_stack, keys):
+    """
+    It finds the prims of the layer stack that bring in the layers through references and payloads, directly or
+    through other layers
+
+    :param used_layers: A dict of layer key to Sdf.Layer, the layers the stage uses
+    :param layer_stack: A dict of layer key to Sdf.Layer, the layers of the layer stack of the stage
+    :param keys: Keys of the changed layers
+    :return: A set of path strings, or None if a layer is used in a way that is not found, like value clips.
+    """
+    keys_by_layer = {layer: key for key, layer in used_layers.items()}
+    users = {}
+
+    def add_user(layer, asset_path, user):
+        target = Sdf.Layer.Find(Sdf.ComputeAssetPathRelativeToLayer(layer, asset_path))
+        if target in keys_by_layer:
+            users.setdefault(keys_by_layer[target], []).append(user)
+
+    for user_key, layer in used_layers.items():
+        for sublayer_path in layer.subLayerPaths:
+            add_user(layer, sublayer_path, (user_key, None))
+        stack = list(layer.rootPrims.values())
+        while stack:
+            prim_spec = stack.pop()
+            if prim_spec.hasReferences or prim_spec.hasPayloads:
+                path = prim_spec.path.StripAllVariantSelections().pathString
+                arcs = list(prim_spec.referenceList.GetAddedOrExplicitItems())
+                arcs.extend(prim_spec.payloadList.GetAddedOrExplicitItems())
+                for arc in arcs:
+                    if arc.assetPath:
+                        add_user(layer, arc.assetPath, (user_key, path))
+            stack.extend(prim_spec.nameChildren.values())
+            for variant_set in prim_spec.variantSets.values():
+                stack.extend(variant.primSpec for variant in variant_set.variants.values())
+
+    roots = set()
+    pending = list(keys)
+    visited = set(pending)
+    while pending:
+        key = pending.pop()
+        if key not in users:
+            return None
+        for user_key, path in users[key]:
+            if path is not None and user_key in layer_stack:
+                roots.add(path)
+            elif user_key not in visited:
+                # Any change of a layer changes all the prims that use the layers it sublayers or references.
+                visited.add(user_key)
+                pending.append(user_key)
+    return roots
@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+from pxr import Usd, UsdGeom
+
+from .frustum import get_camera_prims, get_view_time_codes
+
+
+def get_camera_pixel_scale(camera_prim, resolution, time=Usd.TimeCode.Default()):
+    """
+    It returns the focal length of a camera in pixels of the render resolution, with its own focal length
+
+    The larger of the horizontal and vertical scales is used, so objects are never assumed smaller than they are
+    when the aspect ratio of the resolution doesn't match the aperture.
+
+    :param camera_prim: The UsdGeom.Camera prim
+    :param resolution: Width and height of the render in pixels
+    :param time: The time code to evaluate the camera at
+    :return: Pixels per unit of size at a distance of one unit.
+    """
+    gf_camera = UsdGeom.Camera(camera_prim).GetCamera(time)
+    width, height = resolution
+    return max(
+        gf_camera.focalLength / gf_camera.horizontalAperture * width,
+        gf_camera.focalLength / gf_camera.verticalAperture * height,
+    )
+
+
+def get_view_pixel_scales(stage, camera_paths, settings):
+    """
+    It returns the pixel scale of every view, in the same order as get_view_frustums
+
+    :param stage: Usd.Stage
+    :param camera_paths: Paths of the cameras
+    :param settings: OptimizerSettings with the resolution, time range and time stride
+    :return: A (V,) array.
+    """
+    time_codes = get_view_time_codes(settings) or [Usd.TimeCode.Default()]
+    return np.array([
+        get_camera_pixel_scale(camera_prim, settings.resolution, time_code)
+        for camera_prim in get_camera_prims(stage, camera_paths)
+        for time_code in time_codes
+    ], dtype=np.float64)
+
+
+def get_frustum_pixel_scale(frustum, resolution):
+    """
+    It returns the pixel scale of a frustum, for views whose camera is not known
+
+    :param frustum: Gf.Frustum
+    :param resolution: Width and height of the render in pixels
+    :return: Pixels per unit of size at a distance of one unit.
+    """
+    window = frustum.window
+    return max(
+        resolution[0] / (window.max[0] - window.min[0]),
+        resolution[1] / (window.max[1] - window.min[1]),
+    )
+
+
+def get_distance_limits(settings, pixel_scales, mins, maxs):
+    """
+    It returns the distance from every view past which every box is hidden
+
+    It is the max distance, or closer for boxes that would cover less than the min pixel coverage. A bounding
+    sphere of radius r seen from a distance d covers pi * (s * r)^2 / (d^2 - r^2) pixels, s being the pixel scale,
+    so it covers less than c pixels past a distance of r * sqrt(1 + pi * s^2 / c).
+
+    :param settings: OptimizerSettings with the max distance and the min pixel coverage
+    :param pixel_scales: A (V,) array with the pixel scale of every view
+    :param mins: A (N, 3) array with the minimum corner of every box
+    :param maxs: A (N, 3) array with the maximum corner of every box
+    :return: A (V, N) array.
+    """
+    limits = np.full((len(pixel_scales), len(mins)), float(settings.max_distance))
+    if settings.min_pixel_coverage <= 0:
+        return limits
+    with np.errstate(invalid="ignore"):
+        radii = np.linalg.norm((np.asarray(maxs) - np.asarray(mins)) * 0.5, axis=1)
+    factors = np.sqrt(1.0 + math.pi * np.square(pixel_scales) / settings.min_pixel_coverage)
+    # Unbounded and empty boxes have an infinite radius, so they are never too small.
+    return np.minimum(limits, factors[:, np.newaxis] * radii[np.newaxis])
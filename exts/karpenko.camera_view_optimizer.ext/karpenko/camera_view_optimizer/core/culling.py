@@ -0,0 +1,393 @@
+import time
+
+import numpy as np
+from pxr import Gf, UsdGeom
+
+from .bounds import SceneBounds, get_distances_to_point
+from .coverage import get_distance_limits, get_frustum_pixel_scale, get_view_pixel_scales
+from .frustum import INSIDE, OUTSIDE, classify_boxes, get_frustums_planes, get_swept_time_codes, get_view_frustums
+from .occlusion import build_occlusion_buffer
+from .report import (HIDDEN_REASONS, LIGHT_EXEMPT, REASONS, RULE_HIDDEN, RULE_SHOWN, VISIBLE, OptimizationReport,
+                     get_boxes_behind, get_decision_reasons)
+from .rules import HIDE, SHOW, compile_rules
+from .settings import LIGHT_TYPES, are_lights_exempt
+from .traversal import PrimTraversal, get_base_prim
+
+# Number of prims tested between two steps of HierarchicalCuller.iter_cull().
+CULL_CHUNK_SIZE = 2000
+
+
+def get_box_distance_range(point, mins, maxs):
+    """
+    It returns the closest and the farthest distance from a point to every box
+
+    :param point: The point, usually the camera position, or a (V, 3) array of points
+    :param mins: A (N, 3) array with the minimum corner of every box
+    :param maxs: A (N, 3) array with the maximum corner of every box
+    :return: A tuple of two (N,) arrays, or (V, N) arrays for several points.
+    """
+    point = np.asarray(point, dtype=np.float64)[..., np.newaxis, :]
+    with np.errstate(invalid="ignore"):
+        closest = np.maximum(np.maximum(mins - point, point - maxs), 0.0)
+        farthest = np.maximum(np.abs(point - mins), np.abs(point - maxs))
+    return np.linalg.norm(closest, axis=-1), np.linalg.norm(farthest, axis=-1)
+
+
+class HierarchicalCuller:
+    """
+    Decides which prims are hidden, using the prim hierarchy as a bounding volume hierarchy
+
+    The children of every prim are tested in one batch. A subtree that is hidden as a whole (outside of the view,
+    or too far away, and not exempt by size, pattern or type) is hidden once at its root. A subtree that is
+    visible as a whole is accepted without testing its children. Only partially visible prims are descended into.
+    When occlusion culling is enabled, prims in the view that are completely behind big occluders are treated as
+    outside of the view. With a min pixel coverage, prims that would cover too few pixels are treated as distant.
+
+    Several views (cameras, or poses of an animated camera) can be culled in the same pass. Bounds are computed
+    once and tested against all views together, and a prim is hidden only if it is hidden in every view.
+
+    Args:
+        frustums (List[Gf.Frustum]): The world space camera frustums, or a single one.
+        settings (OptimizerSettings): Settings of the pass.
+        scene_bounds (SceneBounds): Bounds cache of the pass, a new one that sweeps the bounds of animated prims
+            over the swept time range of the settings is created if not provided.
+        instance_proxies (bool): Visit the prims inside of instances.
+        pixel_scales (List[float]): Focal length in pixels of every view, for the pixel coverage. If not provided,
+            it is taken from the frustums, which are built with the scan focal length.
+        report (OptimizationReport): Report the phases and the decisions are recorded to, a new one is created if
+            not provided.
+        split_paths (List[Sdf.Path]): Prims that are only passed through like scopes, because their children are
+            culled in several shards.
+    """
+
+    def __init__(
+        self,
+        frustums,
+        settings,
+        scene_bounds=None,
+        instance_proxies=False,
+        pixel_scales=None,
+        report=None,
+        split_paths=(),
+    ):
+        if isinstance(frustums, Gf.Frustum):
+            frustums = [frustums]
+        self.settings = settings
+        if scene_bounds is None:
+            scene_bounds = SceneBounds(time_codes=get_swept_time_codes(settings))
+        self.scene_bounds = scene_bounds
+        self.frustums = list(frustums)
+        self.frustum_planes = get_frustums_planes(self.frustums)
+        self.occlusion_buffers = []
+        self.camera_positions = np.array([frustum.position for frustum in self.frustums], dtype=np.float64)
+        if pixel_scales is None:
+            pixel_scales = [get_frustum_pixel_scale(frustum, settings.resolution) for frustum in self.frustums]
+        self.pixel_scales = np.asarray(pixel_scales, dtype=np.float64)
+        self.instance_proxies = instance_proxies
+        self.predicate = PrimTraversal.build_predicate(instance_proxies=instance_proxies)
+        self.rules = compile_rules(settings)
+        self.report = report if report is not None else OptimizationReport()
+        self.split_paths = set(split_paths)
+        # Time spent matching the rules in the current batch, it is reported apart from the culling tests.
+        self._rules_seconds = 0.0
+        self._rules_count = 0
+        # Paths of the prims that hold kept prims, and of the prims that hold prims a rule hides, in their subtree.
+        self._kept_paths = set()
+        self._hide_rule_paths = set()
+        # Counters of the last cull() call.
+        self.tested_count = 0
+        self.hidden_subtrees = 0
+        self.visible_subtrees = 0
+        self.occluded_count = 0
+
+    def cull(self, root_prim):
+        """
+        It returns the paths of prims under the root prim that should be hidden
+
+        A prim is hidden at most once: the descendants of a hidden prim are not returned.
+
+        :param root_prim: The prim to search under, it is never hidden itself
+        :return: A list of Sdf.Path
+        """
+        steps = self.iter_cull(root_prim)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+
+    def iter_cull(self, root_prim, progress=None):
+        """
+        It does the same as cull(), in small steps: the generator yields after every few thousand tested prims
+
+        :param root_prim: The prim to search under, it is never hidden itself
+        :param progress: JobProgress to report the tested and hidden prims to
+        :return: A generator, its return value is the list of Sdf.Path cull() returns.
+        """
+        self.tested_count = 0
+        self.hidden_subtrees = 0
+        self.visible_subtrees = 0
+        self.occluded_count = 0
+        hidden_paths = []
+        if not root_prim:
+            return hidden_paths
+        if self.settings.occlusion_culling:
+            with self.report.measure("occlusion"):
+                self.occlusion_buffers = [
+                    build_occlusion_buffer(
+                        frustum,
+                        root_prim,
+                        self.scene_bounds,
+                        self.settings.max_size,
+                        self.settings.occlusion_resolution,
+                    )
+                    for frustum in self.frustums
+                ]
+        self._find_rule_subtrees(root_prim)
+
+        stack = [root_prim]
+        next_step = CULL_CHUNK_SIZE
+        while stack:
+            parent = stack.pop()
+            start_time = time.perf_counter()
+            children = list(parent.GetFilteredChildren(self.predicate))
+            self.report.add("traversal", time.perf_counter() - start_time, len(children))
+            # Prims with a lot of children are tested in several batches, so no step takes too long.
+            for start in range(0, len(children), CULL_CHUNK_SIZE):
+                self._cull_batch(children[start:start + CULL_CHUNK_SIZE], stack, hidden_paths)
+                if self.tested_count >= next_step:
+                    next_step = self.tested_count + CULL_CHUNK_SIZE
+                    if progress is not None:
+                        progress.done = self.tested_count
+                        progress.hidden = len(hidden_paths)
+                    yield
+        if progress is not None:
+            progress.done = self.tested_count
+            progress.hidden = len(hidden_paths)
+        self.report.count("hidden_subtrees", self.hidden_subtrees)
+        self.report.count("visible_subtrees", self.visible_subtrees)
+        self.report.count("occluded", self.occluded_count)
+        return hidden_paths
+
+    def _cull_batch(self, children, stack, hidden_paths):
+        """
+        It tests a batch of siblings, hides the ones that can be decided and pushes the others to be descended into
+
+        :param children: Usd.Prim siblings
+        :param stack: Prims left to descend into
+        :param hidden_paths: Paths of the hidden prims, the hidden children are appended
+        """
+        self.tested_count += len(children)
+        report = self.report
+        with report.measure("bounds", len(children)):
+            bounds_min, bounds_max = self.scene_bounds.compute_world_bounds(children)
+        start_time = time.perf_counter()
+        # Every array below has one row per view and one column per child.
+        states = classify_boxes(self.frustum_planes, bounds_min, bounds_max)
+        occluded = np.zeros(states.shape, dtype=bool)
+        for view_index, occlusion_buffer in enumerate(self.occlusion_buffers):
+            view_states = states[view_index]
+            occluded[view_index] = (view_states != OUTSIDE) & occlusion_buffer.test_boxes(bounds_min, bounds_max)
+            view_states[occluded[view_index]] = OUTSIDE
+        self.occluded_count += int(occluded.sum())
+        distances = np.stack([
+            get_distances_to_point(position, bounds_min, bounds_max) for position in self.camera_positions
+        ])
+        closest, farthest = get_box_distance_range(self.camera_positions, bounds_min, bounds_max)
+        limits = get_distance_limits(self.settings, self.pixel_scales, bounds_min, bounds_max)
+        sizes = bounds_max - bounds_min
+        with np.errstate(invalid="ignore"):
+            # What the cameras alone decide for every child, the rules and the lights are applied one by one.
+            reasons = get_decision_reasons(
+                self.settings,
+                states,
+                distances > limits,
+                distances > self.settings.max_distance,
+                np.any(sizes > self.settings.max_size, axis=1),
+                behind=get_boxes_behind(self.frustum_planes, bounds_min, bounds_max),
+                occluded=occluded,
+            )
+        self._rules_seconds, self._rules_count = 0.0, 0
+
+        for index, child in enumerate(children):
+            # Scopes, prims that can't be hidden and prims split into shards are only passed through.
+            if (
+                child.GetTypeName() == "Scope"
+                or not child.IsA(UsdGeom.Imageable)
+                or child.GetPath() in self.split_paths
+            ):
+                stack.append(child)
+                continue
+
+            is_hidden_subtree = self.is_hidden_subtree(
+                child, states[:, index], closest[:, index], sizes[index], limits[:, index]
+            )
+            if not is_hidden_subtree and self.is_visible_subtree(child, states[:, index], farthest[:, index]):
+                self.visible_subtrees += 1
+                report.count_decision(self.get_prim_reason(child, VISIBLE))
+                continue
+
+            # The root is counted with the reason a rule may give it, like the prims decided one by one.
+            reason = self.get_prim_reason(child, REASONS[reasons[index]])
+            if reason in HIDDEN_REASONS and self.holds_kept_prims(child):
+                # Hiding it would hide the lights and the shown prims under it, so it is only passed through.
+                if not child.IsA(UsdGeom.PointInstancer):
+                    stack.append(child)
+                continue
+            report.count_decision(reason)
+            if reason in HIDDEN_REASONS:
+                # Everything under a hidden prim is hidden as well, so there is nothing left to decide.
+                if is_hidden_subtree:
+                    self.hidden_subtrees += 1
+                hidden_paths.append(child.GetPath())
+            elif not child.IsA(UsdGeom.PointInstancer):
+                # Prototypes are only drawn through their instancer, hiding them would hide all of its instances.
+                stack.append(child)
+        report.add("culling", time.perf_counter() - start_time - self._rules_seconds, len(children))
+        if self._rules_count:
+            report.add("rules", self._rules_seconds, self._rules_count)
+
+    def get_prim_reason(self, prim, reason):
+        """
+        It applies the rules and the exemption of lights to what the cameras decided for a prim
+
+        :param prim: Usd.Prim
+        :param reason: One of REASONS, what the cameras decided
+        :return: One of REASONS, the prim is hidden if it is one of HIDDEN_REASONS.
+        """
+        action = self._evaluate_rules(prim)
+        if action == SHOW:
+            reason = RULE_SHOWN
+        elif action == HIDE:
+            reason = RULE_HIDDEN
+        if reason in HIDDEN_REASONS and are_lights_exempt(self.settings) and prim.GetTypeName() in LIGHT_TYPES:
+            return LIGHT_EXEMPT
+        return reason
+
+    def _evaluate_rules(self, prim):
+        """
+        It evaluates the rules on a prim, and measures the time it takes
+
+        :param prim: Usd.Prim
+        :return: SHOW, HIDE, or None if no rule matches.
+        """
+        if not self.rules:
+            return None
+        start_time = time.perf_counter()
+        action = self.rules.evaluate(prim)
+        self._rules_seconds += time.perf_counter() - start_time
+        self._rules_count += 1
+        return action
+
+    def is_hidden_subtree(self, prim, states, closest, size, limits=None):
+        """
+        It checks if every prim of the subtree would be hidden, so the subtree can be hidden at its root
+
+        :param prim: Root of the subtree
+        :param states: Frustum states of the subtree bound, one per view
+        :param closest: Closest distances from the cameras to the subtree bound, one per view
+        :param size: Size of the subtree bound
+        :param limits: Distances past which the subtree bound is hidden, one per view, the max distance if not
+            provided. The limit of a smaller box is never further, and its center is never closer than the bound.
+        :return: True if the subtree can be hidden at its root.
+        """
+        settings = self.settings
+        is_distant = closest > (settings.max_distance if limits is None else limits)
+        if np.any((states != OUTSIDE) & ~is_distant):
+            return False
+        # Children are never bigger than their parent, so if the subtree is small enough, so are all its prims.
+        size_exempt = settings.max_size != 0 and bool(np.any(size > settings.max_size))
+        if size_exempt and not (settings.ignore_size_distant_objects and np.all(is_distant)):
+            return False
+        return True
+
+    def holds_kept_prims(self, prim):
+        """
+        It checks if the subtree holds prims that must stay visible whatever the cameras decide for its root: lights,
+        when they are exempt, and prims a rule shows
+
+        :param prim: Root of the subtree
+        :return: True if the root can't be hidden without hiding kept prims.
+        """
+        return prim.GetPath() in self._kept_paths
+
+    def is_visible_subtree(self, prim, states, farthest):
+        """
+        It checks if every prim of the subtree would stay visible, so its children don't have to be tested
+
+        :param prim: Root of the subtree
+        :param states: Frustum states of the subtree bound, one per view
+        :param farthest: Farthest distances from the cameras to the subtree bound, one per view
+        :return: True if the whole subtree is visible.
+        """
+        settings = self.settings
+        # Any prim of the subtree can be too small on the screen, so none is known to be visible.
+        if settings.min_pixel_coverage > 0:
+            return False
+        # One view that sees the whole subtree is enough.
+        if not np.any((states == INSIDE) & (farthest <= settings.max_distance)):
+            return False
+        return prim.GetPath() not in self._hide_rule_paths
+
+    def _find_rule_subtrees(self, root_prim):
+        """
+        It finds, in one traversal, the prims whose subtree holds kept prims or prims a rule hides, so the culling
+        only has to look their paths up instead of walking the subtree of every prim it decides
+
+        A path is in a set if the prim itself or any of its descendants is, the ancestors of a matching prim are
+        added up to the first one already in the set.
+
+        :param root_prim: The prim the pass searches under
+        """
+        self._kept_paths = set()
+        self._hide_rule_paths = set()
+        lights_exempt = are_lights_exempt(self.settings)
+        if not lights_exempt and not self.rules:
+            return
+        self._rules_seconds, self._rules_count = 0.0, 0
+        start_time = time.perf_counter()
+        count = 0
+        for prim in PrimTraversal(root_prim, instance_proxies=self.instance_proxies):
+            count += 1
+            action = self._evaluate_rules(prim)
+            if action == SHOW or (lights_exempt and prim.GetTypeName() in LIGHT_TYPES):
+                self._add_with_ancestors(self._kept_paths, prim.GetPath())
+            elif action == HIDE:
+                self._add_with_ancestors(self._hide_rule_paths, prim.GetPath())
+        self.report.add("traversal", time.perf_counter() - start_time - self._rules_seconds, count)
+        if self._rules_count:
+            self.report.add("rules", self._rules_seconds, self._rules_count)
+
+    @staticmethod
+    def _add_with_ancestors(paths, path):
+        """
+        It adds a path and its ancestors to a set, it stops at the first ancestor already in it
+
+        :param paths: A set of Sdf.Path
+        :param path: Sdf.Path to add
+        """
+        while path not in paths and not path.isEmpty and path != path.absoluteRootPath:
+            paths.add(path)
+            path = path.GetParentPath()
+
+
+def find_hidden_paths(stage, camera_paths, settings, scene_bounds=None, report=None, split_paths=()):
+    """
+    It runs a whole optimize pass on the stage and returns the paths of the prims that should be hidden
+
+    :param stage: Usd.Stage
+    :param camera_paths: Paths of the cameras to scan from
+    :param settings: OptimizerSettings of the pass
+    :param scene_bounds: SceneBounds of the pass, a new one is created if not provided
+    :param report: OptimizationReport to record the phases and the decisions to
+    :param split_paths: Paths of the prims whose children are culled in several shards, they are never hidden
+    :return: A list of Sdf.Path, empty if none of the camera paths is a camera.
+    """
+    frustums = get_view_frustums(stage, camera_paths, settings)
+    if not frustums:
+        return []
+    pixel_scales = get_view_pixel_scales(stage, camera_paths, settings)
+    culler = HierarchicalCuller(
+        frustums, settings, scene_bounds, pixel_scales=pixel_scales, report=report, split_paths=split_paths
+    )
+    return culler.cull(get_base_prim(stage, settings.base_path))
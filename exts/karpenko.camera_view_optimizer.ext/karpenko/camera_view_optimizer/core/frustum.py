@@ -0,0 +1,216 @@
+import numpy as np
+from pxr import Usd, UsdGeom
+
+# Results of the box/frustum classification.
+OUTSIDE = 0
+INTERSECTING = 1
+INSIDE = 2
+
+# Upper bound of the number of plane distances computed at once by classify_boxes.
+CLASSIFY_CHUNK_SIZE = 4_000_000
+
+
+def get_camera_frustum(camera_prim, focal_length=None, time=Usd.TimeCode.Default()):
+    """
+    It returns the world space frustum of a camera prim, optionally with a different focal length
+
+    :param camera_prim: The UsdGeom.Camera prim
+    :param focal_length: Focal length (mm) to use instead of the one authored on the camera, defaults to None
+    :param time: The time code to evaluate the camera at
+    :return: A Gf.Frustum in world space.
+    """
+    gf_camera = UsdGeom.Camera(camera_prim).GetCamera(time)
+    if focal_length:
+        gf_camera.focalLength = float(focal_length)
+    return gf_camera.frustum
+
+
+def get_view_projection_matrix(frustum):
+    """
+    It returns the view-projection matrix of the frustum as a numpy array
+
+    USD uses row vectors, so a world point ``p`` is projected to clip space with ``p @ matrix``.
+
+    :param frustum: Gf.Frustum
+    :return: A (4, 4) numpy array.
+    """
+    return np.array(frustum.ComputeViewMatrix() * frustum.ComputeProjectionMatrix(), dtype=np.float64)
+
+
+def get_camera_frustums(camera_prims, time_codes=None, focal_length=None):
+    """
+    It returns the world space frustums of every camera at every time code
+
+    :param camera_prims: A list of UsdGeom.Camera prims
+    :param time_codes: A list of time codes, defaults to the default time code only
+    :param focal_length: Focal length (mm) to use instead of the ones authored on the cameras, defaults to None
+    :return: A list of Gf.Frustum, grouped by camera.
+    """
+    if not time_codes:
+        time_codes = [Usd.TimeCode.Default()]
+    return [
+        get_camera_frustum(camera_prim, focal_length, time_code)
+        for camera_prim in camera_prims
+        for time_code in time_codes
+    ]
+
+
+def get_view_frustums(stage, camera_paths, settings):
+    """
+    It returns the frustums of every camera that exists on the stage, sampled over the time range of the settings
+
+    :param stage: Usd.Stage
+    :param camera_paths: Paths of the cameras
+    :param settings: OptimizerSettings with the focal length, time range and time stride
+    :return: A list of Gf.Frustum, empty if none of the paths is a camera.
+    """
+    camera_prims = get_camera_prims(stage, camera_paths)
+    return get_camera_frustums(camera_prims, get_view_time_codes(settings), settings.focal_length)
+
+
+def get_camera_prims(stage, camera_paths):
+    """
+    It returns the prims of the paths that are cameras, in the same order
+
+    :param stage: Usd.Stage
+    :param camera_paths: Paths of the cameras
+    :return: A list of Usd.Prim
+    """
+    camera_prims = []
+    for camera_path in camera_paths:
+        camera_prim = stage.GetPrimAtPath(camera_path) if camera_path else None
+        if camera_prim and camera_prim.IsA(UsdGeom.Camera):
+            camera_prims.append(camera_prim)
+    return camera_prims
+
+
+def get_view_time_codes(settings):
+    """
+    It returns the time codes the cameras are sampled at
+
+    :param settings: OptimizerSettings with the time range and time stride
+    :return: A list of Usd.TimeCode, None for the default time code only.
+    """
+    if not settings.time_range:
+        return None
+    start, end = settings.time_range
+    return get_time_codes(start, end, settings.time_stride)
+
+
+def get_swept_time_codes(settings):
+    """
+    It returns the time codes the bounds of animated objects are swept over
+
+    :param settings: OptimizerSettings with the swept time range and time stride
+    :return: A list of Usd.TimeCode, None if the bounds are only computed at the default time code.
+    """
+    if not settings.swept_time_range:
+        return None
+    start, end = settings.swept_time_range
+    return get_time_codes(start, end, settings.time_stride)
+
+
+def get_time_codes(start, end, stride=1.0):
+    """
+    It samples a time code range with a stride, the end of the range is always included
+
+    :param start: First time code
+    :param end: Last time code
+    :param stride: Distance between two samples, in time codes
+    :return: A list of Usd.TimeCode.
+    """
+    if stride <= 0 or end < start:
+        return [Usd.TimeCode(start)]
+    samples = np.arange(start, end, stride).tolist()
+    samples.append(end)
+    return [Usd.TimeCode(sample) for sample in samples]
+
+
+def get_planes_from_matrices(matrices):
+    """
+    It extracts the six world space frustum planes from a stack of view-projection matrices
+
+    Every plane is stored as (a, b, c, d) with a unit normal pointing inside the frustum, so a point is inside
+    when ``a*x + b*y + c*z + d >= 0`` for all six planes.
+
+    :param matrices: A (V, 4, 4) array of view-projection matrices
+    :return: A (V, 6, 4) numpy array with the left, right, bottom, top, near and far planes of every view.
+    """
+    columns = np.swapaxes(np.asarray(matrices, dtype=np.float64), -1, -2)
+    planes = np.stack([
+        columns[:, 3] + columns[:, 0],
+        columns[:, 3] - columns[:, 0],
+        columns[:, 3] + columns[:, 1],
+        columns[:, 3] - columns[:, 1],
+        columns[:, 3] + columns[:, 2],
+        columns[:, 3] - columns[:, 2],
+    ], axis=1)
+    planes /= np.linalg.norm(planes[:, :, :3], axis=2)[:, :, np.newaxis]
+    return planes
+
+
+def get_frustum_planes(frustum):
+    """
+    It extracts the six world space planes of the frustum from its view-projection matrix
+
+    :param frustum: Gf.Frustum
+    :return: A (6, 4) numpy array with the left, right, bottom, top, near and far planes.
+    """
+    return get_planes_from_matrices([get_view_projection_matrix(frustum)])[0]
+
+
+def get_frustums_planes(frustums):
+    """
+    It extracts the planes of all frustums at once from their stacked view-projection matrices
+
+    :param frustums: A list of Gf.Frustum
+    :return: A (V, 6, 4) numpy array.
+    """
+    return get_planes_from_matrices([get_view_projection_matrix(frustum) for frustum in frustums])
+
+
+def classify_boxes(planes, mins, maxs, return_margins=False):
+    """
+    It tests all axis aligned boxes against the frustum planes in one batch
+
+    The margin of a box is how far the planes can move before the state of the box may change, it is the smallest
+    distance between any plane and the closest or farthest point of the box along the plane normal.
+
+    :param planes: A (6, 4) array returned by get_frustum_planes, or a (V, 6, 4) stack of them
+    :param mins: A (N, 3) array with the minimum corner of every box
+    :param maxs: A (N, 3) array with the maximum corner of every box
+    :param return_margins: Also return the margin of every box
+    :return: A (N,) uint8 array with OUTSIDE, INTERSECTING or INSIDE for every box, or (V, N) for a stack. With
+        return_margins, a tuple of the states and a float array of the same shape with the margins, infinite for
+        unbounded boxes.
+    """
+    planes = np.asarray(planes, dtype=np.float64)
+    if planes.ndim == 2:
+        result = classify_boxes(planes[np.newaxis], mins, maxs, return_margins)
+        return (result[0][0], result[1][0]) if return_margins else result[0]
+    mins = np.asarray(mins, dtype=np.float64).reshape(-1, 3)
+    maxs = np.asarray(maxs, dtype=np.float64).reshape(-1, 3)
+    result = np.full((len(planes), len(mins)), INTERSECTING, dtype=np.uint8)
+    margins = np.full((len(planes), len(mins)), np.inf) if return_margins else None
+    # Unbounded boxes produce NaN distances, which fail both comparisons below and stay INTERSECTING.
+    with np.errstate(invalid="ignore"):
+        centers = (mins + maxs) * 0.5
+        extents = (maxs - mins) * 0.5
+    # Views are processed in chunks, so the (views, boxes, planes) intermediates stay within a few million values.
+    chunk = max(1, CLASSIFY_CHUNK_SIZE // max(1, len(mins) * 6))
+    for start in range(0, len(planes), chunk):
+        views = planes[start:start + chunk]
+        with np.errstate(invalid="ignore"):
+            # Signed distance of every box center to every plane, and the projected "radius" of the box on its normal.
+            distances = np.einsum("nk,vpk->vnp", centers, views[:, :, :3]) + views[:, np.newaxis, :, 3]
+            radii = np.einsum("nk,vpk->vnp", extents, np.abs(views[:, :, :3]))
+        states = result[start:start + chunk]
+        states[np.all(distances >= radii, axis=2)] = INSIDE
+        states[np.any(distances < -radii, axis=2)] = OUTSIDE
+        if return_margins:
+            view_margins = np.minimum(np.abs(distances - radii), np.abs(distances + radii)).min(axis=2)
+            view_margins[np.isnan(view_margins)] = np.inf
+            margins[start:start + chunk] = view_margins
+    if return_margins:
+        return result, margins
+    return result
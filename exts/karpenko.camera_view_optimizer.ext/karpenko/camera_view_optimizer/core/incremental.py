@@ -0,0 +1,875 @@
+import contextlib
+import time
+
+import numpy as np
+from pxr import Sdf, Tf, Usd, UsdGeom
+
+from .bounds import SceneBounds
+from .cache import find_changed_roots, get_cache_header, is_mapped, read_cache, write_cache
+from .coverage import get_distance_limits, get_view_pixel_scales
+from .frustum import OUTSIDE, classify_boxes, get_frustums_planes, get_swept_time_codes, get_view_frustums
+from .namespace import get_root_paths
+from .report import OptimizationReport, get_boxes_behind, get_decision_reasons
+from .rules import HIDE, SHOW, compile_rules
+from .settings import are_lights_exempt
+from .snapshot import (DIRTY_FLAG, HIDDEN_FLAG, HIDE_FLAG, INVISIBLE_FLAG, SHOW_FLAG, VISIBILITY_DIRTY_FLAG, PathTable,
+                       TypeTable, get_flag, set_flag)
+from .traversal import PrimTraversal, get_base_prim, is_invisible
+
+# Number of prims whose bounds are computed, and of boxes that are tested, between two steps of iter_update().
+BOUNDS_CHUNK_SIZE = 2000
+TEST_CHUNK_SIZE = 50000
+
+# Per-prim arrays of the snapshot, one value per prim, and per-view arrays, one row per view.
+PRIM_FIELDS = ("_type_ids", "_flags", "_depths", "_mins", "_maxs")
+VIEW_FIELDS = ("_states", "_is_distant", "_margins", "_distance_slack", "_loose_states", "_loose_is_distant")
+
+
+class _SnapshotExpired(Exception):
+    """
+    Raised when the stage is resynced while a subtree is being added to the snapshot over several steps
+    """
+
+
+class IncrementalOptimizer:
+    """
+    Keeps the scene snapshot and the results of the last optimize pass, so the next pass only re-tests what changed
+
+    The snapshot holds the world bounds of every prim under the base prim. It listens to Usd.Notice.ObjectsChanged:
+    prims that were added, removed or renamed are traversed again, prims whose properties changed get new bounds
+    (with their descendants if a transform changed) and the bounds of their ancestors are rebuilt from their
+    children. Visibility changes, like the ones the optimizer writes itself, don't invalidate anything, the
+    visibility of the prims is only read again when it is asked for.
+
+    The snapshot is made of arrays with a value per prim: the paths are interned in a PathTable, the types in a
+    TypeTable, and the decisions and the visibility are bits of one byte per prim. It can be brought up to date
+    without cameras with refresh(), so listing the objects of the stage reads it instead of traversing the stage.
+    It can be saved to a cache file with save_cache() and read back with load_cache() in another session, where only
+    the subtrees of the layers that changed in the meantime are traversed again.
+
+    Every prim keeps the margin its frustum and distance tests had. When the cameras move, the margins are reduced
+    by how far the planes and the camera positions have moved, and only prims whose margin is used up, which are
+    the ones close to the frustum boundary or to the max distance, are tested again.
+
+    The prims are decided one by one, the same way as HierarchicalCuller.get_prim_reason, and only the top-most
+    hidden prims are returned, so the result hides the same prims as a full pass. Occlusion culling is not
+    supported, the full pass should be used for it.
+
+    With hysteresis, a visible prim is hidden only once it is that far outside of the frustums (or beyond the max
+    distance), and a hidden prim is shown as soon as it enters them, so prims on the edge don't flicker while the
+    cameras move a little.
+
+    The work can be spread over several steps with iter_update(), for example one step per frame.
+
+    Args:
+        stage (Usd.Stage): The stage to optimize, it is listened to until revoke() is called.
+        hysteresis (float): Distance a visible prim has to be outside of the frustums to be hidden.
+    """
+
+    def __init__(self, stage, hysteresis=0.0):
+        self.stage = stage
+        self.hysteresis = hysteresis
+        self.scene_bounds = SceneBounds()
+        self.types = TypeTable()
+        self._listener = Tf.Notice.Register(Usd.Notice.ObjectsChanged, self._on_objects_changed, stage)
+        self._resynced_paths = set()
+        self._changed_paths = set()
+        self._moved_paths = set()
+        self._visibility_paths = set()
+        self._is_updating = False
+        self._last_result = (np.zeros(0, dtype=np.int64), [])
+        self._base_path = None
+        self._settings_key = None
+        self._rules = None
+        self._planes = None
+        self._positions = None
+        self._pixel_scales = None
+        self._clear_snapshot()
+        # Report of the running update, the phases of the snapshot and of the tests are recorded to it.
+        self.report = OptimizationReport()
+        # Bumped every time the snapshot changes, so it is only saved to the cache when it has to.
+        self.revision = 0
+        # Counters of the last update() call.
+        self.retested_count = 0
+        self.invalidated_count = 0
+
+    def revoke(self):
+        """
+        It stops listening to the stage
+        """
+        if self._listener is not None:
+            self._listener.Revoke()
+            self._listener = None
+
+    def reset(self):
+        """
+        It drops the snapshot and the results, the next update() traverses the whole stage again
+        """
+        self._base_path = None
+        self._planes = None
+        self._clear_snapshot()
+
+    def _clear_snapshot(self):
+        """
+        It drops the snapshot of the prims
+        """
+        self.paths = PathTable()
+        self._type_ids = np.zeros(0, dtype=np.int16)
+        self._flags = np.zeros(0, dtype=np.uint8)
+        self._depths = np.zeros(0, dtype=np.int32)
+        self._mins = np.zeros((0, 3))
+        self._maxs = np.zeros((0, 3))
+        self._last_result = (np.zeros(0, dtype=np.int64), [])
+        for name in VIEW_FIELDS:
+            setattr(self, name, None)
+
+    def _on_objects_changed(self, notice, sender):
+        """
+        It records which prims have to be traversed again or need new bounds, the work is done by the next update()
+
+        :param notice: Usd.Notice.ObjectsChanged
+        :param sender: The stage
+        """
+        for path in notice.GetResyncedPaths():
+            if path.IsPrimPath() or path.IsAbsoluteRootPath():
+                self._resynced_paths.add(path)
+            elif path.IsPropertyPath():
+                self._on_property_changed(path)
+        for path in notice.GetChangedInfoOnlyPaths():
+            if path.IsPropertyPath():
+                self._on_property_changed(path)
+
+    def _on_property_changed(self, path):
+        """
+        It records the prim of a changed property
+
+        :param path: Sdf.Path of the property
+        """
+        name = path.name
+        if name == UsdGeom.Tokens.visibility:
+            self._visibility_paths.add(path.GetPrimPath())
+            return
+        if name.startswith("xformOp"):
+            self._moved_paths.add(path.GetPrimPath())
+        else:
+            self._changed_paths.add(path.GetPrimPath())
+
+    def has_stage_changes(self):
+        """
+        It checks if the stage was edited in a way that matters to the optimizer since the last update
+
+        :return: True if the next update has stage changes to apply.
+        """
+        return bool(self._resynced_paths or self._changed_paths or self._moved_paths)
+
+    def update(self, camera_paths, settings):
+        """
+        It brings the snapshot up to date and returns the paths of prims that should be hidden
+
+        :param camera_paths: Paths of the cameras to scan from
+        :param settings: OptimizerSettings of the pass
+        :return: A list of Sdf.Path, the top-most hidden prims.
+        """
+        steps = self.iter_update(camera_paths, settings)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+
+    def iter_update(self, camera_paths, settings, progress=None, report=None):
+        """
+        It does the same as update(), in small steps: the generator yields between chunks of work
+
+        The stage can be edited between two steps, the edits are applied by the next update. If the generator is
+        closed before the end, the snapshot is dropped when it may be incomplete.
+
+        :param camera_paths: Paths of the cameras to scan from
+        :param settings: OptimizerSettings of the pass
+        :param progress: JobProgress to report the scanned and hidden prims to
+        :param report: OptimizationReport to record the phases and the decisions to. The decisions are only counted
+            when a report is given, as it takes another pass over the prims.
+        :return: A generator, its return value is the list of Sdf.Path update() returns.
+        """
+        with self._updating():
+            return (yield from self._iter_update(camera_paths, settings, progress, report))
+
+    def _iter_update(self, camera_paths, settings, progress=None, report=None):
+        """
+        It does the work of iter_update()
+
+        :param camera_paths: Paths of the cameras to scan from
+        :param settings: OptimizerSettings of the pass
+        :param progress: JobProgress to report the scanned and hidden prims to
+        :param report: OptimizationReport to record the phases and the decisions to
+        :return: A generator, its return value is the list of Sdf.Path update() returns.
+        """
+        self.report = report if report is not None else OptimizationReport()
+        self.retested_count = 0
+        self.invalidated_count = 0
+        base_prim = get_base_prim(self.stage, settings.base_path)
+        frustums = get_view_frustums(self.stage, camera_paths, settings)
+        if not base_prim or not frustums:
+            return []
+        time_codes = get_swept_time_codes(settings) or []
+        if time_codes != self.scene_bounds.time_codes:
+            # The bounds of the snapshot were swept over other time codes.
+            self.scene_bounds = SceneBounds(time_codes=time_codes)
+            self.reset()
+
+        yield from self._iter_refresh(base_prim, progress)
+        self._update_flags(settings)
+        pixel_scales = get_view_pixel_scales(self.stage, camera_paths, settings)
+        with self.report.measure("culling"):
+            indices = np.flatnonzero(self._update_views(frustums, pixel_scales, settings))
+        if progress is not None:
+            progress.total = len(self.paths)
+        for start in range(0, len(indices), TEST_CHUNK_SIZE):
+            chunk = indices[start:start + TEST_CHUNK_SIZE]
+            with self.report.measure("culling", len(chunk)):
+                self._test(chunk, settings)
+            if progress is not None:
+                # Prims whose margin is left don't have to be tested, they count as scanned.
+                progress.done = len(self.paths) - len(indices) + start + len(chunk)
+            yield
+        self.retested_count = len(indices)
+        set_flag(self._flags, DIRTY_FLAG, False)
+
+        with self.report.measure("culling"):
+            is_hidden = self._decide(settings)
+            if self.hysteresis:
+                # Hidden prims stay hidden until they are visible, visible ones are hidden once they are far enough.
+                is_hidden = (get_flag(self._flags, HIDDEN_FLAG) & is_hidden) | self._decide(settings, loose=True)
+            set_flag(self._flags, HIDDEN_FLAG, is_hidden)
+            is_top_most = ~self._get_under_hidden(is_hidden)
+            hidden_paths = self._get_result_paths(np.flatnonzero(is_hidden & is_top_most))
+        if report is not None:
+            with report.measure("decisions", int(is_top_most.sum())):
+                report.count_decisions(self._get_reasons(settings, np.flatnonzero(is_top_most)))
+            report.count("retested", self.retested_count)
+            report.count("invalidated", self.invalidated_count)
+        if progress is not None:
+            progress.done = len(self.paths)
+            progress.hidden = len(hidden_paths)
+        return hidden_paths
+
+    @property
+    def is_updating(self):
+        """
+        True while an update or a refresh is running, between two of its steps
+        """
+        return self._is_updating
+
+    @contextlib.contextmanager
+    def _updating(self):
+        """
+        It marks the snapshot as being updated, a second update can't start before the first one is done
+        """
+        if self._is_updating:
+            raise RuntimeError("The snapshot is already being updated")
+        self._is_updating = True
+        try:
+            yield
+        finally:
+            self._is_updating = False
+
+    def refresh(self, base_prim):
+        """
+        It brings the snapshot up to date with the stage, without testing the prims against cameras
+
+        :param base_prim: The prim to search for objects under
+        """
+        for _ in self.iter_refresh(base_prim):
+            pass
+
+    def iter_refresh(self, base_prim, progress=None):
+        """
+        It does the same as refresh(), in small steps: the generator yields between chunks of work
+
+        :param base_prim: The prim to search for objects under
+        :param progress: JobProgress to report the traversed prims to
+        :return: A generator that yields between chunks of work.
+        """
+        with self._updating():
+            yield from self._iter_refresh(base_prim, progress)
+
+    def _iter_refresh(self, base_prim, progress=None):
+        """
+        It does the work of iter_refresh()
+
+        :param base_prim: The prim to search for objects under
+        :param progress: JobProgress to report the traversed prims to
+        :return: A generator that yields between chunks of work.
+        """
+        while True:
+            try:
+                yield from self._update_snapshot(base_prim, progress)
+                return
+            except _SnapshotExpired:
+                # The prims that were being added may not exist anymore, so the snapshot is taken again.
+                self.reset()
+            except GeneratorExit:
+                self.reset()
+                raise
+
+    def get_object_paths(self, only_visible=False):
+        """
+        It returns the paths of the prims of the snapshot, parents before their children
+
+        :param only_visible: Skip the invisible prims and everything under them
+        :return: A list of Sdf.Path.
+        """
+        if not only_visible:
+            return self.paths.get_paths(range(len(self.paths)))
+        invisible = self.get_invisible()
+        return self.paths.get_paths(np.flatnonzero(~(invisible | self._get_under_hidden(invisible))))
+
+    def get_invisible_paths(self, top_most=False):
+        """
+        It returns the paths of the prims of the snapshot whose own visibility is invisible
+
+        :param top_most: Skip the prims under another invisible prim
+        :return: A list of Sdf.Path.
+        """
+        invisible = self.get_invisible()
+        if top_most:
+            invisible &= ~self._get_under_hidden(invisible)
+        return self.paths.get_paths(np.flatnonzero(invisible))
+
+    def get_invisible(self):
+        """
+        It returns which prims of the snapshot have their own visibility set to invisible, the visibility of the prims
+        that changed since the last call is read from the stage
+
+        :return: A (N,) bool array.
+        """
+        stale = np.flatnonzero(get_flag(self._flags, VISIBILITY_DIRTY_FLAG))
+        if len(stale):
+            prims = [self.stage.GetPrimAtPath(path) for path in self.paths.get_paths(stale)]
+            set_flag(self._flags, INVISIBLE_FLAG, [bool(prim) and is_invisible(prim) for prim in prims], stale)
+            set_flag(self._flags, VISIBILITY_DIRTY_FLAG, False, stale)
+        return get_flag(self._flags, INVISIBLE_FLAG)
+
+    def get_stats(self):
+        """
+        It describes the snapshot, for the window
+
+        :return: A dict with the number of prims, the number of prims of every type and the memory taken by the
+            arrays and the tables of the snapshot, in bytes.
+        """
+        arrays = [getattr(self, name) for name in PRIM_FIELDS + VIEW_FIELDS]
+        return {
+            "prims": len(self.paths),
+            "types": self.types.count(self._type_ids),
+            "bytes": self.paths.nbytes + sum(array.nbytes for array in arrays if array is not None),
+        }
+
+    def save_cache(self, path, skip_layer=None):
+        """
+        It saves the snapshot to a cache file, with what identifies the layers it was taken from
+
+        :param path: File path of the cache
+        :param skip_layer: The optimization layer, what it hides is not part of the snapshot
+        :return: True if the snapshot was saved, False if there is none or it is being updated.
+        """
+        if self._base_path is None or self._is_updating or self.has_stage_changes():
+            return False
+        # The arrays loaded from the cache file are still mapped from it, they are copied before it is replaced.
+        if any(is_mapped(array) for array in self.paths.get_arrays().values()):
+            self.paths.copy_arrays()
+        for name in PRIM_FIELDS:
+            if is_mapped(getattr(self, name)):
+                setattr(self, name, np.array(getattr(self, name)))
+        header = get_cache_header(self.stage, self._base_path, skip_layer)
+        header["type_names"] = self.types.type_names
+        header["time_codes"] = [time_code.GetValue() for time_code in self.scene_bounds.time_codes]
+        arrays = self.paths.get_arrays()
+        arrays.update({name.lstrip("_"): getattr(self, name) for name in PRIM_FIELDS if name != "_flags"})
+        write_cache(path, header, arrays)
+        return True
+
+    def load_cache(self, path, skip_layer=None):
+        """
+        It replaces the snapshot with the one of a cache file, the subtrees that changed since it was saved are
+        traversed again by the next update
+
+        The arrays are mapped from the file, so loading takes time in the number of changed subtrees, not of prims.
+
+        :param path: File path of the cache
+        :param skip_layer: The optimization layer
+        :return: True if the cache was loaded, False if it is missing, damaged, or the changes of the stage can't be
+            located.
+        """
+        if self._is_updating:
+            return False
+        cache = read_cache(path)
+        if cache is None:
+            return False
+        header, arrays = cache
+        base_path = Sdf.Path(header["base_path"])
+        base_prim = self.stage.GetPrimAtPath(base_path)
+        changed_roots = find_changed_roots(self.stage, header, skip_layer)
+        if not base_prim or not base_prim.IsActive() or changed_roots is None:
+            return False
+        self.reset()
+        self.scene_bounds = SceneBounds(time_codes=[Usd.TimeCode(value) for value in header.get("time_codes", ())])
+        self.paths = PathTable(base_path)
+        self.paths.set_arrays(arrays)
+        # The type ids of the cache are mapped to the ones of this session.
+        self._type_ids = self.types.intern(header["type_names"])[arrays["type_ids"]]
+        self._flags = np.full(len(self.paths), DIRTY_FLAG | VISIBILITY_DIRTY_FLAG, dtype=np.uint8)
+        self._depths, self._mins, self._maxs = arrays["depths"], arrays["mins"], arrays["maxs"]
+        self._base_path = base_path
+        self._resynced_paths.update(changed_roots)
+        self.revision += 1
+        return True
+
+    def _update_snapshot(self, base_prim, progress=None):
+        """
+        It applies the recorded stage changes to the snapshot, or takes a new one
+
+        :param base_prim: The prim to search for objects under
+        :param progress: JobProgress to report the traversed prims to
+        :return: A generator that yields between chunks of work.
+        """
+        resynced_paths = get_root_paths(self._resynced_paths)
+        changed_paths, moved_paths = self._changed_paths, self._moved_paths
+        self._resynced_paths, self._changed_paths, self._moved_paths = set(), set(), set()
+
+        base_path = base_prim.GetPath()
+        if base_path != self._base_path or any(base_path.HasPrefix(path) for path in resynced_paths):
+            self.reset()
+            self._visibility_paths = set()
+            self.paths = PathTable(base_path)
+            yield from self._append_subtree(base_prim, include_root=False, progress=progress)
+            self._base_path = base_path
+            self.invalidated_count = len(self.paths)
+            self.revision += 1
+            return
+
+        if self._visibility_paths:
+            # The visibility of the prims is only read again when it is asked for.
+            set_flag(self._flags, VISIBILITY_DIRTY_FLAG, True, self.paths.get_mask(self._visibility_paths))
+            self._visibility_paths = set()
+        if not resynced_paths and not changed_paths and not moved_paths:
+            return
+        self.scene_bounds.clear()
+        resynced_paths = [path for path in resynced_paths if path.HasPrefix(base_path)]
+        removed_parents = self._remove_subtrees(resynced_paths)
+        appended = np.zeros(len(self.paths), dtype=bool)
+        for path in resynced_paths:
+            prim = self.stage.GetPrimAtPath(path)
+            if prim and prim.IsActive():
+                start = len(self.paths)
+                yield from self._append_subtree(prim, include_root=True, progress=progress)
+                appended = np.concatenate([appended, np.ones(len(self.paths) - start, dtype=bool)])
+
+        # Invalidating a prim whose path hash collides with a changed path only costs its bounds.
+        stale = self.paths.get_mask(changed_paths)
+        moved = self.paths.get_mask(moved_paths)
+        # A moved prim moves all of its descendants.
+        parents = self.paths.parents
+        for level in self._iter_levels():
+            moved[level] |= moved[parents[level]]
+        stale |= moved & ~appended
+        stale_indices = np.flatnonzero(stale)
+        if self._rules:
+            # Rules can match attributes, so the prims whose properties changed are matched again.
+            prims = [self.stage.GetPrimAtPath(path) for path in self.paths.get_paths(stale_indices)]
+            self._set_rule_flags(stale_indices, *self._match_all_rules(prims))
+        for start in range(0, len(stale_indices), BOUNDS_CHUNK_SIZE):
+            chunk = stale_indices[start:start + BOUNDS_CHUNK_SIZE]
+            with self.report.measure("bounds", len(chunk)):
+                prims = [self.stage.GetPrimAtPath(path) for path in self.paths.get_paths(chunk)]
+                self._mins[chunk], self._maxs[chunk] = self.scene_bounds.compute_world_bounds(prims)
+            yield
+
+        rebuilt = self._get_ancestors(np.flatnonzero(stale | appended))
+        removed_parents = np.array(removed_parents, dtype=np.int64)
+        rebuilt[removed_parents] = True
+        rebuilt |= self._get_ancestors(removed_parents)
+        with self.report.measure("bounds", int(rebuilt.sum())):
+            self._rebuild_bounds(rebuilt)
+        set_flag(self._flags, DIRTY_FLAG, True, stale | appended | rebuilt)
+        self.invalidated_count = int(get_flag(self._flags, DIRTY_FLAG).sum())
+        self.revision += 1
+
+    def _iter_levels(self):
+        """
+        It yields the indices of the prims that have a parent in the snapshot, one depth at a time, top down
+
+        :return: A generator of index arrays.
+        """
+        for depth in range(1, int(self._depths.max(initial=0)) + 1):
+            yield np.flatnonzero((self._depths == depth) & (self.paths.parents >= 0))
+
+    def _append_subtree(self, root_prim, include_root, progress=None):
+        """
+        It adds the prims of a subtree to the snapshot, with their bounds, and marks them dirty
+
+        Nothing is added until the whole subtree was traversed, and if the stage is resynced in the meantime,
+        _SnapshotExpired is raised.
+
+        :param root_prim: Root of the subtree
+        :param include_root: Add the root prim itself
+        :param progress: JobProgress to report the traversed prims to
+        :return: A generator that yields between chunks of work.
+        """
+        prims = []
+        bounds = []
+        chunk = []
+        traversal = PrimTraversal(root_prim, include_root=include_root, skip_non_imageable=True)
+        # The traversal is measured between the steps, apart from the bounds of its chunks.
+        start_time = time.perf_counter()
+        for prim in traversal:
+            chunk.append(prim)
+            if prim.IsA(UsdGeom.PointInstancer):
+                # Prototypes are only drawn through their instancer, hiding them would hide all of its instances.
+                traversal.prune()
+            if len(chunk) == BOUNDS_CHUNK_SIZE:
+                self.report.add("traversal", time.perf_counter() - start_time, len(chunk))
+                with self.report.measure("bounds", len(chunk)):
+                    bounds.append(self.scene_bounds.compute_world_bounds(chunk))
+                prims.extend(chunk)
+                chunk = []
+                if progress is not None:
+                    progress.done = len(prims)
+                yield
+                if self._resynced_paths:
+                    raise _SnapshotExpired()
+                start_time = time.perf_counter()
+        self.report.add("traversal", time.perf_counter() - start_time, len(chunk))
+        if chunk:
+            with self.report.measure("bounds", len(chunk)):
+                bounds.append(self.scene_bounds.compute_world_bounds(chunk))
+            prims.extend(chunk)
+        if not prims:
+            return
+
+        start = len(self.paths)
+        new_paths = [prim.GetPath() for prim in prims]
+        parents = np.empty(len(prims), dtype=np.int32)
+        depths = np.empty(len(prims), dtype=np.int32)
+        # The traversal is depth first, so the closest ancestor in the snapshot is on the stack of the prims above
+        # the current one, and its depth is always known.
+        root_path = root_prim.GetPath()
+        root_parent = self.paths.find(root_path) if not include_root else -1
+        if root_parent < 0:
+            root_parent = self.paths.find_ancestor(root_path)
+        stack = [(root_path, root_parent)]
+        for offset, path in enumerate(new_paths):
+            while len(stack) > 1 and not path.HasPrefix(stack[-1][0]):
+                stack.pop()
+            parent = stack[-1][1]
+            parents[offset] = parent
+            if parent < 0:
+                depths[offset] = 0
+            elif parent < start:
+                depths[offset] = self._depths[parent] + 1
+            else:
+                depths[offset] = depths[parent - start] + 1
+            stack.append((path, start + offset))
+        self.paths.append(new_paths, parents)
+        show, hide = self._match_all_rules(prims)
+        flags = np.full(len(prims), DIRTY_FLAG | VISIBILITY_DIRTY_FLAG, dtype=np.uint8)
+        set_flag(flags, SHOW_FLAG, show)
+        set_flag(flags, HIDE_FLAG, hide)
+
+        new_fields = {
+            "_type_ids": self.types.intern([prim.GetTypeName() for prim in prims]),
+            "_flags": flags,
+            "_depths": depths,
+            "_mins": np.concatenate([chunk_bounds[0] for chunk_bounds in bounds]),
+            "_maxs": np.concatenate([chunk_bounds[1] for chunk_bounds in bounds]),
+        }
+        for name in PRIM_FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), new_fields[name]]))
+        for name in VIEW_FIELDS:
+            values = getattr(self, name)
+            if values is not None:
+                padding = np.zeros((len(values), len(prims)), dtype=values.dtype)
+                setattr(self, name, np.concatenate([values, padding], axis=1))
+
+    def _remove_subtrees(self, root_paths):
+        """
+        It removes the prims of the subtrees from the snapshot
+
+        :param root_paths: Paths of the subtree roots
+        :return: A list with the indices of the closest remaining ancestors of the removed subtrees.
+        """
+        if not root_paths:
+            return []
+        keep = ~self.paths.get_subtree_mask(root_paths)
+        # The closest ancestor of a removed subtree is never removed, the roots don't overlap.
+        parents = {self.paths.find_ancestor(root_path) for root_path in root_paths}
+        parents.discard(-1)
+        if keep.all():
+            return list(parents)
+        new_indices = self.paths.compact(keep)
+        self._last_result = (np.zeros(0, dtype=np.int64), [])
+        for name in PRIM_FIELDS:
+            setattr(self, name, getattr(self, name)[keep])
+        for name in VIEW_FIELDS:
+            if getattr(self, name) is not None:
+                setattr(self, name, getattr(self, name)[:, keep])
+        return [int(new_indices[parent]) for parent in parents]
+
+    def _get_ancestors(self, indices):
+        """
+        It returns which prims are ancestors of the prims in the snapshot
+
+        :param indices: Indices of the prims
+        :return: A (N,) bool array.
+        """
+        parents = self.paths.parents
+        ancestors = np.zeros(len(self.paths), dtype=bool)
+        current = parents[indices]
+        while len(current):
+            current = current[current >= 0]
+            current = current[~ancestors[current]]
+            ancestors[current] = True
+            current = parents[current]
+        return ancestors
+
+    def _rebuild_bounds(self, rebuilt):
+        """
+        It rebuilds the bounds of groups from the bounds of their children, bottom up, instead of from the stage
+
+        :param rebuilt: A (N,) bool array of the prims to rebuild
+        """
+        indices = np.flatnonzero(rebuilt)
+        if not len(indices):
+            return
+        parents = self.paths.parents
+        is_gprim = self.types.is_gprim[self._type_ids[indices]]
+        groups = indices[~is_gprim]
+        self._mins[groups] = np.inf
+        self._maxs[groups] = -np.inf
+        is_group = np.zeros(len(self.paths), dtype=bool)
+        is_group[groups] = True
+        for level in reversed(list(self._iter_levels())):
+            children = level[is_group[parents[level]]]
+            np.minimum.at(self._mins, parents[children], self._mins[children])
+            np.maximum.at(self._maxs, parents[children], self._maxs[children])
+        # Gprims have geometry of their own, and groups without children left get the bounds USD gives them.
+        computed = indices[is_gprim | np.any(self._mins[indices] > self._maxs[indices], axis=1)]
+        if len(computed):
+            prims = [self.stage.GetPrimAtPath(path) for path in self.paths.get_paths(computed)]
+            self._mins[computed], self._maxs[computed] = self.scene_bounds.compute_world_bounds(prims)
+
+    def _update_flags(self, settings):
+        """
+        It matches the prims against the filter rules of the settings, when they changed
+
+        :param settings: OptimizerSettings of the pass
+        """
+        rules = compile_rules(settings)
+        if self._rules is not None and rules.key == self._rules.key:
+            return
+        self._rules = rules
+        if not rules:
+            self._set_rule_flags(slice(None), False, False)
+            return
+        prims = [self.stage.GetPrimAtPath(path) for path in self.paths.get_paths(range(len(self.paths)))]
+        self._set_rule_flags(slice(None), *self._match_all_rules(prims))
+
+    def _set_rule_flags(self, indices, show, hide):
+        """
+        It writes what the filter rules decided for prims to their flags
+
+        :param indices: Indices of the prims
+        :param show: A bool, or a bool array, the prims are shown by a rule
+        :param hide: A bool, or a bool array, the prims are hidden by a rule
+        """
+        set_flag(self._flags, SHOW_FLAG, show, indices)
+        set_flag(self._flags, HIDE_FLAG, hide, indices)
+
+    def _match_rules(self, prim):
+        """
+        It matches a prim against the filter rules
+
+        :param prim: Usd.Prim
+        :return: A tuple of two bools, the prim is shown by a rule and the prim is hidden by a rule.
+        """
+        action = self._rules.evaluate(prim)
+        return action == SHOW, action == HIDE
+
+    def _match_all_rules(self, prims):
+        """
+        It matches prims against the filter rules
+
+        :param prims: List of Usd.Prim, all the prims of the snapshot or the new ones
+        :return: A tuple of two (N,) bool arrays, the prims shown by a rule and the prims hidden by a rule.
+        """
+        if not self._rules:
+            # The rules are not known before the first update, or there are none, so nothing is forced.
+            return np.zeros(len(prims), dtype=bool), np.zeros(len(prims), dtype=bool)
+        with self.report.measure("rules", len(prims)):
+            matches = np.array([self._match_rules(prim) for prim in prims], dtype=bool).reshape(-1, 2)
+        return matches[:, 0], matches[:, 1]
+
+    def _update_views(self, frustums, pixel_scales, settings):
+        """
+        It moves the views to the new frustums and returns which prims have to be tested again
+
+        :param frustums: List of Gf.Frustum
+        :param pixel_scales: A (V,) array with the focal length in pixels of every view
+        :param settings: OptimizerSettings of the pass
+        :return: A (N,) bool array.
+        """
+        planes = get_frustums_planes(frustums)
+        positions = np.array([frustum.position for frustum in frustums], dtype=np.float64)
+        self._pixel_scales = pixel_scales
+        # The distance limits of the pixel coverage only change with the intrinsics of the cameras.
+        coverage_key = (settings.min_pixel_coverage, pixel_scales.tobytes() if settings.min_pixel_coverage > 0 else b"")
+        settings_key = (settings.max_distance, self.hysteresis, coverage_key)
+        count = len(self.paths)
+        if (
+            self._planes is None
+            or self._states is None
+            or planes.shape != self._planes.shape
+            or settings_key != self._settings_key
+        ):
+            self._planes, self._positions, self._settings_key = planes, positions, settings_key
+            views = len(planes)
+            self._states = np.zeros((views, count), dtype=np.uint8)
+            self._is_distant = np.zeros((views, count), dtype=bool)
+            self._margins = np.zeros((views, count))
+            self._distance_slack = np.zeros((views, count))
+            if self.hysteresis:
+                self._loose_states = np.zeros((views, count), dtype=np.uint8)
+                self._loose_is_distant = np.zeros((views, count), dtype=bool)
+            return np.ones(count, dtype=bool)
+
+        # How much the signed distance of any point of a box to any plane can have changed: |dn.x + dd|.
+        normal_shift = np.linalg.norm(planes[:, :, :3] - self._planes[:, :, :3], axis=2).max(axis=1)
+        offset_shift = np.abs(planes[:, :, 3] - self._planes[:, :, 3]).max(axis=1)
+        with np.errstate(invalid="ignore"):
+            reach = np.linalg.norm((self._mins + self._maxs) * 0.5, axis=1) + np.linalg.norm(
+                (self._maxs - self._mins) * 0.5, axis=1
+            )
+        reach[~np.isfinite(reach)] = 0.0
+        self._margins -= normal_shift[:, np.newaxis] * reach + offset_shift[:, np.newaxis]
+        self._distance_slack -= np.linalg.norm(positions - self._positions, axis=1)[:, np.newaxis]
+        self._planes, self._positions = planes, positions
+        is_dirty = get_flag(self._flags, DIRTY_FLAG)
+        return is_dirty | np.any(self._margins <= 0.0, axis=0) | np.any(self._distance_slack <= 0.0, axis=0)
+
+    def _test(self, indices, settings):
+        """
+        It tests the prims against the current views and resets their margins
+
+        :param indices: Indices of the prims to test
+        :param settings: OptimizerSettings of the pass
+        """
+        mins, maxs = self._mins[indices], self._maxs[indices]
+        states, margins = classify_boxes(self._planes, mins, maxs, return_margins=True)
+        with np.errstate(invalid="ignore"):
+            centers = (mins + maxs) * 0.5
+            distances = np.linalg.norm(centers[np.newaxis] - self._positions[:, np.newaxis], axis=2)
+            limits = get_distance_limits(settings, self._pixel_scales, mins, maxs)
+            slack = np.abs(distances - limits)
+        self._states[:, indices] = states
+        self._is_distant[:, indices] = distances > limits
+        if self.hysteresis:
+            # The planes have unit normals pointing inside, so the frustums grow by the hysteresis.
+            loose_planes = self._planes.copy()
+            loose_planes[:, :, 3] += self.hysteresis
+            loose_states, loose_margins = classify_boxes(loose_planes, mins, maxs, return_margins=True)
+            loose_distance = limits + self.hysteresis
+            self._loose_states[:, indices] = loose_states
+            self._loose_is_distant[:, indices] = distances > loose_distance
+            margins = np.minimum(margins, loose_margins)
+            with np.errstate(invalid="ignore"):
+                slack = np.minimum(slack, np.abs(distances - loose_distance))
+        slack[np.isnan(slack)] = np.inf
+        self._margins[:, indices] = margins
+        self._distance_slack[:, indices] = slack
+
+    def _decide(self, settings, loose=False):
+        """
+        It decides which prims should be hidden, the same way as HierarchicalCuller.get_prim_reason
+
+        :param settings: OptimizerSettings of the pass
+        :param loose: Decide with the frustums and the max distance grown by the hysteresis
+        :return: A (N,) bool array.
+        """
+        states, is_distant = self._states, self._is_distant
+        if loose and self.hysteresis:
+            states, is_distant = self._loose_states, self._loose_is_distant
+        is_visible = (states != OUTSIDE) & ~is_distant
+        if settings.max_size != 0:
+            with np.errstate(invalid="ignore"):
+                is_big = np.any(self._maxs - self._mins > settings.max_size, axis=1)
+            if settings.ignore_size_distant_objects:
+                is_visible |= is_big & ~is_distant
+            else:
+                is_visible |= is_big
+        is_visible = is_visible.any(axis=0)
+        show = get_flag(self._flags, SHOW_FLAG)
+        is_visible[show] = True
+        is_visible[get_flag(self._flags, HIDE_FLAG) & ~show] = False
+        is_kept = show
+        if are_lights_exempt(settings):
+            is_kept = is_kept | self.types.is_light[self._type_ids]
+        # Hiding an ancestor of a kept prim would hide it too.
+        return ~is_visible & ~is_kept & ~self._get_ancestors(np.flatnonzero(is_kept))
+
+    def _get_result_paths(self, indices):
+        """
+        It returns the paths of the hidden prims, the ones the last update returned are not built again
+
+        :param indices: Sorted indices of the hidden prims
+        :return: A list of Sdf.Path.
+        """
+        last_indices, last_paths = self._last_result
+        paths = [None] * len(indices)
+        is_known = np.zeros(len(indices), dtype=bool)
+        if len(last_indices):
+            positions = np.minimum(np.searchsorted(last_indices, indices), len(last_indices) - 1)
+            is_known = last_indices[positions] == indices
+            for offset, position in zip(np.flatnonzero(is_known).tolist(), positions[is_known].tolist()):
+                paths[offset] = last_paths[position]
+        new_offsets = np.flatnonzero(~is_known)
+        for offset, path in zip(new_offsets.tolist(), self.paths.get_paths(indices[new_offsets])):
+            paths[offset] = path
+        self._last_result = (indices, paths)
+        return paths
+
+    def _get_under_hidden(self, is_hidden):
+        """
+        It returns which prims have a hidden ancestor
+
+        :param is_hidden: A (N,) bool array
+        :return: A (N,) bool array.
+        """
+        under_hidden = np.zeros(len(self.paths), dtype=bool)
+        for level in self._iter_levels():
+            parents = self.paths.parents[level]
+            under_hidden[level] = is_hidden[parents] | under_hidden[parents]
+        return under_hidden
+
+    def _get_reasons(self, settings, indices):
+        """
+        It explains the decisions of the prims from their last tests, like HierarchicalCuller explains its decisions
+
+        :param settings: OptimizerSettings of the pass
+        :param indices: Indices of the prims
+        :return: A (K,) array of indices in REASONS.
+        """
+        mins, maxs = self._mins[indices], self._maxs[indices]
+        flags = self._flags[indices]
+        with np.errstate(invalid="ignore"):
+            centers = (mins + maxs) * 0.5
+            distances = np.linalg.norm(centers[np.newaxis] - self._positions[:, np.newaxis], axis=2)
+            return get_decision_reasons(
+                settings,
+                self._states[:, indices],
+                self._is_distant[:, indices],
+                distances > settings.max_distance,
+                np.any(maxs - mins > settings.max_size, axis=1),
+                behind=get_boxes_behind(self._planes, mins, maxs),
+                show=get_flag(flags, SHOW_FLAG),
+                hide=get_flag(flags, HIDE_FLAG) & ~get_flag(flags, SHOW_FLAG),
+                is_light=self.types.is_light[self._type_ids[indices]],
+            )
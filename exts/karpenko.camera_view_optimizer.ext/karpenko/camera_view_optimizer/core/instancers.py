@@ -0,0 +1,197 @@
+import numpy as np
+from pxr import Usd, UsdGeom
+
+from .bounds import SceneBounds
+from .coverage import get_distance_limits, get_view_pixel_scales
+from .frustum import OUTSIDE, classify_boxes, get_frustums_planes, get_view_frustums
+from .traversal import PrimTraversal, get_base_prim
+
+
+def get_rotation_matrices(orientations):
+    """
+    It converts quaternions to rotation matrices for row vectors, the way USD applies them
+
+    :param orientations: A (N, 4) array of quaternions in the memory order of Gf quaternions: i, j, k, real
+    :return: A (N, 3, 3) array, a point ``p`` is rotated with ``p @ matrix``.
+    """
+    orientations = np.asarray(orientations, dtype=np.float64).reshape(-1, 4)
+    # Quaternions authored by hand are not always unit length.
+    lengths = np.linalg.norm(orientations, axis=1)
+    lengths[lengths == 0.0] = 1.0
+    x, y, z, w = (orientations / lengths[:, np.newaxis]).T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y + w * z), 2 * (x * z - w * y)], axis=1),
+        np.stack([2 * (x * y - w * z), 1 - 2 * (x * x + z * z), 2 * (y * z + w * x)], axis=1),
+        np.stack([2 * (x * z + w * y), 2 * (y * z - w * x), 1 - 2 * (x * x + y * y)], axis=1),
+    ], axis=1)
+
+
+def get_prototype_bounds(instancer, scene_bounds):
+    """
+    It returns the bounds of every prototype of the instancer, with the transform of the prototype root
+
+    :param instancer: UsdGeom.PointInstancer
+    :param scene_bounds: SceneBounds of the pass
+    :return: A tuple of (P, 3) arrays with the minimum and maximum corners, empty prototypes get an empty box.
+    """
+    stage = instancer.GetPrim().GetStage()
+    targets = instancer.GetPrototypesRel().GetTargets()
+    mins = np.full((len(targets), 3), np.inf)
+    maxs = np.full((len(targets), 3), -np.inf)
+    for index, target in enumerate(targets):
+        prototype = stage.GetPrimAtPath(target)
+        if not prototype:
+            continue
+        bound = scene_bounds.bbox_cache.ComputeUntransformedBound(prototype)
+        if prototype.IsA(UsdGeom.Xformable):
+            local_transform, _ = scene_bounds.xform_cache.GetLocalTransformation(prototype)
+            bound.Transform(local_transform)
+        prototype_range = bound.ComputeAlignedRange()
+        if not prototype_range.IsEmpty():
+            mins[index] = prototype_range.GetMin()
+            maxs[index] = prototype_range.GetMax()
+    return mins, maxs
+
+
+def compute_instance_bounds(instancer, scene_bounds):
+    """
+    It returns the world space axis aligned bounds of every instance of a point instancer, all at once
+
+    The positions, orientations and scales are read as arrays, and the prototype bounds are moved by the transforms
+    of the instances and of the instancer in one NumPy pass. Instances of a missing prototype get an infinite box,
+    so they are never culled.
+
+    :param instancer: UsdGeom.PointInstancer
+    :param scene_bounds: SceneBounds of the pass
+    :return: A tuple of (N, 3) arrays with the minimum and maximum corners.
+    """
+    time = scene_bounds.time
+    proto_indices = np.asarray(instancer.GetProtoIndicesAttr().Get(time) or [], dtype=np.int64)
+    count = len(proto_indices)
+    positions = np.asarray(instancer.GetPositionsAttr().Get(time) or np.zeros((count, 3)), dtype=np.float64)
+    orientations = instancer.GetOrientationsAttr().Get(time)
+    scales = instancer.GetScalesAttr().Get(time)
+    if len(positions) != count:
+        count = min(count, len(positions))
+        proto_indices, positions = proto_indices[:count], positions[:count]
+
+    # The transform of every instance, for row vectors: scale, then rotate, then translate.
+    linear = np.broadcast_to(np.eye(3), (count, 3, 3)).copy()
+    if scales is not None and len(scales) >= count:
+        linear *= np.asarray(scales, dtype=np.float64)[:count, :, np.newaxis]
+    if orientations is not None and len(orientations) >= count:
+        linear = linear @ get_rotation_matrices(np.asarray(orientations)[:count])
+    world = np.array(scene_bounds.get_world_transform(instancer.GetPrim()), dtype=np.float64)
+    linear = linear @ world[:3, :3]
+    translations = positions @ world[:3, :3] + world[3, :3]
+
+    prototype_mins, prototype_maxs = get_prototype_bounds(instancer, scene_bounds)
+    valid = (proto_indices >= 0) & (proto_indices < len(prototype_mins))
+    indices = np.where(valid, proto_indices, 0)
+    with np.errstate(invalid="ignore"):
+        centers = (prototype_mins + prototype_maxs) * 0.5
+        extents = (prototype_maxs - prototype_mins) * 0.5
+    if not len(prototype_mins):
+        centers = extents = np.zeros((1, 3))
+    with np.errstate(invalid="ignore"):
+        world_centers = np.einsum("nk,nkj->nj", centers[indices], linear) + translations
+        world_extents = np.einsum("nk,nkj->nj", extents[indices], np.abs(linear))
+        mins = world_centers - world_extents
+        maxs = world_centers + world_extents
+    # Empty prototypes show nothing and are treated as a point at the instance position.
+    empty = ~np.all(np.isfinite(mins) & np.isfinite(maxs), axis=1)
+    mins[empty] = maxs[empty] = translations[empty]
+    mins[~valid] = -np.inf
+    maxs[~valid] = np.inf
+    return mins, maxs
+
+
+def cull_instances(instancer, frustums, settings, scene_bounds, pixel_scales):
+    """
+    It returns the ids of the instances of a point instancer that are hidden from every view
+
+    Instances are decided like prims by get_decision_reasons, without the show and hide rules, which apply to the
+    instancer itself.
+
+    :param instancer: UsdGeom.PointInstancer
+    :param frustums: List of Gf.Frustum
+    :param settings: OptimizerSettings of the pass
+    :param scene_bounds: SceneBounds of the pass
+    :param pixel_scales: A (V,) array with the focal length in pixels of every view
+    :return: A sorted (K,) int64 array of instance ids.
+    """
+    mins, maxs = compute_instance_bounds(instancer, scene_bounds)
+    if not len(mins):
+        return np.zeros(0, dtype=np.int64)
+    states = classify_boxes(get_frustums_planes(frustums), mins, maxs)
+    positions = np.array([frustum.position for frustum in frustums], dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        distances = np.linalg.norm(((mins + maxs) * 0.5)[np.newaxis] - positions[:, np.newaxis], axis=2)
+        is_distant = distances > get_distance_limits(settings, pixel_scales, mins, maxs)
+    is_visible = (states != OUTSIDE) & ~is_distant
+    if settings.max_size != 0:
+        with np.errstate(invalid="ignore"):
+            is_big = np.any(maxs - mins > settings.max_size, axis=1)
+        is_visible |= (is_big & ~is_distant) if settings.ignore_size_distant_objects else is_big
+    hidden = ~is_visible.any(axis=0)
+
+    ids = instancer.GetIdsAttr().Get(scene_bounds.time)
+    if ids is not None and len(ids) >= len(hidden):
+        return np.sort(np.asarray(ids, dtype=np.int64)[:len(hidden)][hidden])
+    # Without authored ids, the id of an instance is its index.
+    return np.flatnonzero(hidden).astype(np.int64)
+
+
+def get_authored_invisible_ids(instancer, skip_layer=None):
+    """
+    It returns the invisible ids of the instancer, as authored by the layers other than the skipped one
+
+    :param instancer: UsdGeom.PointInstancer
+    :param skip_layer: Sdf.Layer whose opinion is ignored, usually the optimization layer
+    :return: A (K,) int64 array.
+    """
+    attr = instancer.GetInvisibleIdsAttr()
+    for spec in attr.GetPropertyStack(Usd.TimeCode.Default()):
+        if skip_layer is not None and spec.layer == skip_layer:
+            continue
+        if spec.HasDefaultValue() and spec.default is not None:
+            return np.asarray(spec.default, dtype=np.int64)
+    return np.zeros(0, dtype=np.int64)
+
+
+def find_culled_instances(stage, camera_paths, settings, hidden_paths=(), scene_bounds=None, skip_layer=None):
+    """
+    It culls the instances of every point instancer under the base prim that is not hidden as a whole
+
+    The invisible ids authored by other layers are kept, so instances that were hidden by hand stay hidden.
+    Instancers inside instances are not culled, as opinions on instance proxies are not allowed, the instances
+    themselves are culled as a whole.
+
+    :param stage: Usd.Stage
+    :param camera_paths: Paths of the cameras to scan from
+    :param settings: OptimizerSettings of the pass
+    :param hidden_paths: Paths of the prims that are hidden, instancers under them are skipped
+    :param scene_bounds: SceneBounds of the pass, a new one is created if not provided
+    :param skip_layer: Sdf.Layer whose invisible ids are replaced, usually the optimization layer
+    :return: A dict of instancer Sdf.Path to the sorted array of invisible ids.
+    """
+    frustums = get_view_frustums(stage, camera_paths, settings)
+    base_prim = get_base_prim(stage, settings.base_path)
+    if not frustums or not base_prim:
+        return {}
+    if scene_bounds is None:
+        scene_bounds = SceneBounds()
+    pixel_scales = get_view_pixel_scales(stage, camera_paths, settings)
+    hidden_paths = set(hidden_paths)
+    invisible_ids = {}
+    # Ancestors are visited first, so checking the path itself is enough to skip hidden subtrees.
+    traversal = PrimTraversal(base_prim, prune_fn=lambda prim: prim.GetPath() in hidden_paths)
+    for prim in traversal:
+        if not prim.IsA(UsdGeom.PointInstancer):
+            continue
+        # Prototypes are only drawn through the instancer.
+        traversal.prune()
+        instancer = UsdGeom.PointInstancer(prim)
+        culled_ids = cull_instances(instancer, frustums, settings, scene_bounds, pixel_scales)
+        invisible_ids[prim.GetPath()] = np.union1d(culled_ids, get_authored_invisible_ids(instancer, skip_layer))
+    return invisible_ids
@@ -0,0 +1,128 @@
+from pxr import Sdf
+
+# Custom layer data key that marks the layer the optimizer owns.
+OPTIMIZATION_LAYER_KEY = "cameraViewOptimizer"
+
+
+def is_optimization_layer(layer):
+    """
+    It checks if the layer is the one the optimizer writes its opinions to
+
+    :param layer: Sdf.Layer
+    :return: True if the layer is marked as the optimization layer.
+    """
+    return bool(layer) and bool(layer.customLayerData.get(OPTIMIZATION_LAYER_KEY))
+
+
+def _iter_sublayers(stage):
+    """
+    It yields the sublayers of the session layer and of the root layer, including muted ones
+
+    :param stage: Usd.Stage
+    :return: A generator of (parent layer, sublayer path, Sdf.Layer or None).
+    """
+    for parent_layer in (stage.GetSessionLayer(), stage.GetRootLayer()):
+        for sublayer_path in parent_layer.subLayerPaths:
+            identifier = Sdf.ComputeAssetPathRelativeToLayer(parent_layer, sublayer_path)
+            yield parent_layer, sublayer_path, Sdf.Layer.Find(identifier)
+
+
+def find_optimization_layer(stage):
+    """
+    It returns the optimization layer of the stage, even if it is muted
+
+    :param stage: Usd.Stage
+    :return: Sdf.Layer, or None if the stage has no optimization layer.
+    """
+    for _, _, layer in _iter_sublayers(stage):
+        if is_optimization_layer(layer):
+            return layer
+    return None
+
+
+def get_or_create_optimization_layer(stage, file_path=""):
+    """
+    It returns the optimization layer of the stage, creating it if needed
+
+    Without a file path the layer is anonymous and inserted as the strongest sublayer of the session layer, so it
+    is never saved with the stage. With a file path the layer is saved next to the stage and inserted as the
+    strongest sublayer of the root layer. Either way the source layers never receive optimizer opinions.
+
+    :param stage: Usd.Stage
+    :param file_path: Path of the layer file, an anonymous layer is used if empty
+    :return: Sdf.Layer, unmuted.
+    """
+    layer = find_optimization_layer(stage)
+    if layer is None:
+        if file_path:
+            layer = Sdf.Layer.FindOrOpen(file_path) or Sdf.Layer.CreateNew(file_path)
+            parent_layer = stage.GetRootLayer()
+        else:
+            layer = Sdf.Layer.CreateAnonymous("cameraViewOptimizer.usda")
+            parent_layer = stage.GetSessionLayer()
+        custom_data = dict(layer.customLayerData)
+        custom_data[OPTIMIZATION_LAYER_KEY] = True
+        layer.customLayerData = custom_data
+        parent_layer.subLayerPaths.insert(0, layer.identifier)
+    if stage.IsLayerMuted(layer.identifier):
+        stage.UnmuteLayer(layer.identifier)
+    return layer
+
+
+def set_optimization_layer_muted(stage, muted):
+    """
+    It turns the optimization on or off by muting its layer, without touching any prim
+
+    :param stage: Usd.Stage
+    :param muted: True to turn the optimization off
+    :return: True if the stage has an optimization layer.
+    """
+    layer = find_optimization_layer(stage)
+    if layer is None:
+        return False
+    if muted:
+        stage.MuteLayer(layer.identifier)
+    else:
+        stage.UnmuteLayer(layer.identifier)
+    return True
+
+
+def remove_optimization_layer(stage):
+    """
+    It throws the optimization away by removing its layer from the stage
+
+    :param stage: Usd.Stage
+    :return: True if a layer was removed.
+    """
+    for parent_layer, sublayer_path, layer in _iter_sublayers(stage):
+        if is_optimization_layer(layer):
+            if stage.IsLayerMuted(layer.identifier):
+                stage.UnmuteLayer(layer.identifier)
+            parent_layer.subLayerPaths.remove(sublayer_path)
+            return True
+    return False
+
+
+def clear_layer_prims(layer):
+    """
+    It removes every prim spec of the layer and keeps the layer metadata
+
+    :param layer: Sdf.Layer
+    :return: An anonymous Sdf.Layer with the previous content, to restore it with restore_layer_content.
+    """
+    backup = Sdf.Layer.CreateAnonymous()
+    backup.TransferContent(layer)
+    with Sdf.ChangeBlock():
+        for prim_spec in list(layer.rootPrims):
+            del layer.rootPrims[prim_spec.name]
+    return backup
+
+
+def restore_layer_content(layer, backup):
+    """
+    It restores the content of the layer saved by clear_layer_prims
+
+    :param layer: Sdf.Layer
+    :param backup: The layer returned by clear_layer_prims
+    """
+    layer.TransferContent(backup)
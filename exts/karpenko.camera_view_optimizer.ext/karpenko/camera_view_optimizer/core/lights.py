@@ -0,0 +1,204 @@
+import numpy as np
+from pxr import Gf, UsdGeom
+
+from .bounds import SceneBounds
+from .frustum import OUTSIDE, classify_boxes, get_frustums_planes, get_view_frustums
+from .rules import SHOW, compile_rules
+from .settings import LIGHT_TYPES
+from .traversal import PrimTraversal, get_base_prim
+
+# Lights that light the whole scene, they are never culled.
+INFINITE_LIGHT_TYPES = ("DistantLight",)
+# Lights that only emit on the front side of their surface, along -Z.
+ONE_SIDED_LIGHT_TYPES = ("DiskLight", "RectLight")
+
+# Upper bound of the number of box pairs compared at once by get_overlapping_boxes.
+OVERLAP_CHUNK_SIZE = 4_000_000
+
+
+def get_light_input(prim, name, default, time):
+    """
+    It reads an input of a light, authored with the inputs: prefix of recent UsdLux versions or without it
+
+    :param prim: The light Usd.Prim
+    :param name: Name of the input without the prefix, like "intensity"
+    :param default: Value returned if the input has no value
+    :param time: Usd.TimeCode to read the value at
+    :return: The value of the input.
+    """
+    for attribute_name in (f"inputs:{name}", name):
+        attribute = prim.GetAttribute(attribute_name)
+        if attribute and attribute.HasValue():
+            return attribute.Get(time)
+    return default
+
+
+def get_emitter_shape(prim, time):
+    """
+    It returns the area of the emitting surface of a light as seen from its front, and the radius of the sphere
+    around its pivot that contains the surface, both in local units
+
+    :param prim: The light Usd.Prim
+    :param time: Usd.TimeCode to read the inputs at
+    :return: A tuple of the area and the radius.
+    """
+    type_name = prim.GetTypeName()
+    if type_name == "RectLight":
+        width = get_light_input(prim, "width", 1.0, time)
+        height = get_light_input(prim, "height", 1.0, time)
+        return width * height, 0.5 * np.hypot(width, height)
+    radius = get_light_input(prim, "radius", 0.5, time)
+    if type_name == "CylinderLight":
+        length = get_light_input(prim, "length", 1.0, time)
+        return 2.0 * radius * length, np.hypot(0.5 * length, radius)
+    return np.pi * radius * radius, radius
+
+
+def get_light_influence_bounds(prims, scene_bounds, cutoff):
+    """
+    It returns the world space axis aligned bounds of the volume every light can still light
+
+    The influence of a light ends where its irradiance, which falls off with the square of the distance, drops below
+    the cutoff: intensity * 2^exposure * area / distance^2, with an area of 1 for normalized lights. Lights with a
+    shaping cone and one-sided lights only light a spherical sector in front of them. Distant lights get an infinite
+    box.
+
+    :param prims: List of light Usd.Prim
+    :param scene_bounds: SceneBounds of the pass, for the transforms and the time code
+    :param cutoff: Irradiance below which a light no longer lights anything
+    :return: A tuple of (N, 3) arrays with the minimum and maximum corners.
+    """
+    count = len(prims)
+    time = scene_bounds.time
+    positions = np.zeros((count, 3), dtype=np.float64)
+    axes = np.zeros((count, 3), dtype=np.float64)
+    reaches = np.full(count, np.inf)
+    margins = np.zeros(count, dtype=np.float64)
+    cone_angles = np.full(count, 180.0)
+    for index, prim in enumerate(prims):
+        transform = scene_bounds.get_world_transform(prim)
+        positions[index] = transform.ExtractTranslation()
+        type_name = prim.GetTypeName()
+        if type_name in INFINITE_LIGHT_TYPES:
+            continue
+        axes[index] = transform.TransformDir(Gf.Vec3d(0.0, 0.0, -1.0))
+        scale = max(transform.GetRow3(row).GetLength() for row in range(3))
+        area, radius = get_emitter_shape(prim, time)
+        if get_light_input(prim, "normalize", False, time):
+            area = 1.0
+        else:
+            area *= scale * scale
+        power = get_light_input(prim, "intensity", 1.0, time) * 2.0 ** get_light_input(prim, "exposure", 0.0, time)
+        reaches[index] = np.sqrt(max(power * area, 0.0) / cutoff)
+        margins[index] = radius * scale
+        if type_name in ONE_SIDED_LIGHT_TYPES:
+            cone_angles[index] = 90.0
+        cone_angle = prim.GetAttribute("inputs:shaping:cone:angle") or prim.GetAttribute("shaping:cone:angle")
+        if cone_angle and cone_angle.HasAuthoredValue():
+            cone_angles[index] = min(cone_angles[index], cone_angle.Get(time))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lengths = np.linalg.norm(axes, axis=1)
+        axes /= np.where(lengths > 0.0, lengths, 1.0)[:, np.newaxis]
+    reaches = reaches[:, np.newaxis]
+    # Lights that light all around reach a sphere.
+    mins = positions - reaches
+    maxs = positions + reaches
+    # A sector no wider than a hemisphere is bounded by its apex, the circle at the rim of its cap and its tip, and its
+    # cap bulges out to the reach along the world axes that are inside of the cone.
+    is_sector = np.isfinite(reaches[:, 0]) & (cone_angles <= 90.0)
+    if np.any(is_sector):
+        angles = np.radians(cone_angles[is_sector])[:, np.newaxis]
+        apexes = positions[is_sector]
+        sector_axes = axes[is_sector]
+        sector_reaches = reaches[is_sector]
+        rim_centers = apexes + sector_axes * sector_reaches * np.cos(angles)
+        rim_extents = sector_reaches * np.sin(angles) * np.sqrt(np.maximum(1.0 - sector_axes * sector_axes, 0.0))
+        tips = apexes + sector_axes * sector_reaches
+        sector_mins = np.minimum(np.minimum(apexes, tips), rim_centers - rim_extents)
+        sector_maxs = np.maximum(np.maximum(apexes, tips), rim_centers + rim_extents)
+        mins[is_sector] = np.where(-sector_axes >= np.cos(angles), apexes - sector_reaches, sector_mins)
+        maxs[is_sector] = np.where(sector_axes >= np.cos(angles), apexes + sector_reaches, sector_maxs)
+    # Every point of the emitting surface lights, not only the pivot.
+    mins -= margins[:, np.newaxis]
+    maxs += margins[:, np.newaxis]
+    return mins, maxs
+
+
+def get_overlapping_boxes(mins, maxs, other_mins, other_maxs):
+    """
+    It checks which boxes overlap at least one of the other boxes
+
+    :param mins: A (N, 3) array with the minimum corner of every box
+    :param maxs: A (N, 3) array with the maximum corner of every box
+    :param other_mins: A (M, 3) array with the minimum corner of every other box
+    :param other_maxs: A (M, 3) array with the maximum corner of every other box
+    :return: A (N,) bool array.
+    """
+    overlapping = np.zeros(len(mins), dtype=bool)
+    if not len(other_mins):
+        return overlapping
+    # The boxes are compared in chunks, so the (chunk, M, 3) comparisons stay small.
+    chunk_size = max(1, OVERLAP_CHUNK_SIZE // len(other_mins))
+    for start in range(0, len(mins), chunk_size):
+        chunk_mins = mins[start:start + chunk_size, np.newaxis]
+        chunk_maxs = maxs[start:start + chunk_size, np.newaxis]
+        overlaps = np.all((chunk_mins <= other_maxs) & (chunk_maxs >= other_mins), axis=2)
+        overlapping[start:start + chunk_size] = overlaps.any(axis=1)
+    return overlapping
+
+
+def find_culled_lights(stage, camera_paths, settings, hidden_paths=(), scene_bounds=None, check_geometry=True):
+    """
+    It returns the lights under the base prim whose influence volume can't light anything the cameras see
+
+    A light is culled when its influence volume is outside of every view, or when it doesn't overlap the bounds of
+    any gprim, point instancer or instance that is not hidden and is in a view. The culling of the objects never hides
+    the ancestors of lights while there is a light cutoff, so only subtrees without lights are skipped as hidden.
+    Lights a rule shows are kept.
+
+    :param stage: Usd.Stage
+    :param camera_paths: Paths of the cameras to scan from
+    :param settings: OptimizerSettings of the pass, nothing is culled if its light cutoff is 0
+    :param hidden_paths: Paths of the prims that are hidden
+    :param scene_bounds: SceneBounds of the pass, a new one is created if not provided
+    :param check_geometry: Also cull the lights that don't reach any visible geometry, only the view is checked if
+        False, for stages that only hold a part of the geometry
+    :return: A list of Sdf.Path
+    """
+    if settings.light_cutoff <= 0:
+        return []
+    frustums = get_view_frustums(stage, camera_paths, settings)
+    base_prim = get_base_prim(stage, settings.base_path)
+    if not frustums or not base_prim:
+        return []
+    if scene_bounds is None:
+        scene_bounds = SceneBounds()
+    rules = compile_rules(settings)
+    hidden_paths = set(hidden_paths)
+    lights = []
+    geometry = []
+    # Ancestors are visited first, so checking the path itself is enough to skip hidden subtrees.
+    traversal = PrimTraversal(base_prim, prune_fn=lambda prim: prim.GetPath() in hidden_paths)
+    for prim in traversal:
+        if prim.GetTypeName() in LIGHT_TYPES:
+            if not rules.has_show_rules or rules.evaluate(prim) != SHOW:
+                lights.append(prim)
+        elif prim.IsA(UsdGeom.Gprim) or prim.IsA(UsdGeom.PointInstancer) or prim.IsInstance():
+            geometry.append(prim)
+            # The bounds of a gprim, an instancer or an instance already hold what is under it.
+            traversal.prune()
+    if not lights:
+        return []
+
+    planes = get_frustums_planes(frustums)
+    mins, maxs = get_light_influence_bounds(lights, scene_bounds, settings.light_cutoff)
+    is_lit = np.any(classify_boxes(planes, mins, maxs) != OUTSIDE, axis=0)
+    if check_geometry and np.any(is_lit):
+        geometry_mins, geometry_maxs = scene_bounds.compute_world_bounds(geometry)
+        in_view = np.any(classify_boxes(planes, geometry_mins, geometry_maxs) != OUTSIDE, axis=0)
+        lit_indices = np.flatnonzero(is_lit)
+        is_lit[lit_indices] = get_overlapping_boxes(
+            mins[lit_indices], maxs[lit_indices], geometry_mins[in_view], geometry_maxs[in_view]
+        )
+    return [light.GetPath() for light, lit in zip(lights, is_lit.tolist()) if not lit]
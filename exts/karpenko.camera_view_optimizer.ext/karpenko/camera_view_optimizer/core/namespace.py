@@ -0,0 +1,218 @@
+from pxr import Sdf
+
+# Removing a child spec rewrites the list of children of its parent, so removing many children of a big parent one by
+# one takes quadratic time. Past this many sibling visits, the parent is rebuilt instead: its children are copied
+# aside, cleared at once and the kept ones copied back, which takes time linear in the specs under the parent.
+REBUILD_MIN_SIBLING_VISITS = 1000000
+# Sibling visits of the removals that take as long as copying one spec of a rebuilt parent, measured on flat stages.
+SIBLING_VISITS_PER_SPEC = 200
+
+
+class DeletedPrimsUndoState:
+    """
+    What is needed to bring back the prims removed by delete_prim_specs, in the order they had
+
+    Args:
+        removed (List[Tuple[Sdf.Layer, Sdf.Layer, List[Tuple[Sdf.Path, int]]]]): For every layer where specs were
+            removed one by one, the layer, an anonymous layer with a copy of the removed specs, and the removed paths
+            with their index among their siblings.
+        rebuilt (List[Tuple[Sdf.Layer, Sdf.Layer, Sdf.Path, List[str]]]): For every parent that was rebuilt, the
+            layer, an anonymous layer with a copy of all its children, its path and the names of its children.
+    """
+
+    def __init__(self, removed, rebuilt):
+        self.removed = removed
+        self.rebuilt = rebuilt
+
+
+def get_root_paths(paths):
+    """
+    It collapses the paths to their minimal set of roots, the paths under another path of the list are removed
+
+    :param paths: An iterable of Sdf.Path
+    :return: A sorted list of Sdf.Path
+    """
+    result = []
+    for path in sorted(set(paths)):
+        if not result or not path.HasPrefix(result[-1]):
+            result.append(path)
+    return result
+
+
+def split_deletable_paths(stage, paths):
+    """
+    It splits the paths into the prims that can be deleted from the layer stack of the stage and the others
+
+    A prim can be deleted when all of its specs are in editable layers of the layer stack, at its own path. A prim
+    that also comes from a reference, a payload or a variant would still be there once those specs are removed.
+
+    :param stage: Usd.Stage
+    :param paths: Prim paths
+    :return: A tuple of two lists of Sdf.Path, the paths that can be deleted and the paths that can't. Paths
+        without a prim are in neither.
+    """
+    layer_stack = set(stage.GetLayerStack(includeSessionLayers=True))
+    deletable = []
+    kept = []
+    for path in paths:
+        prim = stage.GetPrimAtPath(path)
+        if not prim:
+            continue
+        path = prim.GetPath()
+        if all(
+            spec.layer in layer_stack and spec.path == path and spec.layer.permissionToEdit
+            for spec in prim.GetPrimStack()
+        ):
+            deletable.append(path)
+        else:
+            kept.append(path)
+    return deletable, kept
+
+
+def delete_prim_specs(stage, paths):
+    """
+    It removes the specs of the prims from every layer of the layer stack of the stage, inside a single
+    Sdf.ChangeBlock
+
+    The paths are collapsed to their roots first, so a subtree is removed once at its root. In every layer, the specs
+    are removed with one batched namespace edit, except under parents that lose so many children that rebuilding
+    them is faster. The removed specs are copied to anonymous layers, which is all restore_deleted_prims needs. Only
+    pass paths that split_deletable_paths accepts, the specs of the others would be removed without removing the
+    prims.
+
+    :param stage: Usd.Stage
+    :param paths: Prim paths
+    :return: DeletedPrimsUndoState to pass to restore_deleted_prims.
+    """
+    root_paths = get_root_paths(Sdf.Path(path) if not isinstance(path, Sdf.Path) else path for path in paths)
+    removed = []
+    rebuilt = []
+    with Sdf.ChangeBlock():
+        for layer in stage.GetLayerStack(includeSessionLayers=True):
+            paths_by_parent = {}
+            for path in root_paths:
+                if layer.GetPrimAtPath(path):
+                    paths_by_parent.setdefault(path.GetParentPath(), []).append(path)
+            if not paths_by_parent:
+                continue
+            backup = None
+            edit = Sdf.BatchNamespaceEdit()
+            removed_paths = []
+            for parent_path, child_paths in sorted(paths_by_parent.items()):
+                siblings = _get_name_children(layer, parent_path)
+                child_names = list(siblings.keys())
+                if _should_rebuild(layer, parent_path, len(child_paths), len(child_names)):
+                    rebuilt.append(_rebuild_without_children(layer, parent_path, child_names, child_paths))
+                    continue
+                if backup is None:
+                    backup = Sdf.Layer.CreateAnonymous()
+                # Looking up the index of every removed child in a flat hierarchy would be quadratic.
+                indices = {name: index for index, name in enumerate(child_names)}
+                for path in child_paths:
+                    if parent_path != Sdf.Path.absoluteRootPath:
+                        Sdf.CreatePrimInLayer(backup, parent_path)
+                    Sdf.CopySpec(layer, path, backup, path)
+                    edit.Add(Sdf.NamespaceEdit.Remove(path))
+                    removed_paths.append((path, indices[path.name]))
+            if removed_paths:
+                layer.Apply(edit)
+                removed.append((layer, backup, removed_paths))
+    return DeletedPrimsUndoState(removed, rebuilt)
+
+
+def restore_deleted_prims(undo_state):
+    """
+    It brings back the prims removed by delete_prim_specs, at the index they had among their siblings, inside a
+    single Sdf.ChangeBlock
+
+    :param undo_state: DeletedPrimsUndoState returned by delete_prim_specs
+    """
+    with Sdf.ChangeBlock():
+        for layer, backup, removed_paths in reversed(undo_state.removed):
+            # Copying a spec appends it to its siblings and a spec can't be moved onto itself, so the specs are
+            # renamed in the backup, copied under that name and moved back to their name and index. A namespace edit
+            # of the layer doesn't change the paths the specs hold, unlike a copy to another path.
+            temporary_paths = []
+            backup_edit = Sdf.BatchNamespaceEdit()
+            for path, _ in removed_paths:
+                temporary_path = path.ReplaceName(path.name + "_deleted")
+                while layer.GetPrimAtPath(temporary_path) or backup.GetPrimAtPath(temporary_path):
+                    temporary_path = temporary_path.ReplaceName(temporary_path.name + "_")
+                backup_edit.Add(path, temporary_path)
+                temporary_paths.append(temporary_path)
+            backup.Apply(backup_edit)
+            edit = Sdf.BatchNamespaceEdit()
+            # Moving them by increasing index puts every one back where it was.
+            moves = sorted(zip(removed_paths, temporary_paths), key=lambda item: item[0][1])
+            for (path, index), temporary_path in moves:
+                Sdf.CopySpec(backup, temporary_path, layer, temporary_path)
+                edit.Add(temporary_path, path, index)
+            layer.Apply(edit)
+
+        for layer, backup, parent_path, child_names in reversed(undo_state.rebuilt):
+            _get_name_children(layer, parent_path).clear()
+            for name in child_names:
+                child_path = parent_path.AppendChild(name)
+                Sdf.CopySpec(backup, child_path, layer, child_path)
+
+
+def _get_name_children(layer, parent_path):
+    """
+    It returns the children of the prim spec at the path, the root prims of the layer for the absolute root
+
+    :param layer: Sdf.Layer
+    :param parent_path: Sdf.Path
+    :return: The children proxy, ordered by name.
+    """
+    if parent_path == Sdf.Path.absoluteRootPath:
+        return layer.rootPrims
+    return layer.GetPrimAtPath(parent_path).nameChildren
+
+
+def _should_rebuild(layer, parent_path, removed_count, child_count):
+    """
+    It checks if rebuilding the parent without the children is faster than removing them one by one
+
+    :param layer: Sdf.Layer
+    :param parent_path: Sdf.Path of the parent
+    :param removed_count: Number of children to remove
+    :param child_count: Number of children of the parent
+    :return: True to rebuild the parent.
+    """
+    sibling_visits = removed_count * child_count
+    if sibling_visits < REBUILD_MIN_SIBLING_VISITS or parent_path == Sdf.Path.absoluteRootPath:
+        return False
+    # The specs are only counted up to the point where removing is faster anyway.
+    max_spec_count = sibling_visits // SIBLING_VISITS_PER_SPEC
+    spec_count = 0
+    stack = [layer.GetPrimAtPath(parent_path)]
+    while stack and spec_count <= max_spec_count:
+        prim_spec = stack.pop()
+        spec_count += 1 + len(prim_spec.properties)
+        stack.extend(prim_spec.nameChildren.values())
+    return spec_count <= max_spec_count
+
+
+def _rebuild_without_children(layer, parent_path, child_names, child_paths):
+    """
+    It removes children of the parent by clearing all of them at once and copying back the ones that are kept
+
+    :param layer: Sdf.Layer
+    :param parent_path: Sdf.Path of the parent
+    :param child_names: Names of all the children of the parent, in order
+    :param child_paths: Paths of the children to remove
+    :return: A tuple of the layer, an anonymous layer with a copy of all the children, the parent path and the child
+        names, for restore_deleted_prims.
+    """
+    backup = Sdf.Layer.CreateAnonymous()
+    Sdf.CreatePrimInLayer(backup, parent_path)
+    for name in child_names:
+        child_path = parent_path.AppendChild(name)
+        Sdf.CopySpec(layer, child_path, backup, child_path)
+    removed_names = {path.name for path in child_paths}
+    _get_name_children(layer, parent_path).clear()
+    for name in child_names:
+        if name not in removed_names:
+            child_path = parent_path.AppendChild(name)
+            Sdf.CopySpec(backup, child_path, layer, child_path)
+    return layer, backup, parent_path, child_names
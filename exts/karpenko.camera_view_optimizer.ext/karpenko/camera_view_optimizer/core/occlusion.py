@@ -0,0 +1,262 @@
+import math
+
+import numpy as np
+from pxr import UsdGeom
+
+from .frustum import OUTSIDE, classify_boxes, get_frustum_planes, get_view_projection_matrix
+from .traversal import PrimTraversal, is_invisible
+
+# Clip space w below this value is treated as crossing the near plane.
+NEAR_EPSILON = 1e-6
+
+# Corners of the unit cube used by UsdGeom.Cube, and the triangles of its six faces.
+CUBE_POINTS = np.array([
+    [-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],
+    [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1],
+], dtype=np.float64)
+CUBE_TRIANGLES = np.array([
+    [0, 2, 1], [0, 3, 2], [4, 5, 6], [4, 6, 7],
+    [0, 1, 5], [0, 5, 4], [3, 7, 6], [3, 6, 2],
+    [0, 4, 7], [0, 7, 3], [1, 2, 6], [1, 6, 5],
+], dtype=np.int64)
+
+
+def get_prim_triangles(prim):
+    """
+    It returns the triangles of a Mesh or Cube prim in its local space
+
+    :param prim: Usd.Prim
+    :return: A (T, 3, 3) array, empty if the prim is not a Mesh or a Cube.
+    """
+    if prim.IsA(UsdGeom.Cube):
+        size = UsdGeom.Cube(prim).GetSizeAttr().Get() or 2.0
+        return CUBE_POINTS[CUBE_TRIANGLES] * (size * 0.5)
+    if not prim.IsA(UsdGeom.Mesh):
+        return np.empty((0, 3, 3), dtype=np.float64)
+
+    mesh = UsdGeom.Mesh(prim)
+    points = mesh.GetPointsAttr().Get()
+    counts = mesh.GetFaceVertexCountsAttr().Get()
+    indices = mesh.GetFaceVertexIndicesAttr().Get()
+    if not points or not counts or not indices:
+        return np.empty((0, 3, 3), dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+
+    # Fan triangulation of every face: (first, i, i + 1) for i in 1..count-2.
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    triangle_counts = np.maximum(counts - 2, 0)
+    face_of_triangle = np.repeat(np.arange(len(counts)), triangle_counts)
+    first_triangles = np.cumsum(triangle_counts) - triangle_counts
+    offsets = np.arange(len(face_of_triangle)) - np.repeat(first_triangles, triangle_counts)
+    first = starts[face_of_triangle]
+    corners = np.stack((first, first + offsets + 1, first + offsets + 2), axis=1)
+    if corners.size and corners.max() >= len(indices):
+        return np.empty((0, 3, 3), dtype=np.float64)
+    return points[indices[corners]]
+
+
+class OcclusionBuffer:
+    """
+    Low resolution software depth buffer with a hierarchical-Z pyramid, rasterized on the CPU with numpy
+
+    Occluders are rasterized with their nearest view depth per pixel. Every level of the pyramid keeps the farthest
+    depth of the 2x2 texels below it, so a box is occluded when its nearest point is behind the farthest occluder
+    depth of the texels it covers. Pixels without occluders have an infinite depth and never occlude anything.
+    The result only depends on the input, so it is the same on every machine.
+
+    Args:
+        frustum (Gf.Frustum): The world space camera frustum.
+        width (int): Width of the buffer in pixels, the height follows the aspect ratio of the frustum.
+    """
+
+    def __init__(self, frustum, width=256):
+        self.width = int(width)
+        self.height = max(1, int(round(self.width / frustum.ComputeAspectRatio())))
+        self.view_projection = get_view_projection_matrix(frustum)
+        self.depth = np.full((self.height, self.width), np.inf, dtype=np.float64)
+        self.pyramid = None
+
+    def project(self, points):
+        """
+        It projects world space points to pixel coordinates
+
+        :param points: A (..., 3) array of world space points
+        :return: A tuple of (..., 2) pixel coordinates and (...,) view depths (clip space w).
+        """
+        points = np.asarray(points, dtype=np.float64)
+        clip = points @ self.view_projection[:3] + self.view_projection[3]
+        w = clip[..., 3]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ndc = clip[..., :2] / w[..., np.newaxis]
+        pixels = np.empty(ndc.shape, dtype=np.float64)
+        pixels[..., 0] = (ndc[..., 0] + 1.0) * 0.5 * self.width
+        pixels[..., 1] = (1.0 - ndc[..., 1]) * 0.5 * self.height
+        return pixels, w
+
+    def add_occluder(self, world_triangles):
+        """
+        It rasterizes the triangles of an occluder into the depth buffer
+
+        Triangles that cross the near plane are skipped, which can only make the occlusion less aggressive.
+
+        :param world_triangles: A (T, 3, 3) array of world space triangles
+        :return: Number of triangles that were rasterized.
+        """
+        if not len(world_triangles):
+            return 0
+        pixels, w = self.project(world_triangles)
+        in_front = np.all(w > NEAR_EPSILON, axis=1)
+        pixels = pixels[in_front]
+        w = w[in_front]
+        # Drop triangles that are completely off screen.
+        on_screen = (
+            (pixels[:, :, 0].max(axis=1) >= 0) & (pixels[:, :, 0].min(axis=1) < self.width)
+            & (pixels[:, :, 1].max(axis=1) >= 0) & (pixels[:, :, 1].min(axis=1) < self.height)
+        )
+        rasterized = 0
+        for triangle, depths in zip(pixels[on_screen], w[on_screen]):
+            rasterized += self._rasterize_triangle(triangle, depths)
+        self.pyramid = None
+        return rasterized
+
+    def _rasterize_triangle(self, triangle, depths):
+        """
+        It writes the nearest depth of a single screen space triangle into the buffer, sampled at pixel centers
+
+        :param triangle: A (3, 2) array of pixel coordinates
+        :param depths: A (3,) array of view depths of the vertices
+        :return: 1 if any pixel was covered, 0 otherwise.
+        """
+        (ax, ay), (bx, by), (cx, cy) = triangle
+        area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        if abs(area) < 1e-12:
+            return 0
+        x0 = max(int(math.floor(triangle[:, 0].min())), 0)
+        x1 = min(int(math.ceil(triangle[:, 0].max())), self.width - 1)
+        y0 = max(int(math.floor(triangle[:, 1].min())), 0)
+        y1 = min(int(math.ceil(triangle[:, 1].max())), self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return 0
+
+        px = np.arange(x0, x1 + 1, dtype=np.float64)[np.newaxis, :] + 0.5
+        py = np.arange(y0, y1 + 1, dtype=np.float64)[:, np.newaxis] + 0.5
+        # Barycentric coordinates of the pixel centers.
+        b0 = ((bx - px) * (cy - py) - (by - py) * (cx - px)) / area
+        b1 = ((cx - px) * (ay - py) - (cy - py) * (ax - px)) / area
+        b2 = 1.0 - b0 - b1
+        inside = (b0 >= 0) & (b1 >= 0) & (b2 >= 0)
+        if not inside.any():
+            return 0
+        # 1/w is linear in screen space.
+        inverse_depth = b0 / depths[0] + b1 / depths[1] + b2 / depths[2]
+        with np.errstate(divide="ignore"):
+            pixel_depth = np.where(inside, 1.0 / inverse_depth, np.inf)
+        region = self.depth[y0:y1 + 1, x0:x1 + 1]
+        np.minimum(region, pixel_depth, out=region)
+        return 1
+
+    def build_pyramid(self):
+        """
+        It builds the hierarchical-Z pyramid, every level keeps the farthest depth of 2x2 texels of the level below
+        """
+        level = self.depth
+        self.pyramid = [level]
+        while level.shape[0] > 1 or level.shape[1] > 1:
+            height, width = level.shape
+            # Odd sizes are padded by repeating the last row/column, so the padding never changes the maximum.
+            padded = np.pad(level, ((0, height % 2), (0, width % 2)), mode="edge")
+            level = np.maximum.reduce([
+                padded[0::2, 0::2], padded[1::2, 0::2], padded[0::2, 1::2], padded[1::2, 1::2],
+            ])
+            self.pyramid.append(level)
+
+    def test_boxes(self, mins, maxs):
+        """
+        It tests axis aligned world space boxes against the occluders in one batch
+
+        :param mins: A (N, 3) array with the minimum corner of every box
+        :param maxs: A (N, 3) array with the maximum corner of every box
+        :return: A (N,) bool array, True for boxes that are completely hidden behind occluders.
+        """
+        mins = np.asarray(mins, dtype=np.float64).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=np.float64).reshape(-1, 3)
+        occluded = np.zeros(len(mins), dtype=bool)
+        if not len(mins):
+            return occluded
+        if self.pyramid is None:
+            self.build_pyramid()
+
+        # All 8 corners of every box.
+        selectors = CUBE_POINTS > 0
+        corners = np.where(selectors[np.newaxis], maxs[:, np.newaxis], mins[:, np.newaxis])
+        with np.errstate(invalid="ignore"):
+            pixels, w = self.project(corners)
+            testable = np.all(w > NEAR_EPSILON, axis=1) & np.all(np.isfinite(pixels), axis=(1, 2))
+        if not testable.any():
+            return occluded
+        indices = np.nonzero(testable)[0]
+        pixels = pixels[indices]
+        nearest = w[indices].min(axis=1)
+
+        x0 = np.clip(np.floor(pixels[:, :, 0].min(axis=1)), 0, self.width - 1).astype(np.int64)
+        x1 = np.clip(np.floor(pixels[:, :, 0].max(axis=1)), 0, self.width - 1).astype(np.int64)
+        y0 = np.clip(np.floor(pixels[:, :, 1].min(axis=1)), 0, self.height - 1).astype(np.int64)
+        y1 = np.clip(np.floor(pixels[:, :, 1].max(axis=1)), 0, self.height - 1).astype(np.int64)
+        # The level where the screen rectangle of the box covers at most 2x2 texels.
+        extent = np.maximum(x1 - x0, y1 - y0) + 1
+        levels = np.minimum(np.ceil(np.log2(extent)).astype(np.int64), len(self.pyramid) - 1)
+
+        farthest = np.empty(len(indices), dtype=np.float64)
+        for level_index in np.unique(levels):
+            selected = levels == level_index
+            level = self.pyramid[level_index]
+            height, width = level.shape
+            tx0 = np.minimum(x0[selected] >> level_index, width - 1)
+            tx1 = np.minimum(x1[selected] >> level_index, width - 1)
+            ty0 = np.minimum(y0[selected] >> level_index, height - 1)
+            ty1 = np.minimum(y1[selected] >> level_index, height - 1)
+            farthest[selected] = np.maximum.reduce([
+                level[ty0, tx0], level[ty0, tx1], level[ty1, tx0], level[ty1, tx1],
+            ])
+        occluded[indices] = nearest > farthest
+        return occluded
+
+
+def build_occlusion_buffer(frustum, root_prim, scene_bounds, min_size, width=256):
+    """
+    It rasterizes every visible Mesh or Cube under the root prim that is bigger than min_size into a new buffer
+
+    Guide and proxy geometry is not rendered, so it is never used as an occluder. With swept bounds, animated prims
+    are not used as occluders either, they only hide what is behind them at some of the time codes.
+
+    :param frustum: The world space camera frustum
+    :param root_prim: The prim to search for occluders under
+    :param scene_bounds: SceneBounds of the pass
+    :param min_size: Prims are used as occluders if one of their dimensions is bigger than this
+    :param width: Width of the buffer in pixels
+    :return: OcclusionBuffer with its pyramid built.
+    """
+    buffer = OcclusionBuffer(frustum, width)
+    frustum_planes = get_frustum_planes(frustum)
+    for prim in PrimTraversal(root_prim, skip_non_imageable=True, prune_fn=is_invisible):
+        if not (prim.IsA(UsdGeom.Mesh) or prim.IsA(UsdGeom.Cube)):
+            continue
+        if UsdGeom.Imageable(prim).ComputePurpose() not in (UsdGeom.Tokens.default_, UsdGeom.Tokens.render):
+            continue
+        if scene_bounds.is_time_varying(prim):
+            continue
+        prim_range = scene_bounds.get_world_range(prim)
+        if prim_range.IsEmpty() or max(prim_range.GetSize()) <= min_size:
+            continue
+        state = classify_boxes(frustum_planes, [prim_range.GetMin()], [prim_range.GetMax()])[0]
+        if state == OUTSIDE:
+            continue
+        local_triangles = get_prim_triangles(prim)
+        if not len(local_triangles):
+            continue
+        matrix = np.array(scene_bounds.get_world_transform(prim), dtype=np.float64)
+        buffer.add_occluder(local_triangles @ matrix[:3, :3] + matrix[3, :3])
+    buffer.build_pyramid()
+    return buffer
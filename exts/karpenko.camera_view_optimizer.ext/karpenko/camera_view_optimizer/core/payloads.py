@@ -0,0 +1,175 @@
+from pxr import Sdf, Usd, UsdGeom
+
+from .bounds import SceneBounds
+from .culling import find_hidden_paths
+from .frustum import get_swept_time_codes
+from .namespace import get_root_paths
+from .traversal import PrimTraversal, get_base_prim
+
+
+def has_payload(prim):
+    """
+    It checks if the prim itself brings in a payload
+
+    :param prim: Usd.Prim
+    :return: True if the prim has authored payloads.
+    """
+    return prim.HasAuthoredPayloads()
+
+
+def _is_covered(prim, hidden_paths):
+    """
+    It checks if nothing under the prim would be visible: the prim is hidden, or it is not a gprim itself and all of
+    its imageable children are covered
+
+    :param prim: Usd.Prim
+    :param hidden_paths: A set of the hidden Sdf.Path
+    :return: True if the whole subtree is hidden.
+    """
+    covered = set()
+    stack = [(prim, False)]
+    while stack:
+        current, children_done = stack.pop()
+        if current.GetPath() in hidden_paths:
+            covered.add(current.GetPath())
+            continue
+        children = [child for child in current.GetFilteredChildren(Usd.PrimIsActive) if child.IsA(UsdGeom.Imageable)]
+        # A gprim shows something by itself, and a leaf that is not hidden may be visible.
+        if not children or current.IsA(UsdGeom.Gprim):
+            return False
+        if not children_done:
+            stack.append((current, True))
+            stack.extend((child, False) for child in children)
+        elif all(child.GetPath() in covered for child in children):
+            covered.add(current.GetPath())
+        else:
+            return False
+    return prim.GetPath() in covered
+
+
+def find_culled_payloads(stage, hidden_paths):
+    """
+    It returns the payload prims that can be unloaded because nothing they bring in would be visible
+
+    A payload is culled if its prim or one of its ancestors is hidden, or if every child under the payload prim is
+    hidden. Payloads nested under a culled payload are not returned, they are unloaded together with it.
+
+    :param stage: Usd.Stage
+    :param hidden_paths: Paths of the hidden prims
+    :return: A list of Sdf.Path
+    """
+    hidden_paths = {Sdf.Path(path) for path in hidden_paths}
+    payload_paths = []
+    # Payloads at or under a hidden prim.
+    for path in hidden_paths:
+        prim = stage.GetPrimAtPath(path)
+        if not prim:
+            continue
+        traversal = PrimTraversal(prim, include_root=True, skip_scopes=False)
+        for descendant in traversal:
+            if has_payload(descendant):
+                payload_paths.append(descendant.GetPath())
+                traversal.prune()
+
+    # Payload prims above hidden prims, when everything they contain is hidden.
+    candidates = set()
+    for path in hidden_paths:
+        for ancestor_path in path.GetParentPath().GetPrefixes():
+            ancestor = stage.GetPrimAtPath(ancestor_path)
+            if ancestor and has_payload(ancestor):
+                candidates.add(ancestor_path)
+    for path in sorted(candidates):
+        if any(path.HasPrefix(payload_path) for payload_path in payload_paths):
+            continue
+        if _is_covered(stage.GetPrimAtPath(path), hidden_paths):
+            payload_paths.append(path)
+    return get_root_paths(payload_paths)
+
+
+def get_unload_rules(stage, payload_paths):
+    """
+    It returns the load rules of the stage with the payloads unloaded
+
+    :param stage: Usd.Stage
+    :param payload_paths: Paths of the payload prims to unload
+    :return: Usd.StageLoadRules, to pass to stage.SetLoadRules()
+    """
+    rules = stage.GetLoadRules()
+    for path in payload_paths:
+        rules.AddRule(path, Usd.StageLoadRules.NoneRule)
+    return rules
+
+
+def get_reload_rules(stage, payload_paths):
+    """
+    It returns the load rules of the stage with the payloads loaded again
+
+    :param stage: Usd.Stage
+    :param payload_paths: Paths of the payload prims that were unloaded with get_unload_rules
+    :return: Usd.StageLoadRules, to pass to stage.SetLoadRules()
+    """
+    rules = stage.GetLoadRules()
+    for path in payload_paths:
+        rules.AddRule(path, Usd.StageLoadRules.AllRule)
+    return rules
+
+
+def find_unloaded_payloads(root_prim, skip_paths=()):
+    """
+    It returns the payload prims under the root prim that are not loaded
+
+    :param root_prim: Usd.Prim
+    :param skip_paths: Paths whose subtrees are not searched
+    :return: A list of Sdf.Path
+    """
+    skip_paths = set(skip_paths)
+    payload_paths = []
+    # Ancestors are visited first, so checking the path itself is enough to skip the whole subtree.
+    traversal = PrimTraversal(
+        root_prim,
+        include_root=True,
+        skip_scopes=False,
+        prune_fn=lambda prim: prim.GetPath() in skip_paths,
+    )
+    for prim in traversal:
+        if has_payload(prim) and not prim.IsLoaded():
+            payload_paths.append(prim.GetPath())
+            # Nothing under an unloaded payload is composed yet.
+            traversal.prune()
+    return payload_paths
+
+
+def plan_payload_loading(stage, camera_paths, settings, max_rounds=16, split_paths=()):
+    """
+    It loads only the payloads that can be visible from the cameras, starting from a stage with nothing loaded
+
+    The unloaded payloads are culled with the extents hints of their models, payloads without a hint are loaded to
+    be safe.
+    Payloads nested in the loaded ones are culled in the next round, until no new payload is loaded. The stage
+    should be opened with Usd.Stage.LoadNone, so the culled payloads are never read.
+
+    :param stage: Usd.Stage
+    :param camera_paths: Paths of the cameras to scan from
+    :param settings: OptimizerSettings of the pass
+    :param max_rounds: Maximum depth of nested payloads that are planned
+    :param split_paths: Paths of the prims whose children are culled in several shards, they are never culled
+    :return: A tuple of the loaded payload paths and the Usd.StageLoadRules that were set on the stage.
+    """
+    rules = Usd.StageLoadRules.LoadNone()
+    stage.SetLoadRules(rules)
+    loaded_paths = []
+    culled_paths = set()
+    for _ in range(max_rounds):
+        base_prim = get_base_prim(stage, settings.base_path)
+        scene_bounds = SceneBounds(use_extents_hint=True, time_codes=get_swept_time_codes(settings))
+        hidden_paths = find_hidden_paths(stage, camera_paths, settings, scene_bounds, split_paths=split_paths)
+        unloaded_paths = find_unloaded_payloads(base_prim, skip_paths=culled_paths.union(hidden_paths))
+        culled_paths.update(hidden_paths)
+        if not unloaded_paths:
+            break
+        for path in unloaded_paths:
+            # Nested payloads stay unloaded until they are culled themselves.
+            rules.AddRule(path, Usd.StageLoadRules.OnlyRule)
+        loaded_paths.extend(unloaded_paths)
+        stage.SetLoadRules(rules)
+    return loaded_paths, rules
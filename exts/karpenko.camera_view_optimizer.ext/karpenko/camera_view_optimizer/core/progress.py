@@ -0,0 +1,38 @@
+import time
+
+
+class JobProgress:
+    """
+    Progress of a long operation that runs in steps, written by the operation and read by the window
+
+    Args:
+        phase (str): What the operation is doing.
+        total (int): Number of items of the phase, None if it is not known.
+    """
+
+    def __init__(self, phase="", total=None):
+        self.hidden = 0
+        self.start_phase(phase, total)
+
+    def start_phase(self, phase, total=None):
+        """
+        It starts counting a new phase of the operation
+
+        :param phase: What the operation is doing
+        :param total: Number of items of the phase, None if it is not known
+        """
+        self.phase = phase
+        self.total = total
+        self.done = 0
+        self.phase_started_at = time.perf_counter()
+
+    def get_eta(self):
+        """
+        It estimates the seconds left in the phase from its speed so far
+
+        :return: The seconds left, None if the total is not known or nothing is done yet.
+        """
+        if not self.total or not self.done:
+            return None
+        elapsed = time.perf_counter() - self.phase_started_at
+        return elapsed * max(self.total - self.done, 0) / self.done
@@ -0,0 +1,133 @@
+import contextlib
+
+from pxr import Sdf, Tf, UsdGeom
+
+
+class OptimizedPrimsRegistry:
+    """
+    Index of the prims the optimizer has hidden or deactivated, and of the instancers it has culled, read from the
+    opinions of the optimization layer
+
+    The opinions of the optimization layer are the persistent form of the index: only the optimizer writes them, they
+    are saved with the layer file, and undo and redo revert them like any other opinion. Prims hidden by artists in
+    their own layers are never in the index. Reading the index only visits the specs of the optimization layer, so it
+    takes time proportional to what the optimizer hid, not to the stage.
+
+    The index is read once and kept until the layer changes. Writers that know what they changed update the index
+    themselves inside updating(), any other change of the layer, like an undo, makes it read the layer again.
+
+    Args:
+        layer (Sdf.Layer): The optimization layer, it is listened to until revoke() is called.
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+        self._listener = Tf.Notice.Register(Sdf.Notice.LayersDidChangeSentPerLayer, self._on_layers_changed, layer)
+        self._updating = False
+        self._hidden_paths = None
+        self._deactivated_paths = None
+        self._instancer_paths = None
+
+    def revoke(self):
+        """
+        It stops listening to the layer
+        """
+        if self._listener is not None:
+            self._listener.Revoke()
+            self._listener = None
+
+    def _on_layers_changed(self, notice, sender):
+        if not self._updating:
+            self._hidden_paths = None
+
+    @property
+    def hidden_paths(self):
+        """
+        Paths of the prims the optimizer has hidden, a set of Sdf.Path
+        """
+        self._read()
+        return self._hidden_paths
+
+    @property
+    def deactivated_paths(self):
+        """
+        Paths of the prims the optimizer has deactivated, a set of Sdf.Path
+        """
+        self._read()
+        return self._deactivated_paths
+
+    @property
+    def instancer_paths(self):
+        """
+        Paths of the point instancers the optimizer has hidden instances of, a set of Sdf.Path
+        """
+        self._read()
+        return self._instancer_paths
+
+    @contextlib.contextmanager
+    def updating(self, hidden_paths=(), shown_paths=()):
+        """
+        It writes to the layer without reading it again, the index is updated with the paths instead
+
+        :param hidden_paths: Paths the block hides
+        :param shown_paths: Paths the block shows again
+        """
+        self._read()
+        self._updating = True
+        try:
+            yield
+        except BaseException:
+            # What the block wrote is unknown, the layer is read again.
+            self._hidden_paths = None
+            raise
+        finally:
+            self._updating = False
+        self._hidden_paths.difference_update(shown_paths)
+        self._hidden_paths.update(hidden_paths)
+
+    def get_counts(self):
+        """
+        It counts the prims of the index, for the window
+
+        :return: A dict with the number of hidden prims, deactivated prims and culled instancers.
+        """
+        return {
+            "hidden": len(self.hidden_paths),
+            "deactivated": len(self.deactivated_paths),
+            "instancers": len(self.instancer_paths),
+        }
+
+    def _read(self):
+        """
+        It reads the index from the specs of the layer if it changed since the last read
+        """
+        if self._hidden_paths is not None:
+            return
+        prim_paths = []
+        property_paths = []
+
+        def visit(path):
+            if path.IsPropertyPath():
+                property_paths.append(path)
+            elif path.IsPrimPath():
+                prim_paths.append(path)
+
+        # Layer.Traverse walks the specs in C++, it is a few times faster than going through the spec proxies.
+        self.layer.Traverse(Sdf.Path.absoluteRootPath, visit)
+        hidden_paths = set()
+        instancer_paths = set()
+        for path in property_paths:
+            if path.name == UsdGeom.Tokens.visibility:
+                if self.layer.GetAttributeAtPath(path).default == UsdGeom.Tokens.invisible:
+                    hidden_paths.add(path.GetPrimPath())
+            elif path.name == UsdGeom.Tokens.invisibleIds:
+                if self.layer.GetAttributeAtPath(path).HasDefaultValue():
+                    instancer_paths.add(path.GetPrimPath())
+        deactivated_paths = set()
+        for path in prim_paths:
+            prim_spec = self.layer.GetPrimAtPath(path)
+            if prim_spec.HasInfo("active") and not prim_spec.active:
+                deactivated_paths.add(path)
+        self._hidden_paths = hidden_paths
+        self._deactivated_paths = deactivated_paths
+        self._instancer_paths = instancer_paths
@@ -0,0 +1,297 @@
+import contextlib
+import json
+import sys
+import time
+
+import numpy as np
+
+from .frustum import OUTSIDE
+from .settings import are_lights_exempt
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, the peak memory is read with psutil when it is installed.
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Why a prim was kept or hidden. The prims the cameras see, the ones kept for their size, by a rule or because they
+# are lights are kept, the others are hidden.
+VISIBLE = "visible"
+SIZE_EXEMPT = "size_exempt"
+RULE_SHOWN = "rule_shown"
+LIGHT_EXEMPT = "light_exempt"
+OUTSIDE_FRUSTUM = "outside_frustum"
+BEHIND_CAMERA = "behind_camera"
+OCCLUDED = "occluded"
+TOO_FAR = "too_far"
+TOO_SMALL = "too_small"
+RULE_HIDDEN = "rule_hidden"
+REASONS = (
+    VISIBLE,
+    SIZE_EXEMPT,
+    RULE_SHOWN,
+    LIGHT_EXEMPT,
+    OUTSIDE_FRUSTUM,
+    BEHIND_CAMERA,
+    OCCLUDED,
+    TOO_FAR,
+    TOO_SMALL,
+    RULE_HIDDEN,
+)
+HIDDEN_REASONS = REASONS[REASONS.index(OUTSIDE_FRUSTUM):]
+
+# Index of the near plane in the planes of get_planes_from_matrices.
+NEAR_PLANE = 4
+
+
+def get_boxes_behind(planes, mins, maxs):
+    """
+    It checks which boxes are completely behind the cameras, on the back side of the near plane
+
+    :param planes: A (V, 6, 4) stack of frustum planes
+    :param mins: A (N, 3) array with the minimum corner of every box
+    :param maxs: A (N, 3) array with the maximum corner of every box
+    :return: A (V, N) bool array.
+    """
+    near = np.asarray(planes, dtype=np.float64)[:, NEAR_PLANE]
+    with np.errstate(invalid="ignore"):
+        centers = (mins + maxs) * 0.5
+        extents = (maxs - mins) * 0.5
+        distances = centers @ near[:, :3].T + near[:, 3]
+        radii = extents @ np.abs(near[:, :3]).T
+        return (distances < -radii).T
+
+
+def get_decision_reasons(
+    settings,
+    states,
+    is_distant,
+    is_too_far,
+    is_big,
+    behind=None,
+    occluded=None,
+    show=None,
+    hide=None,
+    is_light=None,
+):
+    """
+    It explains the decisions of a batch of prims, the same way as HierarchicalCuller.get_prim_reason decides them
+
+    A prim hidden by the cameras gets the reason of the views that see it: too far if it is beyond the max distance,
+    too small if only the pixel coverage hides it. A prim that no view sees is occluded, behind the cameras or outside
+    of the frustums.
+
+    :param settings: OptimizerSettings of the pass
+    :param states: A (V, N) array of frustum states
+    :param is_distant: A (V, N) bool array, the prim is beyond its distance limit
+    :param is_too_far: A (V, N) bool array, the prim is beyond the max distance
+    :param is_big: A (N,) bool array, the prim is bigger than the max size
+    :param behind: A (V, N) bool array, the prim is behind the camera
+    :param occluded: A (V, N) bool array, the prim is in the frustum but occluded
+    :param show: A (N,) bool array, a rule shows the prim
+    :param hide: A (N,) bool array, a rule hides the prim
+    :param is_light: A (N,) bool array, the prim is a light
+    :return: A (N,) array of indices in REASONS.
+    """
+    in_view = states != OUTSIDE
+    count = in_view.shape[1]
+    seen = np.any(in_view & ~is_distant, axis=0)
+    kept_for_size = np.zeros(count, dtype=bool)
+    if settings.max_size != 0:
+        kept_for_size = is_big & np.any(~is_distant, axis=0) if settings.ignore_size_distant_objects else is_big
+    outside = np.full(count, REASONS.index(OUTSIDE_FRUSTUM))
+    if behind is not None:
+        outside[np.all(behind, axis=0)] = REASONS.index(BEHIND_CAMERA)
+    if occluded is not None:
+        outside[np.any(occluded, axis=0)] = REASONS.index(OCCLUDED)
+    distant = np.where(np.any(in_view & is_too_far, axis=0), REASONS.index(TOO_FAR), REASONS.index(TOO_SMALL))
+    reasons = np.where(np.any(in_view, axis=0), distant, outside)
+    reasons[kept_for_size] = REASONS.index(SIZE_EXEMPT)
+    reasons[seen] = REASONS.index(VISIBLE)
+    if hide is not None:
+        reasons[hide] = REASONS.index(RULE_HIDDEN)
+    if show is not None:
+        reasons[show] = REASONS.index(RULE_SHOWN)
+    if is_light is not None and are_lights_exempt(settings):
+        reasons[is_light & (reasons >= REASONS.index(OUTSIDE_FRUSTUM))] = REASONS.index(LIGHT_EXEMPT)
+    return reasons
+
+
+def get_peak_memory():
+    """
+    It returns the peak memory the process has used so far
+
+    :return: The peak resident memory in bytes, None if it can't be read on this platform.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes.
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is None:
+        return None
+    memory_info = psutil.Process().memory_info()
+    return getattr(memory_info, "peak_wset", None)
+
+
+class OptimizationReport:
+    """
+    What an optimize pass did: the time and the prims of every phase, why prims were kept or hidden, and the memory
+
+    Phases are measured with measure() around work that doesn't yield, and time spread over several steps is added up
+    with add(), so the report only holds the time spent working, not the frames in between.
+
+    Args:
+        profiler (object): Receives a begin(name) and an end() call around every measured block, to show the phases
+            in a profiler like the one of Kit.
+    """
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.phases = {}
+        self.decisions = dict.fromkeys(REASONS, 0)
+        self.counters = {}
+        self.started_at = time.time()
+        self.duration = None
+        self.peak_memory = None
+        # Highest peak memory of the worker processes whose reports were merged, for sharded passes.
+        self.worker_peak_memory = None
+        self._peak_memory_at_start = get_peak_memory()
+        self._perf_started_at = time.perf_counter()
+
+    @contextlib.contextmanager
+    def measure(self, phase, prims=0):
+        """
+        It measures the block as part of the phase
+
+        :param phase: Name of the phase
+        :param prims: Number of prims the block handles
+        """
+        if self.profiler is not None:
+            self.profiler.begin(phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start, prims)
+            if self.profiler is not None:
+                self.profiler.end()
+
+    def add(self, phase, seconds, prims=0):
+        """
+        It adds time and prims to the phase
+
+        :param phase: Name of the phase
+        :param seconds: Time spent
+        :param prims: Number of prims handled
+        """
+        totals = self.phases.get(phase)
+        if totals is None:
+            totals = self.phases[phase] = {"seconds": 0.0, "prims": 0, "calls": 0}
+        totals["seconds"] += seconds
+        totals["prims"] += int(prims)
+        totals["calls"] += 1
+
+    def count(self, name, value=1):
+        """
+        It adds to a counter, like the number of subtrees hidden at their root
+
+        :param name: Name of the counter
+        :param value: Value to add
+        """
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def count_decisions(self, reasons):
+        """
+        It counts the decisions of a batch of prims by reason
+
+        :param reasons: Indices in REASONS, as returned by get_decision_reasons
+        """
+        counts = np.bincount(np.asarray(reasons, dtype=np.int64), minlength=len(REASONS))
+        for reason, reason_count in zip(REASONS, counts):
+            self.decisions[reason] += int(reason_count)
+
+    def count_decision(self, reason):
+        """
+        It counts the decision of a single prim
+
+        :param reason: One of REASONS
+        """
+        self.decisions[reason] += 1
+
+    def merge(self, data):
+        """
+        It adds the phases, decisions and counters of a report done in another process, like a shard of the stage
+
+        :param data: A dict returned by to_dict()
+        """
+        for phase, totals in data["phases"].items():
+            merged = self.phases.setdefault(phase, {"seconds": 0.0, "prims": 0, "calls": 0})
+            for key in merged:
+                merged[key] += totals[key]
+        for reason, reason_count in data["decisions"].items():
+            self.decisions[reason] += reason_count
+        for name, value in data["counters"].items():
+            self.count(name, value)
+        if data["peak_memory"] is not None:
+            self.worker_peak_memory = max(self.worker_peak_memory or 0, data["peak_memory"])
+
+    def finish(self):
+        """
+        It records the duration of the pass and the memory, should be called once the pass is done
+        """
+        self.duration = time.perf_counter() - self._perf_started_at
+        self.peak_memory = get_peak_memory()
+
+    def to_dict(self):
+        """
+        It returns the report as a dict that can be written to JSON
+
+        :return: A dict
+        """
+        peak_growth = None
+        if self.peak_memory is not None and self._peak_memory_at_start is not None:
+            peak_growth = self.peak_memory - self._peak_memory_at_start
+        return {
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "phases": self.phases,
+            "decisions": self.decisions,
+            "hidden": sum(self.decisions[reason] for reason in HIDDEN_REASONS),
+            "counters": self.counters,
+            "peak_memory": self.peak_memory,
+            "peak_memory_growth": peak_growth,
+            "worker_peak_memory": self.worker_peak_memory,
+        }
+
+    def write_json(self, path):
+        """
+        It writes the report to a JSON file
+
+        :param path: Path of the file
+        """
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+
+    def format_lines(self):
+        """
+        It describes the report in a few lines of text, for the window
+
+        :return: A list of strings
+        """
+        lines = []
+        if self.duration is not None:
+            lines.append(f"Total: {self.duration:.2f} s")
+        for phase, totals in self.phases.items():
+            lines.append(f"{phase}: {totals['seconds']:.3f} s, {totals['prims']} prims")
+        decisions = [f"{reason.replace('_', ' ')}: {count}" for reason, count in self.decisions.items() if count]
+        if decisions:
+            lines.append(", ".join(decisions))
+        if self.peak_memory is not None:
+            lines.append(f"Peak memory: {self.peak_memory / 2 ** 20:.0f} MB")
+        if self.worker_peak_memory is not None:
+            lines.append(f"Worker peak memory: {self.worker_peak_memory / 2 ** 20:.0f} MB")
+        return lines
@@ -0,0 +1,224 @@
+import json
+import re
+
+from pxr import Usd, UsdGeom
+
+# What a filter rule does with the prims it matches.
+SHOW = "show"
+HIDE = "hide"
+
+# What a filter rule matches against.
+RULE_FIELDS = ("name", "path", "type", "kind", "purpose", "attribute")
+
+# Fields whose values repeat a lot across a stage, so their matches are memoized per value.
+MEMOIZED_FIELDS = ("name", "type", "kind", "purpose", "attribute")
+
+
+class FilterRule:
+    """
+    A rule that forces the prims it matches to be shown or hidden, no matter what the cameras see
+
+    The pattern matches the same way as the show and hide patterns of the window: the value contains the pattern
+    (case insensitive) or matches it as a regular expression.
+
+    Args:
+        action (str): SHOW or HIDE.
+        field (str): What is matched: "name", "path", "type", "kind", "purpose" or "attribute".
+        pattern (str): Text or regex pattern.
+        attribute (str): Name of the attribute whose value is matched, for the "attribute" field.
+    """
+
+    def __init__(self, action, field, pattern, attribute=""):
+        if action not in (SHOW, HIDE):
+            raise ValueError(f"unknown rule action {action!r}, expected {SHOW!r} or {HIDE!r}")
+        if field not in RULE_FIELDS:
+            raise ValueError(f"unknown rule field {field!r}, expected one of {', '.join(RULE_FIELDS)}")
+        if field == "attribute" and not attribute:
+            raise ValueError("attribute rules need the name of the attribute")
+        self.action = action
+        self.field = field
+        self.pattern = pattern
+        self.attribute = attribute
+
+    def __repr__(self):
+        return f"FilterRule({self.action!r}, {self.field!r}, {self.pattern!r}, {self.attribute!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, FilterRule) and repr(self) == repr(other)
+
+    def __hash__(self):
+        return hash(repr(self))
+
+    @classmethod
+    def parse(cls, action, field, pattern):
+        """
+        It builds a rule from command line words, the attribute field is written "attribute:<name>"
+
+        :param action: SHOW or HIDE
+        :param field: The field, or "attribute:" followed by the name of the attribute
+        :param pattern: Text or regex pattern
+        :return: FilterRule
+        """
+        attribute = ""
+        if field.startswith("attribute:"):
+            field, attribute = "attribute", field[len("attribute:"):]
+        return cls(action, field, pattern, attribute)
+
+    def to_dict(self):
+        """
+        It returns the rule as a dict that can be written to JSON
+
+        :return: A dict
+        """
+        data = {"action": self.action, "field": self.field, "pattern": self.pattern}
+        if self.attribute:
+            data["attribute"] = self.attribute
+        return data
+
+
+def load_filter_rules(path):
+    """
+    It reads an ordered list of filter rules from a JSON file
+
+    The file holds a list of objects with "action", "field", "pattern" and, for attribute rules, "attribute".
+
+    :param path: Path of the JSON file
+    :return: A list of FilterRule
+    """
+    with open(path, "r", encoding="utf-8") as rules_file:
+        data = json.load(rules_file)
+    return [
+        FilterRule(item["action"], item["field"], item.get("pattern", ""), item.get("attribute", ""))
+        for item in data
+    ]
+
+
+def get_filter_rules(settings):
+    """
+    It returns every filter rule of the settings in order, the show and hide patterns come last, show first
+
+    :param settings: OptimizerSettings
+    :return: A list of FilterRule
+    """
+    rules = list(settings.rules)
+    if settings.show_pattern:
+        rules.append(FilterRule(SHOW, "name", settings.show_pattern))
+    if settings.hide_pattern:
+        rules.append(FilterRule(HIDE, "name", settings.hide_pattern))
+    return rules
+
+
+class _CompiledRule:
+    """
+    A filter rule with its regex compiled and the matches of the values seen so far
+
+    Args:
+        rule (FilterRule): The rule.
+    """
+
+    def __init__(self, rule):
+        self.action = rule.action
+        self.field = rule.field
+        self.attribute = rule.attribute
+        self.text = rule.pattern.lower()
+        try:
+            self.regex = re.compile(rule.pattern)
+        except re.error:
+            # A pattern that is not a valid regex, for example while it is being typed, still matches as text.
+            self.regex = None
+        self.matches = {} if rule.field in MEMOIZED_FIELDS else None
+
+    def match(self, value):
+        """
+        It checks if the value contains the pattern or matches it as a regular expression
+
+        :param value: The value of the field, as a string
+        :return: True if the rule applies.
+        """
+        if self.matches is not None:
+            matched = self.matches.get(value)
+            if matched is None:
+                matched = self._match(value)
+                self.matches[value] = matched
+            return matched
+        return self._match(value)
+
+    def _match(self, value):
+        return self.text in value.lower() or (self.regex is not None and self.regex.match(value) is not None)
+
+
+class CompiledRules:
+    """
+    The filter rules of a pass, compiled once: the first rule that matches a prim decides if it is shown or hidden
+
+    The values of the fields are read once per prim and only for the fields the rules use, and the matches of
+    names, types, kinds, purposes and attribute values are memoized, so the same value is never matched twice.
+
+    Args:
+        rules (List[FilterRule]): The rules, in order.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._compiled = [_CompiledRule(rule) for rule in self.rules if rule.pattern]
+        self.key = repr(self.rules)
+        self.has_show_rules = any(rule.action == SHOW for rule in self._compiled)
+        self.has_hide_rules = any(rule.action == HIDE for rule in self._compiled)
+
+    def __bool__(self):
+        return bool(self._compiled)
+
+    def evaluate(self, prim):
+        """
+        It returns what the rules do with the prim
+
+        :param prim: Usd.Prim
+        :return: SHOW, HIDE, or None if no rule matches.
+        """
+        values = {}
+        for rule in self._compiled:
+            value_key = (rule.field, rule.attribute)
+            value = values.get(value_key)
+            if value is None:
+                value = get_field_value(prim, rule.field, rule.attribute)
+                values[value_key] = value
+            if rule.match(value):
+                return rule.action
+        return None
+
+
+def get_field_value(prim, field, attribute=""):
+    """
+    It reads the value of a prim a filter rule matches against
+
+    :param prim: Usd.Prim
+    :param field: One of RULE_FIELDS
+    :param attribute: Name of the attribute, for the "attribute" field
+    :return: The value as a string, empty if the prim doesn't have one.
+    """
+    if field == "name":
+        return prim.GetName()
+    if field == "path":
+        return prim.GetPath().pathString
+    if field == "type":
+        return prim.GetTypeName()
+    if field == "kind":
+        return Usd.ModelAPI(prim).GetKind() or ""
+    if field == "purpose":
+        # The purpose is inherited, so proxies under a proxy group are matched as well.
+        return UsdGeom.Imageable(prim).ComputePurpose() if prim.IsA(UsdGeom.Imageable) else ""
+    attr = prim.GetAttribute(attribute)
+    if not attr:
+        return ""
+    value = attr.Get()
+    return "" if value is None else str(value)
+
+
+def compile_rules(settings):
+    """
+    It compiles the filter rules of the settings for a pass
+
+    :param settings: OptimizerSettings of the pass
+    :return: CompiledRules
+    """
+    return CompiledRules(get_filter_rules(settings))
@@ -0,0 +1,92 @@
+# Types of lights that are kept visible unless the lights are processed as well.
+LIGHT_TYPES = (
+    "DistantLight",
+    "SphereLight",
+    "DiskLight",
+    "RectLight",
+    "CylinderLight",
+    "ConeLight",
+)
+
+
+class OptimizerSettings:
+    """
+    Settings of a single optimize pass, the same ones that are shown in the optimizer window
+
+    Args:
+        focal_length (float): Focal length (mm) the camera frustum is computed with during the scan.
+        max_size (float): Objects bigger than this in any dimension are never hidden, 0 disables the check.
+        max_distance (float): Objects further from the camera than this are hidden.
+        ignore_size_distant_objects (bool): Hide distant objects no matter their size.
+        hide_pattern (str): Objects whose name contains or matches this regex are hidden.
+        show_pattern (str): Objects whose name contains or matches this regex are never hidden.
+        process_lights (bool): Lights are hidden like any other object if True, otherwise they are kept.
+        base_path (str): Path of the prim to search for objects under, the default prim if empty.
+        occlusion_culling (bool): Also hide objects that are behind objects bigger than max_size.
+        occlusion_resolution (int): Width in pixels of the depth buffer used for occlusion culling.
+        camera_paths (List[str]): Cameras that are scanned in addition to the active one.
+        time_range (Tuple[float, float]): Time codes the cameras are sampled between, only the default time if None.
+        time_stride (float): Distance in time codes between two samples of the time range.
+        layer_path (str): File of the layer the optimizer writes to, an anonymous session sublayer if empty.
+        rules (List[FilterRule]): Ordered show and hide rules, checked before the show and hide patterns.
+        min_pixel_coverage (float): Objects whose bounding sphere covers fewer pixels than this on the render are
+            hidden like distant objects, 0 disables the check.
+        resolution (Tuple[int, int]): Width and height of the render in pixels, for the pixel coverage.
+        swept_time_range (Tuple[float, float]): Time codes the bounds of animated objects are swept over, sampled with
+            the time stride, their bounds at the default time only if None.
+        light_cutoff (float): Lights are culled by their influence volume, which ends where their intensity falls
+            below this, instead of by their position. 0 disables it.
+    """
+
+    def __init__(
+        self,
+        focal_length=4.0,
+        max_size=150.0,
+        max_distance=10000.0,
+        ignore_size_distant_objects=False,
+        hide_pattern="",
+        show_pattern="",
+        process_lights=False,
+        base_path="",
+        occlusion_culling=False,
+        occlusion_resolution=256,
+        camera_paths=(),
+        time_range=None,
+        time_stride=1.0,
+        layer_path="",
+        rules=(),
+        min_pixel_coverage=0.0,
+        resolution=(1920, 1080),
+        swept_time_range=None,
+        light_cutoff=0.0,
+    ):
+        self.focal_length = focal_length
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.ignore_size_distant_objects = ignore_size_distant_objects
+        self.hide_pattern = hide_pattern
+        self.show_pattern = show_pattern
+        self.process_lights = process_lights
+        self.base_path = base_path
+        self.occlusion_culling = occlusion_culling
+        self.occlusion_resolution = occlusion_resolution
+        self.camera_paths = list(camera_paths)
+        self.time_range = time_range
+        self.time_stride = time_stride
+        self.layer_path = layer_path
+        self.rules = list(rules)
+        self.min_pixel_coverage = min_pixel_coverage
+        self.resolution = tuple(resolution)
+        self.swept_time_range = swept_time_range
+        self.light_cutoff = light_cutoff
+
+
+def are_lights_exempt(settings):
+    """
+    It checks if the lights are kept by the culling of the objects, because they are not processed or because they
+    are culled by their influence volume afterwards
+
+    :param settings: OptimizerSettings
+    :return: True if the lights are never hidden for their position.
+    """
+    return not settings.process_lights or settings.light_cutoff > 0
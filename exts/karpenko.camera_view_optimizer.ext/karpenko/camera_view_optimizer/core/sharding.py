@@ -0,0 +1,154 @@
+from pxr import Sdf, Usd, UsdGeom
+
+from .traversal import get_base_prim
+
+# Name of a child no stage has. Masking a stage to it populates its parent and the ancestors, but none of the
+# children, so the prims of a level of the hierarchy are composed without their subtrees.
+EMPTY_CHILD_NAME = "__cvo_no_children__"
+
+
+def open_masked_stage(input_path, paths, load=Usd.Stage.LoadAll):
+    """
+    It opens a file with only the prims at the paths, their ancestors and their descendants populated
+
+    :param input_path: Path of the file
+    :param paths: Prim paths of the Usd.StagePopulationMask
+    :param load: Usd.Stage.LoadAll or Usd.Stage.LoadNone
+    :return: Usd.Stage, None if the file could not be opened.
+    """
+    mask = Usd.StagePopulationMask()
+    for path in paths:
+        mask.Add(Sdf.Path(path))
+    return Usd.Stage.OpenMasked(input_path, mask, load)
+
+
+def can_split(prim):
+    """
+    It checks if the children of a prim can be culled in different shards
+
+    The prim is then never tested itself, so it must not draw anything on its own: gprims, point instancers and
+    lights are kept whole, and so are instances, whose children are not culled one by one.
+
+    :param prim: Usd.Prim
+    :return: True if the prim can be split.
+    """
+    return (
+        prim.IsActive()
+        and prim.IsDefined()
+        and not prim.IsAbstract()
+        and not prim.IsInstance()
+        and not prim.IsA(UsdGeom.Boundable)
+    )
+
+
+def _get_child_paths(input_path, paths):
+    """
+    It returns the paths of the composed children of the prims, without populating the subtrees of the children
+
+    :param input_path: Path of the file
+    :param paths: Sdf.Path of the prims
+    :return: A dict of Sdf.Path to the list of child Sdf.Path, empty for the prims that can't be split.
+    """
+    stage = open_masked_stage(input_path, [path.AppendChild(EMPTY_CHILD_NAME) for path in paths], Usd.Stage.LoadNone)
+    child_paths = {}
+    for path in paths:
+        prim = stage.GetPrimAtPath(path) if stage else None
+        if not prim or not can_split(prim):
+            child_paths[path] = []
+            continue
+        # The children are not populated, their names are read from the composed index of the prim.
+        child_names, _ = prim.GetPrimIndex().ComputePrimChildNames()
+        child_paths[path] = [path.AppendChild(name) for name in child_names]
+    return child_paths
+
+
+def find_shard_roots(input_path, base_path="", min_count=1, max_depth=4):
+    """
+    It splits the subtree under the base prim into disjoint subtrees that can be culled in different processes
+
+    The children of the base prim are the roots. While there are fewer roots than min_count, the roots that can be
+    split are replaced by their children, at most max_depth times. Every level is composed on its own with a
+    population mask and without payloads, so the whole stage is never held in memory. Prims under payloads are
+    never split.
+
+    :param input_path: Path of the file
+    :param base_path: Path of the prim to search for objects under, the default prim if empty or invalid
+    :param min_count: Number of roots to reach
+    :param max_depth: Maximum number of levels under the children of the base prim that are split
+    :return: A tuple of the base Sdf.Path, the list of root Sdf.Path and the list of split Sdf.Path, the prims
+        between the base prim and the roots. The base path is None if there is no base prim.
+    """
+    root_layer = Sdf.Layer.FindOrOpen(input_path)
+    if not root_layer:
+        return None, [], []
+    candidates = [Sdf.Path(base_path)] if base_path and Sdf.Path.IsValidPathString(base_path) else []
+    if root_layer.defaultPrim:
+        candidates.append(Sdf.Path.absoluteRootPath.AppendChild(root_layer.defaultPrim))
+    candidates = [path for path in candidates if path.IsPrimPath()]
+    if not candidates:
+        return None, [], []
+    stage = open_masked_stage(
+        input_path, [path.AppendChild(EMPTY_CHILD_NAME) for path in candidates], Usd.Stage.LoadNone
+    )
+    base_prim = get_base_prim(stage, base_path) if stage else None
+    if not base_prim:
+        return None, [], []
+    base = base_prim.GetPath()
+
+    roots = _get_child_paths(input_path, [base])[base] or [base]
+    split_paths = []
+    for _ in range(max_depth):
+        if len(roots) >= min_count or roots == [base]:
+            break
+        child_paths = _get_child_paths(input_path, roots)
+        if not any(child_paths.values()):
+            break
+        next_roots = []
+        for path in roots:
+            if child_paths[path]:
+                split_paths.append(path)
+                next_roots.extend(child_paths[path])
+            else:
+                next_roots.append(path)
+        roots = next_roots
+    return base, roots, split_paths
+
+
+def split_shards(paths, shard_count):
+    """
+    It deals the paths into shards one by one, so neighbouring subtrees, which often have similar sizes, end up in
+    different shards
+
+    :param paths: Sdf.Path of the roots
+    :param shard_count: Number of shards
+    :return: A list of lists of Sdf.Path, without empty shards.
+    """
+    shards = [[] for _ in range(max(1, shard_count))]
+    for index, path in enumerate(paths):
+        shards[index % len(shards)].append(path)
+    return [shard for shard in shards if shard]
+
+
+def get_shard_split_paths(shard, split_paths):
+    """
+    It returns the split prims a shard is under, the only ones its masked stage populates
+
+    :param shard: Sdf.Path of the roots of the shard
+    :param split_paths: Sdf.Path of every split prim
+    :return: A list of Sdf.Path
+    """
+    return [path for path in split_paths if any(root.HasPrefix(path) for root in shard)]
+
+
+def filter_shard_paths(paths, shard):
+    """
+    It keeps the paths at or under the roots of a shard
+
+    The cameras are added to the mask of every shard, so a shard also populates their ancestors, which may belong to
+    another shard and are only partly populated.
+
+    :param paths: Sdf.Path of the prims found in the shard
+    :param shard: Sdf.Path of the roots of the shard
+    :return: A list of Sdf.Path
+    """
+    return [path for path in paths if any(path.HasPrefix(root) for root in shard)]
@@ -0,0 +1,437 @@
+import numpy as np
+from pxr import Sdf, Tf, Usd, UsdGeom
+
+from .settings import LIGHT_TYPES
+
+# Bits of the flags the snapshot keeps for every prim, in one byte per prim.
+SHOW_FLAG = np.uint8(1)
+HIDE_FLAG = np.uint8(2)
+DIRTY_FLAG = np.uint8(4)
+HIDDEN_FLAG = np.uint8(8)
+INVISIBLE_FLAG = np.uint8(16)
+# The visibility of the prim changed or was never read, INVISIBLE_FLAG is only right once it is read again.
+VISIBILITY_DIRTY_FLAG = np.uint8(32)
+
+
+def get_flag(flags, flag):
+    """
+    It reads one bit of the flags of the prims
+
+    :param flags: A (N,) uint8 array
+    :param flag: One of the *_FLAG bits
+    :return: A (N,) bool array.
+    """
+    return (flags & flag) != 0
+
+
+def set_flag(flags, flag, values, indices=None):
+    """
+    It writes one bit of the flags of the prims, in place
+
+    :param flags: A (N,) uint8 array
+    :param flag: One of the *_FLAG bits
+    :param values: A bool, or a bool array with a value for every written prim
+    :param indices: Indices of the prims to write, all of them if None
+    """
+    if indices is None:
+        indices = slice(None)
+    flags[indices] = np.where(values, flags[indices] | flag, flags[indices] & ~flag)
+
+
+class NameTable:
+    """
+    Interned strings, every distinct string is stored once, encoded in a single buffer
+
+    A string is found again from its hash, through a sorted array of the hashes, instead of a dict with an entry
+    per string. The hashes are only computed when a string is looked for, a table read from a cache may never need
+    them.
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._hashes = np.zeros(0, dtype=np.int64)
+        self._order = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, name_id):
+        return self._data[self._offsets[name_id]:self._offsets[name_id + 1]].decode()
+
+    @property
+    def nbytes(self):
+        """
+        Memory taken by the table, in bytes
+        """
+        index_bytes = self._hashes.nbytes + self._order.nbytes if self._hashes is not None else 0
+        return len(self._data) + self._offsets.nbytes + index_bytes
+
+    def get_arrays(self):
+        """
+        It returns the arrays the table is made of, without the hashes, to save it
+
+        :return: A dict of name to numpy array.
+        """
+        return {"offsets": self._offsets, "data": np.frombuffer(self._data, dtype=np.uint8)}
+
+    def set_arrays(self, arrays):
+        """
+        It replaces the content of the table with arrays get_arrays returned, the hashes are computed when needed
+
+        :param arrays: A dict of name to numpy array
+        """
+        self._data = bytearray(arrays["data"])
+        self._offsets = arrays["offsets"]
+        self._hashes = None
+        self._order = None
+
+    def copy_arrays(self):
+        """
+        It copies the arrays of the table to memory, when they are mapped from a file that is about to be replaced
+        """
+        self._offsets = np.array(self._offsets)
+
+    def _build_index(self):
+        """
+        It computes the hashes of the strings, if they were not computed yet
+        """
+        if self._hashes is None:
+            self._hashes = np.fromiter((hash(self[name_id]) for name_id in range(len(self))), np.int64, len(self))
+            self._order = np.argsort(self._hashes, kind="stable").astype(np.int32)
+
+    def intern(self, names):
+        """
+        It returns the ids of the strings, the ones that are not in the table yet are added
+
+        :param names: List of str
+        :return: A (N,) int32 array of ids.
+        """
+        # A dict of the batch alone finds the repeated strings, it is dropped once the batch is added.
+        batch_ids = {}
+        inverse = np.fromiter((batch_ids.setdefault(name, len(batch_ids)) for name in names), np.int64, len(names))
+        batch_names = list(batch_ids)
+        hashes = np.fromiter((hash(name) for name in batch_names), np.int64, len(batch_names))
+        self._build_index()
+        positions = np.searchsorted(self._hashes, hashes, sorter=self._order)
+        ids = np.empty(len(batch_names), dtype=np.int32)
+        added = []
+        next_id = len(self)
+        for index, name in enumerate(batch_names):
+            name_id = self._find(name, hashes[index], positions[index])
+            if name_id < 0:
+                name_id = next_id + len(added)
+                added.append(index)
+            ids[index] = name_id
+        if added:
+            encoded = [batch_names[index].encode() for index in added]
+            lengths = np.fromiter((len(data) for data in encoded), np.int64, len(encoded))
+            self._data.extend(b"".join(encoded))
+            self._offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum(lengths)])
+            self._hashes = np.concatenate([self._hashes, hashes[added]])
+            self._order = np.argsort(self._hashes, kind="stable").astype(np.int32)
+        return ids[inverse]
+
+    def _find(self, name, name_hash, position):
+        """
+        It looks for a string among the ones with its hash
+
+        :param name: str
+        :param name_hash: hash of the string
+        :param position: Where the hash is in the sorted hashes
+        :return: The id of the string, -1 if it is not in the table.
+        """
+        while position < len(self._order):
+            name_id = self._order[position]
+            if self._hashes[name_id] != name_hash:
+                break
+            if self[name_id] == name:
+                return int(name_id)
+            position += 1
+        return -1
+
+
+class PathTable:
+    """
+    Interned table of prim paths, stored as arrays instead of an Sdf.Path per prim
+
+    Every entry holds the index of its parent entry and the id of its name in a NameTable, so the names that many
+    prims share, like "Geometry" or "Mesh", are stored once. When prims between an entry and its parent are not in
+    the table, like scopes, the name is the relative path from the parent. Entries without a parent are relative to
+    the root path. Parents are always added before their children, so a parent has a smaller index than its children.
+
+    Entries are found from their path through a sorted array of the hashes of their paths, computed when an entry is
+    first looked for. Paths are built again from the names when they are asked for.
+
+    Args:
+        root_path (Sdf.Path): The path the entries without a parent are relative to.
+    """
+
+    def __init__(self, root_path=Sdf.Path.absoluteRootPath):
+        self.root_path = root_path
+        self.names = NameTable()
+        self.parents = np.zeros(0, dtype=np.int32)
+        self.name_ids = np.zeros(0, dtype=np.int32)
+        self._hashes = np.zeros(0, dtype=np.int64)
+        self._order = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def __getitem__(self, index):
+        return self.get_path(index)
+
+    @property
+    def nbytes(self):
+        """
+        Memory taken by the arrays and the names of the table, in bytes
+        """
+        index_bytes = self._hashes.nbytes + self._order.nbytes if self._hashes is not None else 0
+        return self.names.nbytes + self.parents.nbytes + self.name_ids.nbytes + index_bytes
+
+    def get_arrays(self):
+        """
+        It returns the arrays the table is made of, without the hashes, to save it
+
+        :return: A dict of name to numpy array.
+        """
+        arrays = {"parents": self.parents, "name_ids": self.name_ids}
+        arrays.update({"name_" + name: array for name, array in self.names.get_arrays().items()})
+        return arrays
+
+    def set_arrays(self, arrays):
+        """
+        It replaces the entries of the table with arrays get_arrays returned, the hashes are computed when needed
+
+        :param arrays: A dict of name to numpy array
+        """
+        self.names.set_arrays({name[5:]: array for name, array in arrays.items() if name.startswith("name_")})
+        self.parents = arrays["parents"]
+        self.name_ids = arrays["name_ids"]
+        self._hashes = None
+        self._order = None
+
+    def copy_arrays(self):
+        """
+        It copies the arrays of the table to memory, when they are mapped from a file that is about to be replaced
+        """
+        self.names.copy_arrays()
+        self.parents = np.array(self.parents)
+        self.name_ids = np.array(self.name_ids)
+
+    def _build_index(self):
+        """
+        It computes the hashes of the paths of the entries, if they were not computed yet
+        """
+        if self._hashes is None:
+            self._hashes = np.fromiter((hash(path) for path in self.get_paths(range(len(self)))), np.int64, len(self))
+            self._order = np.argsort(self._hashes, kind="stable").astype(np.int32)
+
+    def append(self, paths, parents):
+        """
+        It adds entries at the end of the table
+
+        :param paths: List of Sdf.Path of the new entries
+        :param parents: A (N,) array with the index of the parent entry of every new entry, -1 for the root path.
+            Parents can be new entries too, if they come first.
+        """
+        start = len(self)
+        root_string = self.root_path.pathString
+        new_strings = [path.pathString for path in paths]
+        names = []
+        for path_string, parent in zip(new_strings, parents):
+            if parent < 0:
+                parent_string = root_string
+            elif parent >= start:
+                parent_string = new_strings[parent - start]
+            else:
+                parent_string = self.get_path(parent).pathString
+            # The name starts after the slash that follows the parent, the absolute root path ends with it already.
+            names.append(path_string[len(parent_string.rstrip("/")) + 1:])
+        self.parents = np.concatenate([self.parents, np.asarray(parents, dtype=np.int32)])
+        self.name_ids = np.concatenate([self.name_ids, self.names.intern(names)])
+        if self._hashes is not None:
+            hashes = np.fromiter((hash(path) for path in paths), np.int64, len(paths))
+            self._hashes = np.concatenate([self._hashes, hashes])
+            self._order = np.argsort(self._hashes, kind="stable").astype(np.int32)
+
+    def compact(self, keep):
+        """
+        It removes the entries that are not kept, the kept ones get new indices in the same order
+
+        Names that are no longer used stay in the name table.
+
+        :param keep: A (N,) bool array. The descendants of a removed entry must be removed too.
+        :return: A (N,) array with the new index of every kept entry.
+        """
+        new_indices = np.cumsum(keep) - 1
+        parents = self.parents[keep]
+        self.parents = np.where(parents >= 0, new_indices[np.maximum(parents, 0)], -1).astype(np.int32)
+        self.name_ids = self.name_ids[keep]
+        if self._hashes is not None:
+            self._hashes = self._hashes[keep]
+            self._order = np.argsort(self._hashes, kind="stable").astype(np.int32)
+        return new_indices
+
+    def find(self, path):
+        """
+        It returns the index of the entry of the path
+
+        :param path: Sdf.Path
+        :return: The index, -1 if the path is not in the table.
+        """
+        self._build_index()
+        path_hash = hash(path)
+        position = int(np.searchsorted(self._hashes, path_hash, sorter=self._order))
+        while position < len(self._order):
+            index = int(self._order[position])
+            if self._hashes[index] != path_hash:
+                break
+            if self.get_path(index) == path:
+                return index
+            position += 1
+        return -1
+
+    def find_ancestor(self, path):
+        """
+        It returns the index of the closest ancestor of the path that is in the table
+
+        :param path: Sdf.Path
+        :return: The index, -1 if no ancestor is in the table.
+        """
+        parent_path = path.GetParentPath()
+        while parent_path != self.root_path and parent_path != Sdf.Path.absoluteRootPath:
+            index = self.find(parent_path)
+            if index >= 0:
+                return index
+            parent_path = parent_path.GetParentPath()
+        return -1
+
+    def get_mask(self, paths):
+        """
+        It returns which entries have one of the paths, from their hashes alone
+
+        An entry whose hash collides with one of the paths is in the mask too, so it should only be used to
+        invalidate entries, where marking one too many is harmless.
+
+        :param paths: Iterable of Sdf.Path
+        :return: A (N,) bool array.
+        """
+        self._build_index()
+        hashes = np.fromiter((hash(path) for path in paths), np.int64)
+        return np.isin(self._hashes, hashes)
+
+    def get_subtree_mask(self, root_paths):
+        """
+        It returns which entries are at or under one of the paths, the paths don't have to be in the table
+
+        :param root_paths: Iterable of Sdf.Path
+        :return: A (N,) bool array.
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        for root_path in root_paths:
+            if self.root_path.HasPrefix(root_path):
+                mask[:] = True
+                return mask
+            if not root_path.HasPrefix(self.root_path):
+                continue
+            index = self.find(root_path)
+            if index >= 0:
+                mask[index] = True
+                continue
+            # The entries under a path that is not in the table have the path at the start of their name.
+            ancestor = self.find_ancestor(root_path)
+            ancestor_path = self.root_path if ancestor < 0 else self.get_path(ancestor)
+            prefix = root_path.MakeRelativePath(ancestor_path).pathString + "/"
+            for child in np.flatnonzero(self.parents == ancestor):
+                if self.names[self.name_ids[child]].startswith(prefix):
+                    mask[child] = True
+        # Parents come before their children, every pass reaches one level deeper.
+        has_parent = self.parents >= 0
+        while True:
+            under = mask | (has_parent & mask[np.maximum(self.parents, 0)])
+            if np.array_equal(under, mask):
+                return mask
+            mask = under
+
+    def get_path(self, index):
+        """
+        It returns the path of an entry
+
+        :param index: Index of the entry
+        :return: Sdf.Path
+        """
+        index = int(index)
+        names = []
+        while index >= 0:
+            names.append(self.names[self.name_ids[index]])
+            index = int(self.parents[index])
+        return self.root_path.AppendPath(Sdf.Path("/".join(reversed(names))))
+
+    def get_paths(self, indices):
+        """
+        It returns the paths of entries, the path of a parent is built once for all of its children
+
+        :param indices: Indices of the entries
+        :return: A list of Sdf.Path.
+        """
+        built = {}
+
+        def build(index):
+            path = built.get(index)
+            if path is None:
+                parent = int(self.parents[index])
+                parent_path = self.root_path if parent < 0 else build(parent)
+                name = self.names[self.name_ids[index]]
+                if "/" in name:
+                    path = parent_path.AppendPath(Sdf.Path(name))
+                else:
+                    path = parent_path.AppendChild(name)
+                built[index] = path
+            return path
+
+        return [build(int(index)) for index in indices]
+
+
+class TypeTable:
+    """
+    Interned prim type names, with what the optimizer needs to know about every type
+
+    Prims only keep the small id of their type, the lights and the gprims are found from the ids.
+    """
+
+    def __init__(self):
+        self.type_names = []
+        self._ids = {}
+        self.is_light = np.zeros(0, dtype=bool)
+        self.is_gprim = np.zeros(0, dtype=bool)
+
+    def intern(self, type_names):
+        """
+        It returns the ids of the type names, the ones that are not in the table yet are added
+
+        :param type_names: List of str
+        :return: A (N,) int16 array of ids.
+        """
+        ids = np.empty(len(type_names), dtype=np.int16)
+        gprim_type = Tf.Type.Find(UsdGeom.Gprim)
+        for index, type_name in enumerate(type_names):
+            type_id = self._ids.get(type_name)
+            if type_id is None:
+                type_id = self._ids[type_name] = len(self.type_names)
+                self.type_names.append(type_name)
+                is_gprim = Usd.SchemaRegistry.GetTypeFromSchemaTypeName(type_name).IsA(gprim_type)
+                self.is_light = np.append(self.is_light, type_name in LIGHT_TYPES)
+                self.is_gprim = np.append(self.is_gprim, is_gprim)
+            ids[index] = type_id
+        return ids
+
+    def count(self, type_ids):
+        """
+        It counts the prims of every type
+
+        :param type_ids: Array of type ids
+        :return: A dict of type name to number of prims, without the types no prim has.
+        """
+        counts = np.bincount(type_ids, minlength=len(self.type_names))
+        return {name: int(count) for name, count in zip(self.type_names, counts) if count}
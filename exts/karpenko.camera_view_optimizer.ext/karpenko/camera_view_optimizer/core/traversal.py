@@ -0,0 +1,110 @@
+from pxr import Usd, UsdGeom
+
+
+class PrimTraversal:
+    """
+    Iterative, prunable depth-first traversal of the prims under a root prim, built on Usd.PrimRange
+
+    Prims are yielded one by one, so the caller never holds a full list of the subtree. Calling prune() while
+    handling a prim skips all of its descendants, which is how a subtree is dropped once its ancestor is decided.
+
+    Args:
+        root_prim (Usd.Prim): The prim to start from.
+        include_root (bool): Yield the root prim itself.
+        skip_scopes (bool): Don't yield Scope prims, their children are still visited.
+        skip_non_imageable (bool): Don't yield prims that can't be hidden (materials, shaders, etc.), their
+            children are still visited.
+        skip_inactive (bool): Don't visit inactive prims and their descendants.
+        skip_abstract (bool): Don't visit abstract prims (classes) and their descendants.
+        instance_proxies (bool): Visit the prims inside of instances as instance proxies.
+        prune_fn (Callable[[Usd.Prim], bool]): If it returns True for a prim, the prim and its descendants are
+            skipped.
+    """
+
+    def __init__(
+        self,
+        root_prim,
+        include_root=False,
+        skip_scopes=True,
+        skip_non_imageable=False,
+        skip_inactive=True,
+        skip_abstract=True,
+        instance_proxies=False,
+        prune_fn=None,
+    ):
+        self.root_prim = root_prim
+        self.include_root = include_root
+        self.skip_scopes = skip_scopes
+        self.skip_non_imageable = skip_non_imageable
+        self.prune_fn = prune_fn
+        self.predicate = self.build_predicate(skip_inactive, skip_abstract, instance_proxies)
+        self._iterator = None
+
+    @staticmethod
+    def build_predicate(skip_inactive=True, skip_abstract=True, instance_proxies=False):
+        """
+        It builds the Usd prim predicate for the traversal
+
+        :param skip_inactive: Exclude inactive prims
+        :param skip_abstract: Exclude abstract prims
+        :param instance_proxies: Traverse into instances
+        :return: Usd._PrimFlagsPredicate
+        """
+        predicate = Usd.PrimIsDefined
+        if skip_inactive:
+            predicate = predicate & Usd.PrimIsActive
+        if skip_abstract:
+            predicate = predicate & ~Usd.PrimIsAbstract
+        if instance_proxies:
+            predicate = Usd.TraverseInstanceProxies(predicate)
+        return predicate
+
+    def __iter__(self):
+        if not self.root_prim:
+            return
+        self._iterator = iter(Usd.PrimRange(self.root_prim, self.predicate))
+        for prim in self._iterator:
+            if prim == self.root_prim and not self.include_root:
+                continue
+            if self.prune_fn is not None and self.prune_fn(prim):
+                self._iterator.PruneChildren()
+                continue
+            if self.skip_scopes and prim.GetTypeName() == "Scope":
+                continue
+            if self.skip_non_imageable and not prim.IsA(UsdGeom.Imageable):
+                continue
+            yield prim
+        self._iterator = None
+
+    def prune(self):
+        """
+        It skips the descendants of the prim that was yielded last
+        """
+        if self._iterator is not None:
+            self._iterator.PruneChildren()
+
+
+def is_invisible(prim):
+    """
+    It checks if the prim has its own visibility set to invisible
+
+    :param prim: Usd.Prim
+    :return: True if the visibility attribute of the prim is "invisible".
+    """
+    visibility_attr = prim.GetAttribute("visibility")
+    return bool(visibility_attr) and visibility_attr.Get() == UsdGeom.Tokens.invisible
+
+
+def get_base_prim(stage, base_path=""):
+    """
+    It returns the prim at the base path, or the default prim if the base path is empty or invalid
+
+    :param stage: Usd.Stage
+    :param base_path: Path of the prim to search for objects under
+    :return: Usd.Prim
+    """
+    if base_path:
+        base_prim = stage.GetPrimAtPath(base_path)
+        if base_prim:
+            return base_prim
+    return stage.GetDefaultPrim()
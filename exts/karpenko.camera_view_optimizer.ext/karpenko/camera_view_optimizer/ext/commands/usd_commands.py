@@ -1,94 +1,337 @@
-from typing import List
+from typing import Dict, List
 
 import omni.kit.commands
 import omni.timeline
 import omni.usd
-from pxr import UsdGeom
+from pxr import Sdf, Usd, UsdGeom
+
+from ...core.authoring import (get_make_visible_paths, restore_active_opinions, restore_invisible_ids_opinions,
+                               restore_visibility_opinions, set_active_opinions, set_invisible_ids_opinions,
+                               set_visibility_opinions)
+from ...core.layers import clear_layer_prims, restore_layer_content
+from ...core.namespace import delete_prim_specs, get_root_paths, restore_deleted_prims, split_deletable_paths
 
 
 class HideSelectedPrimsCommand(omni.kit.commands.Command):
     """
     Hides the selected primitives
 
+    All visibility opinions are written in one change block, undo restores the opinions that were there before.
+
     Args:
         selected_paths (List[str]): Prim paths.
+        layer_identifier (str): Layer to write the opinions to, the current edit target if None.
     """
 
-    def __init__(self, selected_paths: List[str]):
+    def __init__(self, selected_paths: List[str], layer_identifier: str = None):
         """
         This function is called when the user clicks the button in the UI. It takes the list of selected 
         paths and stores it in the class
         
         :param selected_paths: List[str]
         :type selected_paths: List[str]
+        :param layer_identifier: Layer to write the opinions to, the current edit target if None
         """
         self._stage = omni.usd.get_context().get_stage()
-        self._selected_paths = selected_paths.copy()
+        self._selected_paths = list(selected_paths)
+        self._layer_identifier = layer_identifier
+        self._undo_state = None
+
+    def _get_edit_target(self):
+        """
+        It returns the edit target the opinions are written to
+        """
+        if self._layer_identifier:
+            return Usd.EditTarget(Sdf.Layer.Find(self._layer_identifier))
+        return self._stage.GetEditTarget()
 
     def _hide(self):
         """
         This function takes the selected prims and makes them invisible
         """
-        for selected_path in self._selected_paths:
-            selected_prim = self._stage.GetPrimAtPath(selected_path)
-            imageable = UsdGeom.Imageable(selected_prim)
-            imageable.MakeInvisible()
+        self._undo_state = set_visibility_opinions(
+            self._get_edit_target(),
+            self._selected_paths,
+            UsdGeom.Tokens.invisible,
+        )
 
-    def _show(self):
+    def _restore(self):
         """
-        It makes visible all the selected prims in the stage
+        It restores the visibility the selected prims had before the command
         """
-        for selected_path in self._selected_paths:
-            selected_prim = self._stage.GetPrimAtPath(selected_path)
-            imageable = UsdGeom.Imageable(selected_prim)
-            imageable.MakeVisible()
+        if self._undo_state is not None:
+            restore_visibility_opinions(self._selected_paths, self._undo_state)
+            self._undo_state = None
 
     def do(self):
         self._hide()
 
     def undo(self):
-        self._show()
+        self._restore()
 
 
 class ShowSelectedPrimsCommand(omni.kit.commands.Command):
     """
     Shows the selected primitives
 
+    Like UsdGeom.Imageable.MakeVisible(), invisible ancestors are made visible and their other children are made
+    invisible. All visibility opinions are written in one change block, undo restores the opinions that were there
+    before.
+
     Args:
         selected_paths (List[str]): Prim paths.
+        layer_identifier (str): Layer to write the opinions to, the current edit target if None.
     """
 
-    def __init__(self, selected_paths: List[str]):
+    def __init__(self, selected_paths: List[str], layer_identifier: str = None):
         """
         This function is called when the user clicks the button in the UI. It takes the list of selected
         paths and stores it in the class
         
         :param selected_paths: List[str]
         :type selected_paths: List[str]
+        :param layer_identifier: Layer to write the opinions to, the current edit target if None
         """
         self._stage = omni.usd.get_context().get_stage()
-        self._selected_paths = selected_paths.copy()
+        self._selected_paths = list(selected_paths)
+        self._layer_identifier = layer_identifier
+        self._undo_states = None
 
-    def _hide(self):
+    def _get_edit_target(self):
         """
-        This function takes the selected prims and makes them invisible
+        It returns the edit target the opinions are written to
         """
-        for selected_path in self._selected_paths:
-            selected_prim = self._stage.GetPrimAtPath(selected_path)
-            imageable = UsdGeom.Imageable(selected_prim)
-            imageable.MakeInvisible()
+        if self._layer_identifier:
+            return Usd.EditTarget(Sdf.Layer.Find(self._layer_identifier))
+        return self._stage.GetEditTarget()
 
     def _show(self):
         """
         It makes visible all the selected prims in the stage
         """
-        for selected_path in self._selected_paths:
-            selected_prim = self._stage.GetPrimAtPath(selected_path)
-            imageable = UsdGeom.Imageable(selected_prim)
-            imageable.MakeVisible()
+        edit_target = self._get_edit_target()
+        shown_paths, hidden_paths = get_make_visible_paths(self._stage, self._selected_paths)
+        with Sdf.ChangeBlock():
+            self._undo_states = [
+                (shown_paths, set_visibility_opinions(edit_target, shown_paths, UsdGeom.Tokens.inherited)),
+                (hidden_paths, set_visibility_opinions(edit_target, hidden_paths, UsdGeom.Tokens.invisible)),
+            ]
+
+    def _restore(self):
+        """
+        It restores the visibility the selected prims, their ancestors and their siblings had before the command
+        """
+        if self._undo_states is not None:
+            with Sdf.ChangeBlock():
+                for paths, undo_state in reversed(self._undo_states):
+                    restore_visibility_opinions(paths, undo_state)
+            self._undo_states = None
 
     def do(self):
         self._show()
 
     def undo(self):
-        self._hide()
+        self._restore()
+
+
+class SetInstancerInvisibleIdsCommand(omni.kit.commands.Command):
+    """
+    Hides instances of point instancers by their ids
+
+    Every instancer gets one invisibleIds value, all written in one change block, undo restores the values that
+    were there before.
+
+    Args:
+        invisible_ids (Dict[str, List[int]]): Ids of the instances to hide, by instancer path.
+        layer_identifier (str): Layer to write the opinions to, the current edit target if None.
+    """
+
+    def __init__(self, invisible_ids: Dict[str, List[int]], layer_identifier: str = None):
+        """
+        It stores the ids to write
+
+        :param invisible_ids: Ids of the instances to hide, by instancer path
+        :param layer_identifier: Layer to write the opinions to, the current edit target if None
+        """
+        self._stage = omni.usd.get_context().get_stage()
+        self._invisible_ids = dict(invisible_ids)
+        self._layer_identifier = layer_identifier
+        self._undo_state = None
+
+    def do(self):
+        if self._layer_identifier:
+            edit_target = Usd.EditTarget(Sdf.Layer.Find(self._layer_identifier))
+        else:
+            edit_target = self._stage.GetEditTarget()
+        self._undo_state = set_invisible_ids_opinions(edit_target, self._invisible_ids)
+
+    def undo(self):
+        if self._undo_state is not None:
+            restore_invisible_ids_opinions(self._undo_state)
+            self._undo_state = None
+
+
+class DeleteSelectedPrimsCommand(omni.kit.commands.Command):
+    """
+    Deletes the selected primitives, with one batched namespace edit per layer of the layer stack
+
+    Selected prims under another selected prim are deleted with it. Prims that also come from a reference, a payload
+    or a variant can't be deleted from the layer stack, they are deactivated in the current edit target instead.
+    Undo brings the prims back at the place they had among their siblings.
+
+    Args:
+        selected_paths (List[str]): Prim paths.
+    """
+
+    def __init__(self, selected_paths: List[str]):
+        """
+        It stores the paths to delete
+
+        :param selected_paths: Prim paths
+        """
+        self._stage = omni.usd.get_context().get_stage()
+        self._selected_paths = list(selected_paths)
+        self._undo_state = None
+        self._deactivated_paths = []
+        self._active_undo_state = None
+
+    def do(self):
+        root_paths = get_root_paths(Sdf.Path(path) for path in self._selected_paths)
+        deletable_paths, self._deactivated_paths = split_deletable_paths(self._stage, root_paths)
+        self._undo_state = delete_prim_specs(self._stage, deletable_paths)
+        if self._deactivated_paths:
+            self._active_undo_state = set_active_opinions(self._stage, self._deactivated_paths, False)
+
+    def undo(self):
+        if self._active_undo_state is not None:
+            restore_active_opinions(self._deactivated_paths, self._active_undo_state)
+            self._active_undo_state = None
+        if self._undo_state is not None:
+            restore_deleted_prims(self._undo_state)
+            self._undo_state = None
+
+
+class DeactivateSelectedPrimsCommand(omni.kit.commands.Command):
+    """
+    Deactivates the selected primitives, which frees their composition and memory like deleting them
+
+    All active opinions are written in one change block, undo restores the opinions that were there before.
+
+    Args:
+        selected_paths (List[str]): Prim paths.
+        layer_identifier (str): Layer to write the opinions to, the current edit target if None.
+    """
+
+    def __init__(self, selected_paths: List[str], layer_identifier: str = None):
+        """
+        It stores the paths to deactivate
+
+        :param selected_paths: Prim paths
+        :param layer_identifier: Layer to write the opinions to, the current edit target if None
+        """
+        self._stage = omni.usd.get_context().get_stage()
+        # A prim under a deactivated prim is no longer composed, it needs no opinion of its own.
+        self._selected_paths = get_root_paths(Sdf.Path(path) for path in selected_paths)
+        self._layer_identifier = layer_identifier
+        self._undo_state = None
+
+    def do(self):
+        if self._layer_identifier:
+            edit_target = Usd.EditTarget(Sdf.Layer.Find(self._layer_identifier))
+        else:
+            edit_target = self._stage.GetEditTarget()
+        self._undo_state = set_active_opinions(edit_target, self._selected_paths, False)
+
+    def undo(self):
+        if self._undo_state is not None:
+            restore_active_opinions(self._selected_paths, self._undo_state)
+            self._undo_state = None
+
+
+class ClearOptimizationLayerCommand(omni.kit.commands.Command):
+    """
+    Removes every opinion of the optimization layer, which shows everything the optimizer has hidden at once
+
+    Args:
+        layer_identifier (str): Identifier of the optimization layer.
+    """
+
+    def __init__(self, layer_identifier: str):
+        """
+        It stores the identifier of the layer to clear
+
+        :param layer_identifier: Identifier of the optimization layer
+        """
+        self._layer_identifier = layer_identifier
+        self._backup = None
+
+    def do(self):
+        layer = Sdf.Layer.Find(self._layer_identifier)
+        if layer:
+            self._backup = clear_layer_prims(layer)
+
+    def undo(self):
+        layer = Sdf.Layer.Find(self._layer_identifier)
+        if layer and self._backup is not None:
+            restore_layer_content(layer, self._backup)
+            self._backup = None
+
+
+class SetStageLoadRulesCommand(omni.kit.commands.Command):
+    """
+    Sets which payloads of the stage are loaded, undo restores the load rules that were there before
+
+    Args:
+        load_rules (Usd.StageLoadRules): The new load rules.
+        previous_load_rules (Usd.StageLoadRules): Load rules to restore on undo, the current ones if None.
+    """
+
+    def __init__(self, load_rules: Usd.StageLoadRules, previous_load_rules: Usd.StageLoadRules = None):
+        """
+        It stores the load rules to set
+
+        :param load_rules: The new load rules
+        :param previous_load_rules: Load rules to restore on undo, the current ones if None
+        """
+        self._stage = omni.usd.get_context().get_stage()
+        self._load_rules = load_rules
+        self._previous_load_rules = previous_load_rules
+
+    def do(self):
+        if self._previous_load_rules is None:
+            self._previous_load_rules = self._stage.GetLoadRules()
+        self._stage.SetLoadRules(self._load_rules)
+
+    def undo(self):
+        if self._previous_load_rules is not None:
+            self._stage.SetLoadRules(self._previous_load_rules)
+
+
+class RecordExecutedCommandsCommand(omni.kit.commands.Command):
+    """
+    Adds commands that were already executed to the undo history as one step, undo undoes them in reverse order
+
+    Args:
+        commands (List[omni.kit.commands.Command]): The executed commands, in the order they were executed.
+    """
+
+    def __init__(self, commands: List[omni.kit.commands.Command]):
+        """
+        It stores the executed commands
+
+        :param commands: The executed commands, in the order they were executed
+        """
+        self._commands = list(commands)
+        # The commands are executed already, they are only executed again on redo.
+        self._is_done = True
+
+    def do(self):
+        if not self._is_done:
+            for command in self._commands:
+                command.do()
+        self._is_done = True
+
+    def undo(self):
+        for command in reversed(self._commands):
+            command.undo()
+        self._is_done = False
@@ -1,20 +1,95 @@
 import asyncio
 import math
-import re
+import os
+import time
 
+import carb.profiler
 import omni.ext
 import omni.kit.commands
-import omni.kit.viewport_legacy
-import omni.physx.scripts.utils as core_utils
+import omni.timeline
 import omni.ui as ui
 import omni.usd
-from omni.kit.viewport.utility import (get_active_viewport_camera_string,
-                                       get_active_viewport_window,
-                                       get_ui_position_for_prim)
-from pxr import Gf, Sdf, Usd, UsdGeom
+from omni.kit.viewport.utility import get_active_viewport, get_active_viewport_camera_string
+from pxr import UsdGeom
 
+from ..core.authoring import clear_visibility_opinions, set_visibility_opinions
+from ..core.bounds import SceneBounds
+from ..core.cache import get_cache_path
+from ..core.coverage import get_view_pixel_scales
+from ..core.culling import HierarchicalCuller
+from ..core.frustum import get_frustums_planes, get_view_frustums
+from ..core.incremental import IncrementalOptimizer
+from ..core.instancers import find_culled_instances
+from ..core.layers import (find_optimization_layer, get_or_create_optimization_layer, remove_optimization_layer,
+                           set_optimization_layer_muted)
+from ..core.lights import find_culled_lights
+from ..core.namespace import get_root_paths
+from ..core.payloads import find_culled_payloads, get_reload_rules, get_unload_rules, plan_payload_loading
+from ..core.progress import JobProgress
+from ..core.registry import OptimizedPrimsRegistry
+from ..core.report import OptimizationReport
+from ..core.rules import load_filter_rules
+from ..core.settings import OptimizerSettings
+from ..core.traversal import PrimTraversal, get_base_prim, is_invisible
 from .style import cvo_window_style
 
+# How long the cameras have to stay still before live culling writes its changes.
+LIVE_SETTLE_SECONDS = 0.3
+# Time a job may spend per frame before the window and the viewport get to update.
+JOB_FRAME_SECONDS = 0.02
+# Number of prims a job visits, or writes with one command, between two steps.
+JOB_CHUNK_SIZE = 2000
+# Mask of the profiler zones of the optimizer phases.
+PROFILER_MASK = 1
+
+
+class _UndoGroup:
+    """
+    Groups the commands of a job into one undo step, and undoes them all when the job is left before its end
+
+    The job is left before its end when it is cancelled (its generator is closed) or when it fails. Its commands run
+    over several frames, so an undo group kept open in the meantime would also take in what the user does between
+    them. They are executed outside of the undo history instead, and added to it as one step when the job ends.
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # Only the commands of the job are undone, whatever the user did in the meantime is left alone.
+            for command in reversed(self.commands):
+                command.undo()
+        elif self.commands:
+            omni.kit.commands.execute('RecordExecutedCommandsCommand', commands=self.commands)
+        return False
+
+    def execute(self, command_name, **kwargs):
+        """
+        It executes a command as part of the group
+
+        :param command_name: Name of the command
+        :param kwargs: Arguments of the command
+        """
+        command = omni.kit.commands.create(command_name, **kwargs)
+        command.do()
+        self.commands.append(command)
+
+
+class _ProfilerZones:
+    """
+    Shows the phases of the optimization report as zones of the Kit profiler
+    """
+
+    def begin(self, phase):
+        carb.profiler.begin(PROFILER_MASK, f"CameraViewOptimizer.{phase}")
+
+    def end(self):
+        carb.profiler.end(PROFILER_MASK)
+
 
 class CameraViewOptimizer(omni.ext.IExt):
     # ext_id is current extension id. It can be used with extension manager to query additional information, like where
@@ -23,6 +98,27 @@ class CameraViewOptimizer(omni.ext.IExt):
         print("[karpenko.camera_view_optimizer.ext] CameraViewOptimizer startup")
         self._usd_context = omni.usd.get_context()
         self.stage = self._usd_context.get_stage()
+        # Payloads unloaded by Optimize, they are loaded again by Show all.
+        self._unloaded_payloads = []
+        # Optimization layer of every stage, by identifier of its root layer. A muted layer is no longer part of the
+        # layer stack of its stage, an anonymous one would be dropped with all its opinions without this reference.
+        self._optimization_layers = {}
+        # Index of the prims hidden by the optimizer, read from the optimization layer, and the snapshot of the stage.
+        self._registry = None
+        self._incremental_optimizer = None
+        # Revision of the snapshot that is in the cache file, it is only saved again once it changed.
+        self._cached_revision = None
+        self._live_optimizer = None
+        self._live_task = None
+        # The job that is running (Optimize, Show all or Delete hidden), only one can run at a time.
+        self._job_task = None
+        # Number of prims the last full pass tested, to estimate the time left of the next one.
+        self._last_cull_count = None
+        # Rules of the filter rules file, read again only when the file changes.
+        self._filter_rules = []
+        self._filter_rules_key = None
+        # Report of the last Optimize, shown in the window and exported to JSON.
+        self._last_report = None
         self.render_main_window()
         # show the window in the usual way if the stage is loaded
         if self.stage:
@@ -36,16 +132,49 @@ class CameraViewOptimizer(omni.ext.IExt):
         It deletes all the variables that were created in the extension
         """
         print("[karpenko.camera_view_optimizer.ext] CameraViewOptimizer shutdown")
+        self.stop_live_culling()
+        self.cancel_job()
+        if self._incremental_optimizer is not None:
+            self._incremental_optimizer.revoke()
+            self._incremental_optimizer = None
+        if self._registry is not None:
+            self._registry.revoke()
+            self._registry = None
+        self.release_optimization_layers()
         self._fov_slider = None
         self._max_size_slider = None
         self._max_distance_field = None
+        self._min_pixel_coverage_field = None
+        self._light_cutoff_field = None
+        self._occlusion_culling = None
+        self._cameras_field = None
+        self._use_animation_range = None
+        self._frame_stride_field = None
+        self._swept_bounds = None
+        self._layer_path_field = None
+        self._apply_optimization = None
+        self._unload_payloads = None
+        self._deactivate_hidden = None
+        self._cache_snapshot = None
+        self._cull_instances = None
+        self._live_culling = None
+        self._live_budget_field = None
+        self._hysteresis_field = None
         self._hide_objects_field = None
         self._show_objects_field = None
+        self._rules_file_field = None
         self._base_path_field = None
         self._delete_objects = None
         self._button_optimize = None
+        self._button_plan_payloads = None
         self._button_show_all = None
         self._button_delete_hidden = None
+        self._button_cancel = None
+        self._progress_label = None
+        self._stats_label = None
+        self._report_label = None
+        self._report_path_field = None
+        self._profiler_zones = None
 
     def check_stage(self):
         """
@@ -55,143 +184,630 @@ class CameraViewOptimizer(omni.ext.IExt):
             self._usd_context = omni.usd.get_context()
             self.stage = self._usd_context.get_stage()
 
+    def get_optimization_layer(self, settings):
+        """
+        It returns the optimization layer of the current stage, creating it if needed, and keeps it alive while the
+        extension runs, even when Apply optimization mutes it
+
+        :param settings: OptimizerSettings of the pass
+        :return: Sdf.Layer
+        """
+        layer = get_or_create_optimization_layer(self.stage, settings.layer_path)
+        self._optimization_layers[self.stage.GetRootLayer().identifier] = layer
+        return layer
+
+    def release_optimization_layers(self):
+        """
+        It lets the optimization layers go when the extension shuts down
+
+        A muted anonymous layer would be dropped once it is released, so it is removed from the current stage first,
+        which leaves the stage the way it looks with the optimization turned off.
+        """
+        if self.stage:
+            layer = self._optimization_layers.get(self.stage.GetRootLayer().identifier)
+            if layer is not None and layer.anonymous and self.stage.IsLayerMuted(layer.identifier):
+                remove_optimization_layer(self.stage)
+        self._optimization_layers = {}
+
     def optimize(self):
         """
-        It's hiding all objects that are not visible from the camera
+        It starts hiding all objects that are not visible from any of the scanned cameras, as a job
+
+        :return: The asyncio task of the job, None if another job is running.
+        """
+        return self.run_job("Optimize", self._iter_optimize)
+
+    def _iter_optimize(self, progress):
+        """
+        It's hiding all objects that are not visible from any of the scanned cameras, in small steps
+
+        :param progress: JobProgress of the job
+        :return: A generator that yields between chunks of work.
         """
         self.check_stage()
         if not self.stage:
             return
-        window = get_active_viewport_window()
         # Getting the camera path and prim from the stage.
         camera_path = get_active_viewport_camera_string()
         if not camera_path:
             return
-        camera_prim = self.stage.GetPrimAtPath(camera_path)
-        # get camera transform
-        camera_translate = camera_prim.GetAttribute("xformOp:translate").Get()
-        # It's a helper class that allows to get camera forward vector.
-        camera_th = core_utils.CameraTransformHelper(camera_prim)
-        # Get the vecotr of the camera forward direction.
-        cameraForward = camera_th.get_forward()
-
-        # It's creating a new translate location approximately 10 units forward from the camera.
-        # It will be used to determinate if object is in front of the camera or not by comparing distances
-        # between the camera and the object and the camera and the new translate location.
-        camera_new_location = Gf.Vec3d(
-            camera_translate[0]+(cameraForward[0] * 10),
-            camera_translate[1]+(cameraForward[1] * 10),
-            camera_translate[2]+(cameraForward[2] * 10)
-        )
+        settings = self.get_settings()
+        camera_paths = [camera_path] + settings.camera_paths
+        report = OptimizationReport(_ProfilerZones() if self._profiler_zones.model.as_bool else None)
+        # The frustums are built with the scan focal length, so the cameras themselves are never modified.
+        if settings.occlusion_culling:
+            # Occluders depend on the whole scene, so occlusion culling always runs a full pass.
+            progress.start_phase("Scanning", self._last_cull_count)
+            not_visible = []
+            frustums = get_view_frustums(self.stage, camera_paths, settings)
+            if frustums:
+                pixel_scales = get_view_pixel_scales(self.stage, camera_paths, settings)
+                culler = HierarchicalCuller(frustums, settings, pixel_scales=pixel_scales, report=report)
+                not_visible = yield from culler.iter_cull(get_base_prim(self.stage, settings.base_path), progress)
+                self._last_cull_count = culler.tested_count
+        else:
+            # The snapshot of the last pass is kept, only what changed since then is tested again.
+            progress.start_phase("Scanning")
+            optimizer = self.get_incremental_optimizer()
+            not_visible = yield from optimizer.iter_update(camera_paths, settings, progress, report)
+            if optimizer.revision != self._cached_revision and self.get_snapshot_cache_path():
+                with report.measure("cache", len(optimizer.paths)):
+                    self.save_snapshot_cache()
+                yield
 
-        # It's getting all visible objects from the stage.
-        all_objects = self.get_all_objects()
-        # return if there are no objects
-        if not all_objects:
-            return
-        # It's creating a list of objects that not visible from the camera.
-        not_visible = []
-        # Get the camera focal length
-        focal_length_param = Sdf.Path(f'{camera_path}.focalLength')
-        focal_length = self.stage.GetPrimAtPath(Sdf.Path(camera_path)).GetAttribute('focalLength').Get()
-        max_size = self._max_size_slider.model.as_float
-        with omni.kit.undo.group():
-            if all_objects:
-                # Changing the value of the focal length parameter of the camera so we can scan more objects.
-                omni.kit.commands.execute(
-                    'ChangePropertyCommand',
-                    prop_path=focal_length_param,
-                    value=self._fov_slider.model.as_float,
-                    prev=focal_length,
-                    timecode=Usd.TimeCode.Default(),
-                )
+        if settings.light_cutoff > 0:
+            # Lights are decided by what they can light, once the objects are decided.
+            progress.start_phase("Culling lights")
+            with report.measure("lights"):
+                light_paths = find_culled_lights(self.stage, camera_paths, settings, not_visible)
+            not_visible = list(not_visible) + light_paths
+            report.count("culled_lights", len(light_paths))
+            yield
 
-            for prim in all_objects:
-                # Getting the position of the prim in the window.
-                # Because it is a screen-space calculation, for some reason it returns is_visible=True when objects
-                # is right behind the camera.
-                ui_position, is_visible = get_ui_position_for_prim(window, prim.GetPath(), alignment=0)
-                # additional check for visibility with different origin points of the object 
-                if not is_visible:
-                    ui_position, is_visible = get_ui_position_for_prim(window, prim.GetPath(), alignment=1)
-                if not is_visible:
-                    ui_position, is_visible = get_ui_position_for_prim(window, prim.GetPath(), alignment=2)
-                if not is_visible:
-                    ui_position, is_visible = get_ui_position_for_prim(window, prim.GetPath(), alignment=3)
-                if not is_visible:
-                    ui_position, is_visible = get_ui_position_for_prim(window, prim.GetPath(), alignment=4)
-                # Getting the position of the prim in the world.
-                prim_translate = prim.GetAttribute("xformOp:translate").Get()
-                # Calculating the distance between the camera and the prim.
-                distance_to_camera = self.get_distance_between_translations(camera_translate, prim_translate)
-                # Calculating the distance between the camera and the new translate location.
-                distance_to_cameraforward = self.get_distance_between_translations(camera_new_location, prim_translate)
-                # If the distance between the camera and the prim is less than the distance between
-                # the camera and the new translate location, which is 10 units forward from first locatio,
-                #  it means that the prim is behind the camera.
-                if is_visible:
-                    if distance_to_cameraforward > distance_to_camera + 6:
-                        is_visible = False
-
-                is_distant = False
-                # Hide if the object is too distant
-                if distance_to_camera > self._max_distance_field.model.as_float:
-                    is_visible = False
-                    is_distant = True
-
-                # Checking if the ignore_size_distant_objects is true and if the object is distant.
-                if self._ignore_size_distant_objects.model.as_bool and is_distant:
-                    pass
-                else:
-                    prim_size = self.get_prim_size(prim)
-                    # If one of the dimensions of the prim is bigger than the limit, we will not consider to hide it.
-                    if not is_visible and max_size != 0:
-                        if max_size < prim_size[0] or max_size < prim_size[1] or max_size < prim_size[2]:
-                            is_visible = True
-
-                # Checking if the prim name matches the show or hide pattern.
-                prim_name = prim.GetName()
-                show_pattern = self._show_objects_field.model.as_string
-                hide_pattern = self._hide_objects_field.model.as_string
-                if show_pattern and (show_pattern.lower() in prim_name.lower() or re.match(show_pattern, prim_name)):
-                    is_visible = True
-                elif hide_pattern and (hide_pattern.lower() in prim_name.lower() or re.match(hide_pattern, prim_name)):
-                    is_visible = False
-
-                # Final checking if the prim is visible or not.
-                if not is_visible:
-                    not_visible.append({
-                        "prim": prim,
-                        "prim_path": prim.GetPath(),
-                        "type": prim.GetTypeName(),
-                    })
-            # Creating a list of object types that are not allowed to be hidden.
-            not_allowed_types = []
-            # Check if we should hide lights as well
-            if not self._hide_lights.model.as_bool:
-                not_allowed_types.extend([
-                    "DistantLight",
-                    "SphereLight",
-                    "DiskLight",
-                    "RectLight",
-                    "CylinderLight",
-                    "ConeLight"]
+        # Only the difference with what the optimizer has hidden is written, objects that came into view are shown
+        # again. The index is read from the optimization layer, so it is right after an undo too.
+        hidden = set(not_visible)
+        optimized_paths = self.get_optimized_paths()
+        paths_to_hide = [path for path in not_visible if path not in optimized_paths]
+        paths_to_show = [path for path in optimized_paths if path not in hidden]
+        invisible_ids = {}
+        if self._cull_instances.model.as_bool:
+            # The instances of the instancers that stay visible are culled one by one.
+            progress.start_phase("Culling instances")
+            with report.measure("instances"):
+                invisible_ids = find_culled_instances(
+                    self.stage,
+                    camera_paths,
+                    settings,
+                    not_visible,
+                    skip_layer=find_optimization_layer(self.stage),
                 )
-            if not_visible:
-                omni.kit.commands.execute(
+            yield
+        if paths_to_hide or paths_to_show or invisible_ids:
+            # The opinions go to the layer the optimizer owns, the source layers are never modified.
+            optimization_layer = self.get_optimization_layer(settings)
+            self._apply_optimization.model.set_value(True)
+            with _UndoGroup() as undo_group:
+                yield from self._iter_commands(
+                    undo_group,
+                    progress,
+                    "Showing",
+                    'ShowSelectedPrimsCommand',
+                    paths_to_show,
+                    report=report,
+                    layer_identifier=optimization_layer.identifier,
+                )
+                yield from self._iter_commands(
+                    undo_group,
+                    progress,
+                    "Hiding",
                     'HideSelectedPrimsCommand',
-                    selected_paths=[i["prim_path"] for i in not_visible if i["type"] not in not_allowed_types],
+                    paths_to_hide,
+                    report=report,
+                    layer_identifier=optimization_layer.identifier,
                 )
+                if invisible_ids:
+                    with report.measure("commands", len(invisible_ids)):
+                        undo_group.execute(
+                            'SetInstancerInvisibleIdsCommand',
+                            invisible_ids=invisible_ids,
+                            layer_identifier=optimization_layer.identifier,
+                        )
+                if paths_to_hide and self._unload_payloads.model.as_bool:
+                    with report.measure("payloads", len(paths_to_hide)):
+                        self.unload_payloads(paths_to_hide, undo_group)
+        progress.hidden = len(hidden)
+        report.count("hidden", len(hidden))
+        report.count("shown_again", len(paths_to_show))
+        report.count("instancers", len(invisible_ids))
+        report.finish()
+        self.set_last_report(report)
 
-            if focal_length:
-                # Changing the focal length of the camera back to the value before the scan.
-                omni.kit.commands.execute(
-                    'ChangePropertyCommand',
-                    prop_path=focal_length_param,
-                    value=focal_length,
-                    prev=self._fov_slider.model.as_float,
-                    timecode=Usd.TimeCode.Default(),
-                )
+    def _iter_commands(self, undo_group, progress, phase, command_name, paths, report=None, **kwargs):
+        """
+        It executes a command that takes a list of paths in chunks, one chunk per step
+
+        :param undo_group: _UndoGroup the commands are part of
+        :param progress: JobProgress of the job
+        :param phase: Name of the phase shown in the window
+        :param command_name: Name of the command, it takes the paths as selected_paths
+        :param paths: Paths to execute the command on
+        :param report: OptimizationReport the time of the commands is recorded to
+        :param kwargs: Other arguments of the command
+        :return: A generator that yields after every chunk.
+        """
+        if not paths:
+            return
+        if report is None:
+            report = OptimizationReport()
+        progress.start_phase(phase, len(paths))
+        for start in range(0, len(paths), JOB_CHUNK_SIZE):
+            chunk = paths[start:start + JOB_CHUNK_SIZE]
+            with report.measure("commands", len(chunk)):
+                undo_group.execute(command_name, selected_paths=chunk, **kwargs)
+            progress.done += len(chunk)
+            yield
+
+    def run_job(self, name, job_fn):
+        """
+        It runs a long operation as a job that spends a little time per frame, so the app stays responsive
+
+        :param name: Name of the job shown in the window
+        :param job_fn: A function that takes a JobProgress and returns the generator of the job
+        :return: The asyncio task of the job, None if another job is running.
+        """
+        if self._job_task is not None:
+            return None
+        self._job_task = asyncio.ensure_future(self._run_job(name, job_fn))
+        return self._job_task
+
+    def cancel_job(self):
+        """
+        It cancels the running job, what it has already changed is undone
+        """
+        if self._job_task is not None:
+            self._job_task.cancel()
+
+    async def _run_job(self, name, job_fn):
+        """
+        It steps the job until it is done, a frame budget at a time, and shows its progress in the window
+
+        Closing the generator of a cancelled job leaves its undo group, which undoes the commands it executed.
+
+        :param name: Name of the job shown in the window
+        :param job_fn: A function that takes a JobProgress and returns the generator of the job
+        :return: The return value of the job.
+        """
+        progress = JobProgress()
+        steps = job_fn(progress)
+        app = omni.kit.app.get_app()
+        started_at = time.perf_counter()
+        self._set_job_running(True)
+        try:
+            while True:
+                deadline = time.perf_counter() + JOB_FRAME_SECONDS
+                while time.perf_counter() < deadline:
+                    next(steps)
+                self._set_progress_text(f"{name} - {self.format_progress(progress)}")
+                await app.next_update_async()
+        except StopIteration as stop:
+            self._set_progress_text(f"{name} - done in {time.perf_counter() - started_at:.1f} s")
+            return stop.value
+        except asyncio.CancelledError:
+            self._set_progress_text(f"{name} - cancelled")
+            raise
+        except Exception as error:
+            self._set_progress_text(f"{name} - failed: {error}")
+            raise
+        finally:
+            steps.close()
+            self._job_task = None
+            self._set_job_running(False)
+            self.update_stats()
+
+    def format_progress(self, progress):
+        """
+        It describes the progress of a job in one line
+
+        :param progress: JobProgress
+        :return: A string like "Scanning: 2000 / 10000 prims, 150 hidden, 3 s left"
+        """
+        count = f"{progress.done} / {progress.total}" if progress.total else f"{progress.done}"
+        text = f"{progress.phase}: {count} prims, {progress.hidden} hidden"
+        eta = progress.get_eta()
+        if eta is not None:
+            text += f", {math.ceil(eta)} s left"
+        return text
+
+    def _set_progress_text(self, text):
+        """
+        It shows a line of text under the buttons, the window may already be destroyed
+
+        :param text: The text
+        """
+        if self._progress_label is not None:
+            self._progress_label.text = text
+
+    def _set_job_running(self, running):
+        """
+        It disables the buttons that start jobs while a job runs, and enables the Cancel button
+
+        :param running: True if a job runs
+        """
+        buttons = (self._button_optimize, self._button_plan_payloads, self._button_show_all, self._button_delete_hidden)
+        for button in buttons:
+            if button is not None:
+                button.enabled = not running
+        if self._button_cancel is not None:
+            self._button_cancel.enabled = running
+
+    def set_last_report(self, report):
+        """
+        It keeps the report of the last Optimize and shows it in the window
+
+        :param report: OptimizationReport
+        """
+        self._last_report = report
+        if self._report_label is not None:
+            self._report_label.text = "\n".join(report.format_lines())
+
+    def export_report(self):
+        """
+        It writes the report of the last Optimize to the JSON file of the report field
+
+        :return: The path of the file, None if there is no report or no file.
+        """
+        path = self._report_path_field.model.as_string.strip() if self._report_path_field is not None else ""
+        if self._last_report is None or not path:
+            return None
+        try:
+            self._last_report.write_json(path)
+        except OSError as error:
+            self._set_progress_text(f"Report not written: {error}")
+            return None
+        self._set_progress_text(f"Report written to {path}")
+        return path
+
+    def get_incremental_optimizer(self):
+        """
+        It returns the optimizer that keeps the snapshot of the current stage between passes
+
+        :return: IncrementalOptimizer
+        """
+        if self._incremental_optimizer is None or self._incremental_optimizer.stage != self.stage:
+            if self._incremental_optimizer is not None:
+                self._incremental_optimizer.revoke()
+            self._incremental_optimizer = IncrementalOptimizer(self.stage)
+            self._cached_revision = None
+            cache_path = self.get_snapshot_cache_path()
+            if cache_path and self._incremental_optimizer.load_cache(cache_path, find_optimization_layer(self.stage)):
+                # What changed since the cache was saved is traversed again by the next update.
+                self._cached_revision = self._incremental_optimizer.revision
+        return self._incremental_optimizer
+
+    def get_snapshot_cache_path(self):
+        """
+        It returns where the snapshot of the current stage is cached, next to its root layer
+
+        :return: The file path, None if caching is off or the stage is not saved to a file.
+        """
+        if not self.stage or self._cache_snapshot is None or not self._cache_snapshot.model.as_bool:
+            return None
+        return get_cache_path(self.stage)
+
+    def save_snapshot_cache(self):
+        """
+        It saves the snapshot of the incremental optimizer to the cache file of the stage
+
+        :return: True if the snapshot was saved.
+        """
+        cache_path = self.get_snapshot_cache_path()
+        optimizer = self._incremental_optimizer
+        if not cache_path or optimizer is None:
+            return False
+        try:
+            if not optimizer.save_cache(cache_path, find_optimization_layer(self.stage)):
+                return False
+        except OSError as error:
+            print(f"[karpenko.camera_view_optimizer.ext] Could not save the snapshot cache {cache_path}: {error}")
+            return False
+        self._cached_revision = optimizer.revision
+        return True
+
+    def get_scene_snapshot(self):
+        """
+        It brings the snapshot of the optimizer up to date with the stage and the base path, only what changed since
+        the last pass is traversed again
+
+        :return: IncrementalOptimizer, None if there is no base prim or a job is updating the snapshot.
+        """
+        base_prim = self.get_default_prim()
+        if not base_prim:
+            return None
+        optimizer = self.get_incremental_optimizer()
+        if optimizer.is_updating:
+            return None
+        optimizer.refresh(base_prim)
+        return optimizer
+
+    def get_registry(self):
+        """
+        It returns the index of the prims the optimizer has hidden on the current stage
+
+        :return: OptimizedPrimsRegistry, None if the stage has no optimization layer.
+        """
+        layer = find_optimization_layer(self.stage) if self.stage else None
+        if self._registry is not None and self._registry.layer != layer:
+            self._registry.revoke()
+            self._registry = None
+        if self._registry is None and layer is not None:
+            self._registry = OptimizedPrimsRegistry(layer)
+        return self._registry
+
+    def get_optimized_paths(self):
+        """
+        It returns the paths of the prims the optimizer has hidden on the current stage
+
+        :return: A set of Sdf.Path
+        """
+        registry = self.get_registry()
+        return registry.hidden_paths if registry is not None else set()
+
+    def update_stats(self):
+        """
+        It shows how many objects the optimizer has hidden, deactivated and culled instances of, from its index, and
+        the size of the scene snapshot once a pass has taken it
+        """
+        if self._stats_label is None:
+            return
+        registry = self.get_registry()
+        counts = registry.get_counts() if registry is not None else None
+        if not counts or not any(counts.values()):
+            text = "Nothing hidden by the optimizer"
+        else:
+            text = (
+                f"Hidden by the optimizer: {counts['hidden']} objects, {counts['deactivated']} deactivated, "
+                f"{counts['instancers']} instancers"
+            )
+        optimizer = self._incremental_optimizer
+        if optimizer is not None and optimizer.stage == self.stage and len(optimizer.paths):
+            stats = optimizer.get_stats()
+            text += f" | Snapshot: {stats['prims']} objects, {stats['bytes'] / 1024 ** 2:.1f} MB"
+        self._stats_label.text = text
+
+    def start_live_culling(self):
+        """
+        It starts culling in the background while the user navigates
+        """
+        if self._live_task is None:
+            self._live_task = asyncio.ensure_future(self._live_cull())
+
+    def stop_live_culling(self):
+        """
+        It stops the background culling, what is hidden stays hidden
+        """
+        if self._live_task is not None:
+            self._live_task.cancel()
+            self._live_task = None
+        if self._live_optimizer is not None:
+            self._live_optimizer.revoke()
+            self._live_optimizer = None
+
+    def _on_live_culling(self, model):
+        """
+        It starts or stops live culling when the checkbox changes
+
+        :param model: Model of the checkbox
+        """
+        if model.as_bool:
+            self.start_live_culling()
+        else:
+            self.stop_live_culling()
+
+    async def _live_cull(self):
+        """
+        It keeps the hidden objects in sync with the cameras, one frame at a time
+
+        The work is spread over frames, each frame spends at most the live budget on it. The result is written
+        only once the cameras have settled, so nothing changes while the user is moving.
+        """
+        app = omni.kit.app.get_app()
+        steps = None
+        pending = None
+        started_key = None
+        computed_key = None
+        view_key = None
+        moved_at = time.perf_counter()
+        while True:
+            await app.next_update_async()
+            self.check_stage()
+            camera_path = get_active_viewport_camera_string()
+            if not self.stage or not camera_path:
+                continue
+            settings = self.get_settings()
+            camera_paths = [camera_path] + settings.camera_paths
+            frustums = get_view_frustums(self.stage, camera_paths, settings)
+            if not frustums:
+                continue
+            now = time.perf_counter()
+            # Changing a setting restarts the pass the same way as moving a camera.
+            key = (get_frustums_planes(frustums).tobytes(), repr(vars(settings)))
+            if key != view_key:
+                view_key = key
+                moved_at = now
+
+            optimizer = self._get_live_optimizer(max(self._hysteresis_field.model.as_float, 0.0))
+            # A pass that was started for an older camera position is finished first, then a new one is started.
+            if steps is None and (key != computed_key or optimizer.has_stage_changes()):
+                steps = optimizer.iter_update(camera_paths, settings)
+                started_key = key
+            if steps is not None:
+                deadline = now + max(self._live_budget_field.model.as_float, 0.1) / 1000.0
+                try:
+                    while time.perf_counter() < deadline:
+                        next(steps)
+                except StopIteration as stop:
+                    steps = None
+                    pending = stop.value
+                    computed_key = started_key
+
+            # A running job writes to the same layer, the result waits for it to finish.
+            settled = computed_key == view_key and now - moved_at >= LIVE_SETTLE_SECONDS
+            if pending is not None and settled and self._job_task is None:
+                self._write_live_result(pending, settings, camera_paths)
+                pending = None
+
+    def _get_live_optimizer(self, hysteresis):
+        """
+        It returns the optimizer of live culling, a new one if the stage or the hysteresis changed
+
+        :param hysteresis: Distance a visible object has to be outside of the view to be hidden
+        :return: IncrementalOptimizer
+        """
+        optimizer = self._live_optimizer
+        if optimizer is None or optimizer.stage != self.stage or optimizer.hysteresis != hysteresis:
+            if optimizer is not None:
+                optimizer.revoke()
+            self._live_optimizer = IncrementalOptimizer(self.stage, hysteresis=hysteresis)
+        return self._live_optimizer
+
+    def _write_live_result(self, not_visible, settings, camera_paths):
+        """
+        It writes the difference with the last result to the optimization layer, without adding to the undo stack
+
+        :param not_visible: Paths of the objects to hide
+        :param settings: OptimizerSettings of the pass
+        :param camera_paths: Paths of the cameras of the pass, the lights are culled from them
+        """
+        if settings.light_cutoff > 0:
+            not_visible = list(not_visible) + find_culled_lights(self.stage, camera_paths, settings, not_visible)
+        hidden = set(not_visible)
+        optimized_paths = self.get_optimized_paths()
+        paths_to_hide = [path for path in not_visible if path not in optimized_paths]
+        paths_to_show = [path for path in optimized_paths if path not in hidden]
+        if not paths_to_hide and not paths_to_show:
+            return
+        optimization_layer = self.get_optimization_layer(settings)
+        # The index is updated with what is written, it is not read again after every write.
+        with self.get_registry().updating(paths_to_hide, paths_to_show):
+            clear_visibility_opinions(optimization_layer, paths_to_show)
+            set_visibility_opinions(optimization_layer, paths_to_hide, UsdGeom.Tokens.invisible)
+        self.update_stats()
+
+    def unload_payloads(self, hidden_paths, undo_group=None):
+        """
+        It unloads the payloads that only bring in hidden objects, so they no longer take any memory
+
+        :param hidden_paths: Paths of the hidden objects
+        :param undo_group: _UndoGroup of the job the command is part of, if any
+        :return: A list of paths of the payload prims that were unloaded.
+        """
+        payload_paths = find_culled_payloads(self.stage, hidden_paths)
+        if payload_paths:
+            execute = undo_group.execute if undo_group is not None else omni.kit.commands.execute
+            execute(
+                'SetStageLoadRulesCommand',
+                load_rules=get_unload_rules(self.stage, payload_paths),
+            )
+            self._unloaded_payloads.extend(payload_paths)
+        return payload_paths
+
+    def plan_payloads(self):
+        """
+        It unloads every payload of the stage and loads back only the ones that can be visible from the cameras,
+        nothing is hidden
+        :return: A list of paths of the payload prims that were loaded.
+        """
+        self.check_stage()
+        if not self.stage:
+            return []
+        camera_path = get_active_viewport_camera_string()
+        if not camera_path:
+            return []
+        settings = self.get_settings()
+        previous_load_rules = self.stage.GetLoadRules()
+        loaded_paths, load_rules = plan_payload_loading(self.stage, [camera_path] + settings.camera_paths, settings)
+        # The stage already has the planned rules, the command only makes the planning undoable.
+        omni.kit.commands.execute(
+            'SetStageLoadRulesCommand',
+            load_rules=load_rules,
+            previous_load_rules=previous_load_rules,
+        )
+        return loaded_paths
+
+    def get_settings(self):
+        """
+        It collects the values of the optimizer window into settings for the optimize pass
+
+        :return: OptimizerSettings
+        """
+        return OptimizerSettings(
+            focal_length=self._fov_slider.model.as_float,
+            max_size=self._max_size_slider.model.as_float,
+            max_distance=self._max_distance_field.model.as_float,
+            ignore_size_distant_objects=self._ignore_size_distant_objects.model.as_bool,
+            hide_pattern=self._hide_objects_field.model.as_string,
+            show_pattern=self._show_objects_field.model.as_string,
+            process_lights=self._hide_lights.model.as_bool,
+            base_path=self._base_path_field.model.as_string,
+            occlusion_culling=self._occlusion_culling.model.as_bool,
+            camera_paths=[path.strip() for path in self._cameras_field.model.as_string.split(",") if path.strip()],
+            time_range=self.get_animation_range() if self._use_animation_range.model.as_bool else None,
+            time_stride=max(self._frame_stride_field.model.as_int, 1),
+            swept_time_range=self.get_animation_range() if self._swept_bounds.model.as_bool else None,
+            layer_path=self._layer_path_field.model.as_string.strip(),
+            rules=self.get_filter_rules(),
+            min_pixel_coverage=max(self._min_pixel_coverage_field.model.as_float, 0.0),
+            resolution=self.get_render_resolution(),
+            light_cutoff=max(self._light_cutoff_field.model.as_float, 0.0),
+        )
+
+    def get_render_resolution(self):
+        """
+        It returns the resolution of the active viewport, which the pixel coverage is measured on
+
+        :return: A tuple of the width and the height in pixels.
+        """
+        viewport = get_active_viewport()
+        if viewport is None:
+            return (1920, 1080)
+        width, height = viewport.resolution
+        return (int(width), int(height))
+
+    def get_filter_rules(self):
+        """
+        It returns the rules of the filter rules file, the file is read again only when it changes
+
+        :return: A list of FilterRule, empty if there is no file or it can't be read.
+        """
+        path = self._rules_file_field.model.as_string.strip()
+        if not path:
+            return []
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            modified = None
+        if (path, modified) != self._filter_rules_key:
+            self._filter_rules_key = (path, modified)
+            try:
+                self._filter_rules = load_filter_rules(path)
+            except (OSError, ValueError, KeyError, TypeError) as error:
+                print(f"[karpenko.camera_view_optimizer.ext] Could not read the filter rules {path}: {error}")
+                self._filter_rules = []
+        return self._filter_rules
+
+    def get_animation_range(self):
+        """
+        It returns the start and end time codes of the timeline
+
+        :return: A tuple of two time codes.
+        """
+        timeline = omni.timeline.get_timeline_interface()
+        time_codes_per_second = timeline.get_time_codes_per_seconds()
+        return (
+            timeline.get_start_time() * time_codes_per_second,
+            timeline.get_end_time() * time_codes_per_second,
+        )
 
     def get_distance_between_translations(self, pos1, pos2):
         """
@@ -207,18 +823,17 @@ class CameraViewOptimizer(omni.ext.IExt):
             )
         return 0
 
-    def get_prim_size(self, prim):
+    def get_prim_size(self, prim, scene_bounds=None):
         """
         It returns the size of a prim in world space
 
         :param prim: The prim you want to get the size of
+        :param scene_bounds: SceneBounds of the current pass, a new one is created if not provided
         :return: The size of the bounding box of the prim.
         """
-        bbox_cache = UsdGeom.BBoxCache(Usd.TimeCode.Default(), includedPurposes=[UsdGeom.Tokens.default_])
-        bbox_cache.Clear()
-        prim_bbox = bbox_cache.ComputeWorldBound(prim)
-        prim_range = prim_bbox.ComputeAlignedRange()
-        return prim_range.GetSize()
+        if scene_bounds is None:
+            scene_bounds = SceneBounds()
+        return scene_bounds.get_size(prim)
 
     def render_main_window(self):
         self._window = ui.Window("Camera View Omptimizer", width=300, height=300)
@@ -232,8 +847,8 @@ class CameraViewOptimizer(omni.ext.IExt):
                     with ui.VStack():
                         with ui.VStack():
                             with ui.HStack(height=0):
-                                tooltip = "When checking the visibility of the object, the camera FOV will be set " \
-                                            "to the value specified in the slider and then back once scan is complete"
+                                tooltip = "When checking the visibility of the object, the camera view is computed " \
+                                            "with this focal length instead of the one set on the camera"
                                 ui.Label("Scan FOV (mm):", elided_text=True, tooltip=tooltip)
                                 # Slider for the FOV value of the camera
                                 self._fov_slider = ui.IntSlider(
@@ -271,6 +886,35 @@ class CameraViewOptimizer(omni.ext.IExt):
 
                         ui.Spacer(height=10)
 
+                        # light cutoff float field
+                        with ui.VStack():
+                            tooltip = "Hide lights that can't light anything in view. A light reaches as far as " \
+                                      "its intensity, exposure and size keep it above this value, within its cone. " \
+                                      "Distant lights are always kept. 0 disables it."
+                            with ui.HStack(height=0):
+                                ui.Label("Light cutoff:", elided_text=True, tooltip=tooltip)
+                                self._light_cutoff_field = ui.FloatField(tooltip=tooltip)
+                                self._light_cutoff_field.model.set_value(0.0)
+
+                        ui.Spacer(height=10)
+
+                        # occlusion culling checkbox
+                        with ui.VStack():
+                            tooltip = "Also hide objects that are completely behind objects bigger than " \
+                                      "Max object size, like walls and floors"
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Occlusion culling:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._occlusion_culling = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                self._occlusion_culling.model.set_value(False)
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
                         # max distance int field
                         with ui.VStack():
                             tooltip = "Max distance of the object from the camera. If the object is further than this" \
@@ -282,6 +926,18 @@ class CameraViewOptimizer(omni.ext.IExt):
 
                         ui.Spacer(height=10)
 
+                        # min pixel coverage float field
+                        with ui.VStack():
+                            tooltip = "Hide objects that would cover fewer pixels than this in the viewport, like " \
+                                      "bolts, cables and foliage far from the camera. It uses the focal length of " \
+                                      "the camera and the viewport resolution. 0 disables it."
+                            with ui.HStack(height=0):
+                                ui.Label("Min pixel coverage:", elided_text=True, tooltip=tooltip)
+                                self._min_pixel_coverage_field = ui.FloatField(tooltip=tooltip)
+                                self._min_pixel_coverage_field.model.set_value(0.0)
+
+                        ui.Spacer(height=10)
+
                         # ignore size settings for distant objects
                         with ui.VStack():
                             tooltip = "No matter the size of the object, if it is too far away, it will be hidden"
@@ -316,6 +972,196 @@ class CameraViewOptimizer(omni.ext.IExt):
 
                         ui.Spacer(height=10)
 
+                        # ordered show and hide rules, checked before the two fields above
+                        with ui.VStack():
+                            tooltip = "JSON file with a list of show and hide rules that match the name, path, type, " \
+                                      "kind, purpose or an attribute of objects. The first matching rule wins, and " \
+                                      "the rules are checked before the two fields above."
+                            with ui.HStack(height=0):
+                                ui.Label("Filter rules file:", elided_text=True, tooltip=tooltip)
+                                self._rules_file_field = ui.StringField(tooltip=tooltip)
+
+                        ui.Spacer(height=10)
+
+                        # additional cameras
+                        with ui.VStack():
+                            tooltip = "Comma separated paths of cameras to scan in addition to the active one. " \
+                                      "Objects are hidden only if they are not visible from any of the cameras."
+                            with ui.HStack(height=0):
+                                ui.Label("Additional cameras:", elided_text=True, tooltip=tooltip)
+                                self._cameras_field = ui.StringField(tooltip=tooltip)
+
+                        ui.Spacer(height=10)
+
+                        # scan the cameras over the animation range
+                        with ui.VStack():
+                            tooltip = "Scan the cameras at every frame stride of the timeline range, " \
+                                      "useful for animated cameras and fly-throughs"
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Use animation range:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._use_animation_range = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                self._use_animation_range.model.set_value(False)
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
+                        with ui.VStack():
+                            tooltip = "Number of frames between two scanned camera poses of the animation range"
+                            with ui.HStack(height=0):
+                                ui.Label("Frame stride:", tooltip=tooltip)
+                                self._frame_stride_field = ui.IntField(tooltip=tooltip)
+                                self._frame_stride_field.model.set_value(10)
+
+                        ui.Spacer(height=10)
+
+                        # sweep the bounds of animated objects over the animation range
+                        with ui.VStack():
+                            tooltip = "Animated objects are kept if any of their poses at every frame stride of " \
+                                      "the timeline range can be seen, instead of only their pose at the default " \
+                                      "time. Objects without animation are not slowed down."
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Swept bounds of animated objects:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._swept_bounds = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
+                        # file of the optimization layer
+                        with ui.VStack():
+                            tooltip = "File of the layer the hidden state is written to. If empty, an anonymous " \
+                                      "layer is used that is not saved with the stage."
+                            with ui.HStack(height=0):
+                                ui.Label("Optimization layer file:", elided_text=True, tooltip=tooltip)
+                                self._layer_path_field = ui.StringField(tooltip=tooltip)
+
+                        ui.Spacer(height=10)
+
+                        # turn the optimization layer on and off
+                        with ui.VStack():
+                            tooltip = "Turn the optimization on or off without losing it, by muting its layer"
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Apply optimization:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._apply_optimization = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                self._apply_optimization.model.set_value(True)
+                                self._apply_optimization.model.add_value_changed_fn(self._on_apply_optimization)
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
+                        # keep culling while the user navigates
+                        with ui.VStack():
+                            tooltip = "Keep hiding the objects that are not visible while you navigate. The " \
+                                      "changes are written once the camera stops and are not added to the undo " \
+                                      "history."
+                            with ui.HStack(height=0):
+                                ui.Label("Live culling:", elided_text=True, tooltip=tooltip, width=ui.Percent(50))
+                                self._live_culling = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                self._live_culling.model.add_value_changed_fn(self._on_live_culling)
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
+                        with ui.VStack():
+                            tooltip = "Time live culling may spend per frame, in milliseconds"
+                            with ui.HStack(height=0):
+                                ui.Label("Live budget (ms):", elided_text=True, tooltip=tooltip)
+                                self._live_budget_field = ui.FloatField(tooltip=tooltip)
+                                self._live_budget_field.model.set_value(4.0)
+
+                        ui.Spacer(height=10)
+
+                        with ui.VStack():
+                            tooltip = "How far outside of the view an object has to be before live culling hides " \
+                                      "it, so objects on the edge of the view don't flicker"
+                            with ui.HStack(height=0):
+                                ui.Label("Edge hysteresis:", elided_text=True, tooltip=tooltip)
+                                self._hysteresis_field = ui.FloatField(tooltip=tooltip)
+                                self._hysteresis_field.model.set_value(50.0)
+
+                        ui.Spacer(height=10)
+
+                        # hide the instances of point instancers one by one
+                        with ui.VStack():
+                            tooltip = "Hide the instances of point instancers (forests, crowds) that are not " \
+                                      "visible one by one, instead of keeping or hiding the whole instancer"
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Cull instances:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._cull_instances = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                self._cull_instances.model.set_value(True)
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
+                        # unload payloads that only bring in hidden objects
+                        with ui.VStack():
+                            tooltip = "Unload the payloads of hidden objects instead of only hiding them, " \
+                                      "which frees their memory. Show all loads them again."
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Unload culled payloads:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._unload_payloads = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
+                        # deactivate hidden objects instead of deleting them
+                        with ui.VStack():
+                            tooltip = "Delete hidden deactivates the hidden objects in the optimization layer " \
+                                      "instead of deleting them. It frees their memory as well, and Show all " \
+                                      "activates them again."
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Deactivate instead of delete:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._deactivate_hidden = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
+                        # keep the scene snapshot in a file next to the stage between sessions
+                        with ui.VStack():
+                            tooltip = "Optimize saves the bounds of the objects next to the stage file, the first " \
+                                      "Optimize of the next session only computes again the objects of the layers " \
+                                      "that changed since."
+                            with ui.HStack(height=0):
+                                ui.Label(
+                                    "Cache the scene snapshot:",
+                                    elided_text=True,
+                                    tooltip=tooltip,
+                                    width=ui.Percent(50)
+                                )
+                                self._cache_snapshot = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                                ui.Line(name="default", width=ui.Percent(45))
+
+                        ui.Spacer(height=10)
+
                         # base path where to search for objects
                         with ui.VStack():
                             with ui.HStack(height=0):
@@ -344,6 +1190,15 @@ class CameraViewOptimizer(omni.ext.IExt):
                             clicked_fn=self.delete_hidden,
                         )
 
+                with ui.VStack(height=40):
+                    self._button_plan_payloads = ui.Button(
+                        "Load visible payloads only",
+                        height=40,
+                        clicked_fn=self.plan_payloads,
+                        tooltip="Unload all payloads and load back only the ones that can be visible from the "
+                                "cameras, using the extents hints of the models",
+                    )
+
                 with ui.VStack(height=40):
                     # Button to execute the extension
                     self._button_optimize = ui.Button(
@@ -352,6 +1207,51 @@ class CameraViewOptimizer(omni.ext.IExt):
                         clicked_fn=self.optimize,
                     )
 
+                # progress of the running job
+                with ui.HStack(height=20):
+                    self._progress_label = ui.Label("", elided_text=True)
+                    self._button_cancel = ui.Button(
+                        "Cancel",
+                        width=80,
+                        clicked_fn=self.cancel_job,
+                        enabled=False,
+                        tooltip="Stop the running job and undo what it has changed",
+                    )
+
+                # what the optimizer has hidden, from its index
+                self._stats_label = ui.Label("", elided_text=True, height=20)
+                self.update_stats()
+
+                # what the last Optimize did
+                with ui.CollapsableFrame("Last optimization report", collapsed=True, height=0):
+                    with ui.VStack(height=0):
+                        self._report_label = ui.Label("No report yet", word_wrap=True, height=0)
+                        ui.Spacer(height=5)
+                        with ui.HStack(height=0):
+                            tooltip = "Show the phases of Optimize as zones of the Kit profiler"
+                            ui.Label("Profiler zones:", elided_text=True, tooltip=tooltip, width=ui.Percent(50))
+                            self._profiler_zones = ui.CheckBox(tooltip=tooltip, width=ui.Percent(5))
+                            ui.Line(name="default", width=ui.Percent(45))
+                        ui.Spacer(height=5)
+                        with ui.HStack(height=0):
+                            tooltip = "JSON file the report is exported to"
+                            self._report_path_field = ui.StringField(tooltip=tooltip)
+                            ui.Button("Export", width=80, clicked_fn=self.export_report, tooltip=tooltip)
+
+    def _on_apply_optimization(self, model):
+        """
+        It mutes or unmutes the optimization layer when the checkbox changes
+
+        :param model: Model of the checkbox
+        """
+        self.check_stage()
+        if self.stage:
+            layer = find_optimization_layer(self.stage)
+            if layer is not None:
+                # The stage lets go of the layer once it is muted.
+                self._optimization_layers[self.stage.GetRootLayer().identifier] = layer
+            set_optimization_layer_muted(self.stage, not model.as_bool)
+
     async def _dock_window(self):
         """
         It waits for the property window to appear, then docks the window to it
@@ -392,38 +1292,44 @@ class CameraViewOptimizer(omni.ext.IExt):
         self.check_stage()
         if not self.stage:
             return
-        if self._base_path_field.model.as_string == "":
-            return self.stage.GetDefaultPrim()
-        else:
-            custom_default_prim = self.stage.GetPrimAtPath(self._base_path_field.model.as_string)
-            if not custom_default_prim:
-                return self.stage.GetDefaultPrim()
-            else:
-                return custom_default_prim
+        return get_base_prim(self.stage, self._base_path_field.model.as_string)
+
+    def iter_all_objects(self, only_visible=False):
+        """
+        It yields all the objects under the base path one by one, and if the only_visible parameter is set to True,
+        invisible objects and everything under them are skipped. The prototypes of point instancers are left out, they
+        are only drawn through their instancer. The objects are read from the scene snapshot, the stage is only
+        traversed while a job updates the snapshot
+
+        :param only_visible: If True, only visible objects will be yielded, defaults to False (optional)
+        :return: A generator of objects
+        """
+        if not self.stage:
+            return
+        snapshot = self.get_scene_snapshot()
+        if snapshot is not None:
+            for path in snapshot.get_object_paths(only_visible):
+                yield self.stage.GetPrimAtPath(path)
+            return
+        traversal = PrimTraversal(
+            self.get_default_prim(),
+            skip_non_imageable=True,
+            prune_fn=is_invisible if only_visible else None,
+        )
+        for obj in traversal:
+            yield obj
+            if obj.IsA(UsdGeom.PointInstancer):
+                traversal.prune()
 
     def get_all_objects(self, only_visible=False):
         """
         It returns a list of all the objects in the scene, and if the only_visible parameter is set to True,
         it will only return objects that are visible
 
-        :param only_visible: If True, only visible objects will be returned, defaults to True (optional)
+        :param only_visible: If True, only visible objects will be returned, defaults to False (optional)
         :return: A list of objects
         """
-        if not self.stage:
-            return []
-        valid_objects = []
-        default_prim = self.get_default_prim()
-        for obj in self.get_all_children_of_prim(default_prim):
-            if obj:
-                if only_visible:
-                    visibility_attr = obj.GetAttribute("visibility")
-                    if visibility_attr:
-                        visibility = visibility_attr.Get()
-                        if visibility != "invisible":
-                            valid_objects.append(obj)
-                else:
-                    valid_objects.append(obj)
-        return valid_objects
+        return list(self.iter_all_objects(only_visible))
 
     def get_all_children_of_prim(self, prim):
         """
@@ -432,12 +1338,32 @@ class CameraViewOptimizer(omni.ext.IExt):
         :param prim: The prim you want to get the children of
         :return: A list of all the children of the prim.
         """
-        children = []
-        for child in prim.GetAllChildren():
-            if child.GetTypeName() != "Scope":
-                children.append(child)
-            children.extend(self.get_all_children_of_prim(child))
-        return children
+        return list(PrimTraversal(prim))
+
+    def iter_hidden_objects(self, prune_hidden=False):
+        """
+        It yields all the hidden objects under the base path one by one, from the scene snapshot like
+        iter_all_objects
+
+        :param prune_hidden: If True, objects under a hidden object are not visited, useful when the hidden
+            object is going to be deleted together with its children (optional)
+        :return: A generator of objects
+        """
+        if not self.stage:
+            return
+        snapshot = self.get_scene_snapshot()
+        if snapshot is not None:
+            for path in snapshot.get_invisible_paths(top_most=prune_hidden):
+                yield self.stage.GetPrimAtPath(path)
+            return
+        traversal = PrimTraversal(self.get_default_prim(), skip_non_imageable=True)
+        for obj in traversal:
+            if is_invisible(obj):
+                yield obj
+                if prune_hidden:
+                    traversal.prune()
+            if obj.IsA(UsdGeom.PointInstancer):
+                traversal.prune()
 
     def get_all_hidden_objects(self):
         """
@@ -445,42 +1371,93 @@ class CameraViewOptimizer(omni.ext.IExt):
 
         :return: A list of objects
         """
-        if not self.stage:
-            return []
-        valid_objects = []
-        default_prim = self.get_default_prim()
-        for obj in self.get_all_children_of_prim(default_prim):
-            if obj:
-                visibility_attr = obj.GetAttribute("visibility")
-                if visibility_attr:
-                    visibility = visibility_attr.Get()
-                    if visibility == "invisible":
-                        valid_objects.append(obj)
-        return valid_objects
+        return list(self.iter_hidden_objects())
 
     def show_all(self):
         """
-        It gets all the hidden objects in the scene, and if there are any, it shows them
-        :return: A list of objects that were hidden.
+        It starts showing everything the optimizer has hidden, as a job
+
+        :return: The asyncio task of the job, None if another job is running.
         """
-        objects_to_show = self.get_all_hidden_objects()
-        if objects_to_show:
-            omni.kit.commands.execute(
-                'ShowSelectedPrimsCommand',
-                selected_paths=[i.GetPath() for i in objects_to_show],
-            )
-        return objects_to_show
+        return self.run_job("Show all", self._iter_show_all)
+
+    def _iter_show_all(self, progress):
+        """
+        It shows everything the optimizer has hidden or deactivated by clearing its layer, and loads the payloads it
+        has unloaded. Objects hidden in other layers stay hidden
+        :param progress: JobProgress of the job
+        :return: A generator, its return value is the list of paths of objects the optimizer had hidden.
+        """
+        self.check_stage()
+        registry = self.get_registry()
+        paths_to_show = sorted(registry.hidden_paths) if registry is not None else []
+        progress.start_phase("Showing", len(paths_to_show))
+        with _UndoGroup() as undo_group:
+            if self._unloaded_payloads:
+                undo_group.execute(
+                    'SetStageLoadRulesCommand',
+                    load_rules=get_reload_rules(self.stage, self._unloaded_payloads),
+                )
+            if registry is not None:
+                undo_group.execute(
+                    'ClearOptimizationLayerCommand',
+                    layer_identifier=registry.layer.identifier,
+                )
+            progress.done = len(paths_to_show)
+            yield
+        self._unloaded_payloads = []
+        return paths_to_show
 
     def delete_hidden(self):
         """
-        It gets all the hidden objects in the scene, and if there are any, it deletes them
-        :return: A list of objects that were deleted.
+        It starts deleting all the hidden objects in the scene, as a job
+
+        :return: The asyncio task of the job, None if another job is running.
         """
-        objects_to_delete = self.get_all_hidden_objects()
+        return self.run_job("Delete hidden", self._iter_delete_hidden)
 
-        if objects_to_delete:
-            omni.kit.commands.execute(
-                'DeletePrims',
-                paths=[i.GetPath() for i in objects_to_delete],
-            )
-        return objects_to_delete
+    def _iter_delete_hidden(self, progress):
+        """
+        It gets the objects the optimizer has hidden under the base path, and if there are any, it deletes them, or
+        deactivates them in the optimization layer if Deactivate instead of delete is on. Objects hidden in other
+        layers are left alone
+        :param progress: JobProgress of the job
+        :return: A generator, its return value is the list of paths of objects that were deleted.
+        """
+        self.check_stage()
+        registry = self.get_registry()
+        if registry is None:
+            return []
+        # Children of a hidden object are deleted together with it, so only the top-most ones are checked.
+        root_paths = get_root_paths(registry.hidden_paths)
+        base_path = self.get_default_prim().GetPath()
+        progress.start_phase("Scanning", len(root_paths))
+        paths_to_delete = []
+        for path in root_paths:
+            progress.done += 1
+            prim = self.stage.GetPrimAtPath(path) if path.HasPrefix(base_path) else None
+            # Objects that are deactivated already, or not hidden because the optimization is turned off, are kept.
+            if prim and prim.IsActive() and is_invisible(prim):
+                paths_to_delete.append(path)
+                progress.hidden = len(paths_to_delete)
+            if progress.done % JOB_CHUNK_SIZE == 0:
+                yield
+        if not paths_to_delete:
+            return paths_to_delete
+
+        # All paths go to a single command, so every layer gets one batched edit instead of one per chunk.
+        selected_paths = [path.pathString for path in paths_to_delete]
+        with _UndoGroup() as undo_group:
+            if self._deactivate_hidden.model.as_bool:
+                progress.start_phase("Deactivating", len(paths_to_delete))
+                undo_group.execute(
+                    'DeactivateSelectedPrimsCommand',
+                    selected_paths=selected_paths,
+                    layer_identifier=registry.layer.identifier,
+                )
+            else:
+                progress.start_phase("Deleting", len(paths_to_delete))
+                undo_group.execute('DeleteSelectedPrimsCommand', selected_paths=selected_paths)
+            progress.done += len(paths_to_delete)
+            yield
+        return paths_to_delete
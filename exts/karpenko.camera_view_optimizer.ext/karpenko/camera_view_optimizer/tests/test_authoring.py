@@ -0,0 +1,130 @@
+import unittest
+
+from pxr import Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core.authoring import (clear_visibility_opinions, get_make_visible_paths,
+                                                           restore_active_opinions, restore_invisible_ids_opinions,
+                                                           restore_visibility_opinions, set_active_opinions,
+                                                           set_invisible_ids_opinions, set_visibility_opinions)
+
+
+def build_cubes_stage():
+    """
+    It builds a stage with two cubes under /World, the second one is invisible in the root layer
+
+    :return: Usd.Stage
+    """
+    stage = Usd.Stage.CreateInMemory()
+    UsdGeom.Xform.Define(stage, "/World")
+    UsdGeom.Cube.Define(stage, "/World/A")
+    UsdGeom.Cube.Define(stage, "/World/B").MakeInvisible()
+    return stage
+
+
+def get_visibility(stage, path):
+    return UsdGeom.Imageable(stage.GetPrimAtPath(path)).ComputeVisibility()
+
+
+class TestVisibilityOpinions(unittest.TestCase):
+    def test_hide_and_undo(self):
+        stage = build_cubes_stage()
+        layer = stage.GetRootLayer()
+        before = layer.ExportToString()
+        paths = [Sdf.Path("/World/A"), Sdf.Path("/World/B")]
+        undo_state = set_visibility_opinions(stage, paths, UsdGeom.Tokens.invisible)
+        self.assertEqual(get_visibility(stage, "/World/A"), UsdGeom.Tokens.invisible)
+        restore_visibility_opinions(paths, undo_state)
+        self.assertEqual(get_visibility(stage, "/World/A"), UsdGeom.Tokens.inherited)
+        self.assertEqual(get_visibility(stage, "/World/B"), UsdGeom.Tokens.invisible)
+        self.assertEqual(layer.ExportToString(), before)
+
+    def test_undo_with_duplicate_paths(self):
+        stage = build_cubes_stage()
+        paths = ["/World/A", "/World/A", Sdf.Path("/World/A")]
+        undo_state = set_visibility_opinions(stage, paths, UsdGeom.Tokens.invisible)
+        restore_visibility_opinions(paths, undo_state)
+        self.assertEqual(get_visibility(stage, "/World/A"), UsdGeom.Tokens.inherited)
+
+    def test_undo_removes_created_specs(self):
+        stage = build_cubes_stage()
+        session_layer = stage.GetSessionLayer()
+        paths = [Sdf.Path("/World/A")]
+        undo_state = set_visibility_opinions(session_layer, paths, UsdGeom.Tokens.invisible)
+        self.assertEqual(undo_state.created_specs, [Sdf.Path("/World")])
+        self.assertEqual(get_visibility(stage, "/World/A"), UsdGeom.Tokens.invisible)
+        restore_visibility_opinions(paths, undo_state)
+        self.assertFalse(session_layer.GetPrimAtPath("/World"))
+
+    def test_clear_removes_empty_specs(self):
+        stage = build_cubes_stage()
+        session_layer = stage.GetSessionLayer()
+        set_visibility_opinions(session_layer, ["/World/A"], UsdGeom.Tokens.invisible)
+        clear_visibility_opinions(session_layer, ["/World/A"])
+        self.assertFalse(session_layer.GetPrimAtPath("/World"))
+        self.assertEqual(get_visibility(stage, "/World/A"), UsdGeom.Tokens.inherited)
+
+
+class TestMakeVisiblePaths(unittest.TestCase):
+    def build_stage(self):
+        stage = build_cubes_stage()
+        UsdGeom.Xform.Define(stage, "/World/Group").MakeInvisible()
+        for name in ("C", "D", "E"):
+            UsdGeom.Cube.Define(stage, "/World/Group/" + name)
+        UsdGeom.Scope.Define(stage, "/World/Group/Looks")
+        return stage
+
+    def get_visibilities(self, stage):
+        return {
+            str(prim.GetPath()): UsdGeom.Imageable(prim).ComputeVisibility()
+            for prim in stage.Traverse()
+            if prim.IsA(UsdGeom.Imageable)
+        }
+
+    def test_same_visibility_as_make_visible(self):
+        expected_stage = self.build_stage()
+        UsdGeom.Imageable(expected_stage.GetPrimAtPath("/World/Group/C")).MakeVisible()
+        stage = self.build_stage()
+        shown_paths, hidden_paths = get_make_visible_paths(stage, ["/World/Group/C"])
+        self.assertEqual(shown_paths, [Sdf.Path("/World/Group"), Sdf.Path("/World/Group/C")])
+        self.assertEqual(hidden_paths, [Sdf.Path("/World/Group/D"), Sdf.Path("/World/Group/E"),
+                                        Sdf.Path("/World/Group/Looks")])
+        set_visibility_opinions(stage, shown_paths, UsdGeom.Tokens.inherited)
+        set_visibility_opinions(stage, hidden_paths, UsdGeom.Tokens.invisible)
+        self.assertEqual(self.get_visibilities(stage), self.get_visibilities(expected_stage))
+
+    def test_siblings_on_the_way_to_other_paths_are_kept(self):
+        stage = self.build_stage()
+        shown_paths, hidden_paths = get_make_visible_paths(stage, ["/World/Group/C", "/World/Group/D"])
+        self.assertEqual(shown_paths, [Sdf.Path("/World/Group"), Sdf.Path("/World/Group/C"),
+                                       Sdf.Path("/World/Group/D")])
+        self.assertEqual(hidden_paths, [Sdf.Path("/World/Group/E"), Sdf.Path("/World/Group/Looks")])
+
+    def test_visible_ancestors_are_left_alone(self):
+        stage = self.build_stage()
+        self.assertEqual(get_make_visible_paths(stage, ["/World/B"]), ([Sdf.Path("/World/B")], []))
+
+
+class TestActiveOpinions(unittest.TestCase):
+    def test_deactivate_and_undo_with_duplicate_paths(self):
+        stage = build_cubes_stage()
+        paths = ["/World/A", "/World/A"]
+        undo_state = set_active_opinions(stage, paths, False)
+        self.assertFalse(stage.GetPrimAtPath("/World/A").IsActive())
+        restore_active_opinions(paths, undo_state)
+        self.assertTrue(stage.GetPrimAtPath("/World/A").IsActive())
+        self.assertFalse(stage.GetRootLayer().GetPrimAtPath("/World/A").HasInfo("active"))
+
+
+class TestInvisibleIdsOpinions(unittest.TestCase):
+    def test_hide_instances_and_undo(self):
+        stage = Usd.Stage.CreateInMemory()
+        instancer = UsdGeom.PointInstancer.Define(stage, "/Instancer")
+        instancer.CreateInvisibleIdsAttr([7])
+        undo_state = set_invisible_ids_opinions(stage, {"/Instancer": [1, 2], Sdf.Path("/Instancer"): [3]})
+        self.assertEqual(list(instancer.GetInvisibleIdsAttr().Get()), [3])
+        restore_invisible_ids_opinions(undo_state)
+        self.assertEqual(list(instancer.GetInvisibleIdsAttr().Get()), [7])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+from pxr import Gf, Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core.bounds import SceneBounds
+from karpenko.camera_view_optimizer.core.culling import find_hidden_paths
+from karpenko.camera_view_optimizer.core.frustum import get_time_codes
+from karpenko.camera_view_optimizer.core.settings import OptimizerSettings
+
+
+def build_animated_stage():
+    """
+    It builds a stage with a cube moving from x=0 to x=10 over time codes 0 to 10 inside of a group, a cube carried by
+    a moving xform and a static cube
+
+    :return: Usd.Stage
+    """
+    stage = Usd.Stage.CreateInMemory()
+    UsdGeom.Xform.Define(stage, "/World")
+    UsdGeom.Xform.Define(stage, "/World/Group")
+    translate_op = UsdGeom.Cube.Define(stage, "/World/Group/Moving").AddTranslateOp()
+    translate_op.Set(Gf.Vec3d(0.0, 0.0, 0.0), 0.0)
+    translate_op.Set(Gf.Vec3d(10.0, 0.0, 0.0), 10.0)
+    translate_op = UsdGeom.Xform.Define(stage, "/World/Carrier").AddTranslateOp()
+    translate_op.Set(Gf.Vec3d(0.0, 0.0, 0.0), 0.0)
+    translate_op.Set(Gf.Vec3d(0.0, 0.0, -10.0), 10.0)
+    UsdGeom.Cube.Define(stage, "/World/Carrier/Carried")
+    UsdGeom.Cube.Define(stage, "/World/Static").AddTranslateOp().Set(Gf.Vec3d(0.0, 5.0, 0.0))
+    return stage
+
+
+def get_prims(stage, paths):
+    return [stage.GetPrimAtPath(path) for path in paths]
+
+
+class TestSweptBounds(unittest.TestCase):
+    def test_animated_prims_are_swept(self):
+        stage = build_animated_stage()
+        scene_bounds = SceneBounds(time_codes=get_time_codes(0.0, 10.0, 5.0))
+        mins, maxs = scene_bounds.compute_world_bounds(
+            get_prims(stage, ["/World/Group/Moving", "/World/Group", "/World/Carrier/Carried", "/World/Static"])
+        )
+        np.testing.assert_allclose(mins, [[-1, -1, -1], [-1, -1, -1], [-1, -1, -11], [-1, 4, -1]])
+        np.testing.assert_allclose(maxs, [[11, 1, 1], [11, 1, 1], [1, 1, 1], [1, 6, 1]])
+
+    def test_bounds_without_time_codes_are_static(self):
+        stage = build_animated_stage()
+        mins, maxs = SceneBounds().compute_world_bounds(get_prims(stage, ["/World/Group/Moving"]))
+        np.testing.assert_allclose(mins, [[-1, -1, -1]])
+        np.testing.assert_allclose(maxs, [[1, 1, 1]])
+
+    def test_time_varying_prims(self):
+        stage = build_animated_stage()
+        scene_bounds = SceneBounds(time_codes=get_time_codes(0.0, 10.0))
+        paths = ["/World", "/World/Group", "/World/Group/Moving", "/World/Carrier/Carried", "/World/Static"]
+        self.assertEqual(
+            [scene_bounds.is_time_varying(prim) for prim in get_prims(stage, paths)], [True, True, True, True, False]
+        )
+        self.assertFalse(SceneBounds().is_time_varying(stage.GetPrimAtPath("/World/Group/Moving")))
+
+    def test_time_codes_include_the_end(self):
+        self.assertEqual(get_time_codes(0.0, 10.0, 4.0), [Usd.TimeCode(0), Usd.TimeCode(4), Usd.TimeCode(8),
+                                                          Usd.TimeCode(10)])
+
+
+class TestSweptCulling(unittest.TestCase):
+    def test_prim_moving_into_the_view_is_kept(self):
+        stage = Usd.Stage.CreateInMemory()
+        stage.SetDefaultPrim(UsdGeom.Xform.Define(stage, "/World").GetPrim())
+        UsdGeom.Camera.Define(stage, "/Camera")
+        # Far to the side of the camera at the default time, in front of it at the end of the animation.
+        translate_op = UsdGeom.Cube.Define(stage, "/World/Moving").AddTranslateOp()
+        translate_op.Set(Gf.Vec3d(1000.0, 0.0, -50.0))
+        translate_op.Set(Gf.Vec3d(1000.0, 0.0, -50.0), 0.0)
+        translate_op.Set(Gf.Vec3d(0.0, 0.0, -50.0), 10.0)
+        settings = OptimizerSettings()
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], settings), [Sdf.Path("/World/Moving")])
+        settings = OptimizerSettings(swept_time_range=(0.0, 10.0), time_stride=5.0)
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], settings), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
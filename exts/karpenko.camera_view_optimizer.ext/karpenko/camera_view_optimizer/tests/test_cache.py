@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from pxr import Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core.cache import (ARRAY_ALIGNMENT, find_changed_roots, get_cache_header,
+                                                       get_cache_path, is_mapped, read_cache, write_cache)
+from karpenko.camera_view_optimizer.core.incremental import IncrementalOptimizer
+
+
+class TestCacheFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "stage.usda.cvo_snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_arrays_are_mapped_back(self):
+        arrays = {
+            "mins": np.arange(12, dtype=np.float64).reshape(4, 3),
+            "depths": np.array([0, 1, 1, 2], dtype=np.int32),
+            "empty": np.zeros((0, 3), dtype=np.float32),
+        }
+        write_cache(self.path, {"base_path": "/World"}, arrays)
+        header, read_arrays = read_cache(self.path)
+        self.assertEqual(header["base_path"], "/World")
+        self.assertEqual(list(read_arrays), list(arrays))
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(read_arrays[name], array)
+            self.assertEqual(read_arrays[name].dtype, array.dtype)
+        self.assertTrue(is_mapped(read_arrays["mins"]))
+        self.assertTrue(is_mapped(read_arrays["mins"][1:]))
+        self.assertFalse(is_mapped(np.array(read_arrays["mins"])))
+        # The arrays are mapped copy on write, the file is never modified.
+        read_arrays["depths"][0] = 7
+        np.testing.assert_array_equal(read_cache(self.path)[1]["depths"], arrays["depths"])
+
+    def test_damaged_or_missing_files_are_ignored(self):
+        self.assertIsNone(read_cache(self.path))
+        with open(self.path, "wb") as cache_file:
+            cache_file.write(b"not a cache")
+        self.assertIsNone(read_cache(self.path))
+        write_cache(self.path, {"base_path": "/World"}, {"mins": np.zeros((ARRAY_ALIGNMENT, 3))})
+        with open(self.path, "r+b") as cache_file:
+            # Past the magic and the header size, in the JSON header.
+            cache_file.seek(17)
+            cache_file.write(b"{")
+        self.assertIsNone(read_cache(self.path))
+        write_cache(self.path, {"base_path": "/World"}, {"mins": np.zeros((ARRAY_ALIGNMENT, 3))})
+        # The array is cut short, not only its alignment padding.
+        os.truncate(self.path, os.path.getsize(self.path) - ARRAY_ALIGNMENT - 8)
+        self.assertIsNone(read_cache(self.path))
+
+
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        layer_path = os.path.join(self.directory.name, "stage.usda")
+        self.stage = Usd.Stage.CreateNew(layer_path)
+        self.stage.SetDefaultPrim(UsdGeom.Xform.Define(self.stage, "/World").GetPrim())
+        for index in range(3):
+            UsdGeom.Cube.Define(self.stage, f"/World/Group_{index}/Cube")
+        self.stage.Save()
+        self.cache_path = get_cache_path(self.stage)
+        self.optimizers = []
+
+    def tearDown(self):
+        for optimizer in self.optimizers:
+            optimizer.revoke()
+        self.directory.cleanup()
+
+    def create_optimizer(self):
+        optimizer = IncrementalOptimizer(self.stage)
+        self.optimizers.append(optimizer)
+        return optimizer
+
+    def test_cache_path_is_next_to_the_root_layer(self):
+        self.assertEqual(self.cache_path, self.stage.GetRootLayer().realPath + ".cvo_snapshot")
+        self.assertIsNone(get_cache_path(Usd.Stage.CreateInMemory()))
+
+    def test_save_and_load(self):
+        optimizer = self.create_optimizer()
+        optimizer.refresh(self.stage.GetDefaultPrim())
+        self.assertTrue(optimizer.save_cache(self.cache_path))
+        loaded = self.create_optimizer()
+        self.assertTrue(loaded.load_cache(self.cache_path))
+        self.assertEqual(loaded.get_object_paths(), optimizer.get_object_paths())
+        # The arrays mapped from the file are copied before it is replaced.
+        self.assertTrue(loaded.save_cache(self.cache_path))
+        self.assertTrue(self.create_optimizer().load_cache(self.cache_path))
+
+    def test_changed_subtrees_are_traversed_again(self):
+        optimizer = self.create_optimizer()
+        optimizer.refresh(self.stage.GetDefaultPrim())
+        optimizer.save_cache(self.cache_path)
+        self.assertEqual(find_changed_roots(self.stage, read_cache(self.cache_path)[0]), set())
+
+        UsdGeom.Cube.Define(self.stage, "/World/Group_1/Added")
+        self.stage.Save()
+        self.assertEqual(find_changed_roots(self.stage, read_cache(self.cache_path)[0]), {Sdf.Path("/World")})
+        loaded = self.create_optimizer()
+        self.assertTrue(loaded.load_cache(self.cache_path))
+        loaded.refresh(self.stage.GetDefaultPrim())
+        self.assertIn(Sdf.Path("/World/Group_1/Added"), loaded.get_object_paths())
+
+    def test_changed_load_rules_take_the_whole_snapshot_again(self):
+        header = get_cache_header(self.stage, Sdf.Path("/World"))
+        self.stage.SetLoadRules(Usd.StageLoadRules.LoadNone())
+        self.assertIsNone(find_changed_roots(self.stage, header))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import math
+import unittest
+
+import numpy as np
+from pxr import Gf, Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core.coverage import (get_camera_pixel_scale, get_distance_limits,
+                                                          get_frustum_pixel_scale)
+from karpenko.camera_view_optimizer.core.culling import find_hidden_paths
+from karpenko.camera_view_optimizer.core.settings import OptimizerSettings
+
+
+class TestPixelScale(unittest.TestCase):
+    def test_frustum_pixel_scale(self):
+        # The default frustum has a window from -1 to 1, the wider scale of the resolution is kept.
+        self.assertEqual(get_frustum_pixel_scale(Gf.Frustum(), (1920, 1080)), 960.0)
+        self.assertEqual(get_frustum_pixel_scale(Gf.Frustum(), (1000, 3000)), 1500.0)
+
+    def test_camera_pixel_scale(self):
+        stage = Usd.Stage.CreateInMemory()
+        camera = UsdGeom.Camera.Define(stage, "/Camera")
+        camera.CreateFocalLengthAttr(20.0)
+        camera.CreateHorizontalApertureAttr(20.0)
+        camera.CreateVerticalApertureAttr(20.0)
+        self.assertAlmostEqual(get_camera_pixel_scale(camera.GetPrim(), (1920, 1080)), 1920.0)
+
+
+class TestDistanceLimits(unittest.TestCase):
+    def setUp(self):
+        self.mins = np.array([[-1.0, -1.0, -1.0], [-3.0, -3.0, -3.0], [-np.inf] * 3, [np.inf] * 3])
+        self.maxs = np.array([[1.0, 1.0, 1.0], [3.0, 3.0, 3.0], [np.inf] * 3, [-np.inf] * 3])
+
+    def test_without_coverage_the_max_distance_is_used(self):
+        settings = OptimizerSettings(max_distance=500.0)
+        limits = get_distance_limits(settings, np.array([100.0, 200.0]), self.mins, self.maxs)
+        np.testing.assert_array_equal(limits, np.full((2, 4), 500.0))
+
+    def test_small_boxes_are_limited_closer(self):
+        settings = OptimizerSettings(max_distance=500.0, min_pixel_coverage=math.pi)
+        pixel_scales = np.array([100.0, 200.0])
+        limits = get_distance_limits(settings, pixel_scales, self.mins, self.maxs)
+        radius = math.sqrt(3.0)
+        np.testing.assert_allclose(limits[:, 0], [radius * math.sqrt(10001.0), radius * math.sqrt(40001.0)])
+        # The bounding sphere covers exactly the min pixel coverage at its limit.
+        coverage = math.pi * (pixel_scales * radius) ** 2 / (limits[:, 0] ** 2 - radius ** 2)
+        np.testing.assert_allclose(coverage, settings.min_pixel_coverage)
+        # The bigger box reaches the max distance, unbounded and empty boxes are never too small.
+        np.testing.assert_array_equal(limits[:, 1:], np.full((2, 3), 500.0))
+
+
+class TestCoverageCulling(unittest.TestCase):
+    def test_small_far_prim_is_hidden(self):
+        stage = Usd.Stage.CreateInMemory()
+        stage.SetDefaultPrim(UsdGeom.Xform.Define(stage, "/World").GetPrim())
+        UsdGeom.Camera.Define(stage, "/Camera")
+        UsdGeom.Cube.Define(stage, "/World/Near").AddTranslateOp().Set(Gf.Vec3d(0.0, 0.0, -50.0))
+        UsdGeom.Cube.Define(stage, "/World/Far").AddTranslateOp().Set(Gf.Vec3d(0.0, 0.0, -500.0))
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], OptimizerSettings()), [])
+        # At 1920 pixels wide, the far cube covers about 200 pixels and the near one about 20000.
+        settings = OptimizerSettings(min_pixel_coverage=1000.0)
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], settings), [Sdf.Path("/World/Far")])
+
+
+if __name__ == "__main__":
+    unittest.main()
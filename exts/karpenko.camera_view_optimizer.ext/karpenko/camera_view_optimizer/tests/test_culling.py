@@ -0,0 +1,46 @@
+import unittest
+
+from pxr import Gf, Sdf, Usd, UsdGeom, UsdLux
+
+from karpenko.camera_view_optimizer.core.culling import find_hidden_paths
+from karpenko.camera_view_optimizer.core.settings import OptimizerSettings
+
+
+def build_light_group_stage():
+    """
+    It builds a stage with a camera looking down -Z and, far to its side, a group with a cube and a sphere light
+
+    :return: Usd.Stage
+    """
+    stage = Usd.Stage.CreateInMemory()
+    world = UsdGeom.Xform.Define(stage, "/World")
+    stage.SetDefaultPrim(world.GetPrim())
+    UsdGeom.Camera.Define(stage, "/Camera")
+    group = UsdGeom.Xform.Define(stage, "/World/Group")
+    group.AddTranslateOp().Set(Gf.Vec3d(5000.0, 0.0, 0.0))
+    UsdGeom.Cube.Define(stage, "/World/Group/Cube")
+    UsdLux.SphereLight.Define(stage, "/World/Group/Light")
+    return stage
+
+
+class TestHierarchicalCuller(unittest.TestCase):
+    def test_light_under_hidden_group_is_kept(self):
+        stage = build_light_group_stage()
+        hidden_paths = find_hidden_paths(stage, ["/Camera"], OptimizerSettings())
+        self.assertEqual(hidden_paths, [Sdf.Path("/World/Group/Cube")])
+
+    def test_shown_prim_under_hidden_group_is_kept(self):
+        stage = build_light_group_stage()
+        settings = OptimizerSettings(process_lights=True, show_pattern="Cube")
+        hidden_paths = find_hidden_paths(stage, ["/Camera"], settings)
+        self.assertEqual(hidden_paths, [Sdf.Path("/World/Group/Light")])
+
+    def test_processed_lights_are_hidden_with_their_group(self):
+        stage = build_light_group_stage()
+        settings = OptimizerSettings(process_lights=True)
+        hidden_paths = find_hidden_paths(stage, ["/Camera"], settings)
+        self.assertEqual(hidden_paths, [Sdf.Path("/World/Group")])
+
+
+if __name__ == "__main__":
+    unittest.main()
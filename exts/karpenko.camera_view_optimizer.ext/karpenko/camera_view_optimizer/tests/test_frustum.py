@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+from pxr import Gf
+
+from karpenko.camera_view_optimizer.core.frustum import (INSIDE, INTERSECTING, OUTSIDE, classify_boxes,
+                                                         get_frustum_planes, get_frustums_planes)
+
+
+def build_frustum(position=(0.0, 0.0, 0.0)):
+    """
+    It builds a perspective frustum looking down -Z, with a 90 degrees field of view, a near plane at 1 and a far
+    plane at 10
+
+    :param position: Position of the frustum
+    :return: Gf.Frustum
+    """
+    frustum = Gf.Frustum()
+    frustum.position = Gf.Vec3d(*position)
+    return frustum
+
+
+class TestFrustumPlanes(unittest.TestCase):
+    def test_planes_are_normalized_and_point_inside(self):
+        planes = get_frustum_planes(build_frustum())
+        self.assertEqual(planes.shape, (6, 4))
+        np.testing.assert_allclose(np.linalg.norm(planes[:, :3], axis=1), 1.0)
+        self.assertTrue(np.all(planes @ [0.0, 0.0, -5.0, 1.0] > 0.0))
+        self.assertTrue(np.any(planes @ [0.0, 0.0, 5.0, 1.0] < 0.0))
+
+    def test_near_and_far_planes(self):
+        planes = get_frustum_planes(build_frustum())
+        np.testing.assert_allclose(planes[4], [0.0, 0.0, -1.0, -1.0], atol=1e-9)
+        np.testing.assert_allclose(planes[5], [0.0, 0.0, 1.0, 10.0], atol=1e-9)
+
+    def test_planes_follow_the_frustum_position(self):
+        planes = get_frustum_planes(build_frustum((100.0, 0.0, 0.0)))
+        self.assertTrue(np.all(planes @ [100.0, 0.0, -5.0, 1.0] > 0.0))
+        self.assertTrue(np.any(planes @ [0.0, 0.0, -5.0, 1.0] < 0.0))
+
+
+class TestClassifyBoxes(unittest.TestCase):
+    def setUp(self):
+        self.mins = np.array([
+            [-0.5, -0.5, -5.5],  # In the middle of the view
+            [-0.5, -0.5, -1.5],  # Across the near plane
+            [-0.5, -0.5, 4.5],  # Behind the camera
+            [50.0, -0.5, -5.5],  # Far to the side
+            [-0.5, -0.5, -20.0],  # Past the far plane
+            [-np.inf, -np.inf, -np.inf],  # Unbounded
+        ])
+        self.maxs = np.array([
+            [0.5, 0.5, -4.5],
+            [0.5, 0.5, -0.5],
+            [0.5, 0.5, 5.5],
+            [51.0, 0.5, -4.5],
+            [0.5, 0.5, -19.0],
+            [np.inf, np.inf, np.inf],
+        ])
+
+    def test_states(self):
+        states = classify_boxes(get_frustum_planes(build_frustum()), self.mins, self.maxs)
+        self.assertEqual(states.dtype, np.uint8)
+        self.assertEqual(states.tolist(), [INSIDE, INTERSECTING, OUTSIDE, OUTSIDE, OUTSIDE, INTERSECTING])
+
+    def test_stacked_views(self):
+        planes = get_frustums_planes([build_frustum(), build_frustum((50.5, 0.0, 0.0))])
+        states = classify_boxes(planes, self.mins, self.maxs)
+        self.assertEqual(states.shape, (2, len(self.mins)))
+        self.assertEqual(states[0].tolist(), [INSIDE, INTERSECTING, OUTSIDE, OUTSIDE, OUTSIDE, INTERSECTING])
+        self.assertEqual(states[1, 3], INSIDE)
+
+    def test_margins(self):
+        states, margins = classify_boxes(
+            get_frustum_planes(build_frustum()), self.mins, self.maxs, return_margins=True
+        )
+        self.assertEqual(margins.shape, states.shape)
+        # The box in the middle is 3.5 from the near plane, but its edges are closer to the side planes.
+        self.assertAlmostEqual(margins[0], 4.0 / np.sqrt(2.0))
+        self.assertEqual(margins[5], np.inf)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+from pxr import Gf, Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core.bounds import SceneBounds
+from karpenko.camera_view_optimizer.core.instancers import (compute_instance_bounds, find_culled_instances,
+                                                            get_rotation_matrices)
+from karpenko.camera_view_optimizer.core.settings import OptimizerSettings
+
+
+def build_instancer_stage():
+    """
+    It builds a stage with a camera looking down -Z and a point instancer of cubes, moved 5 units up, with one cube
+    in front of the camera, one twice as big far to its side and one behind it
+
+    :return: A tuple of the Usd.Stage and the UsdGeom.PointInstancer.
+    """
+    stage = Usd.Stage.CreateInMemory()
+    stage.SetDefaultPrim(UsdGeom.Xform.Define(stage, "/World").GetPrim())
+    UsdGeom.Camera.Define(stage, "/Camera")
+    instancer = UsdGeom.PointInstancer.Define(stage, "/World/Instancer")
+    instancer.AddTranslateOp().Set(Gf.Vec3d(0.0, 5.0, 0.0))
+    UsdGeom.Cube.Define(stage, "/World/Instancer/Prototypes/Cube")
+    instancer.CreatePrototypesRel().SetTargets([Sdf.Path("/World/Instancer/Prototypes/Cube")])
+    instancer.CreateProtoIndicesAttr([0, 0, 0])
+    instancer.CreatePositionsAttr([(0.0, 0.0, -50.0), (5000.0, 0.0, -50.0), (0.0, 0.0, 50.0)])
+    instancer.CreateScalesAttr([(1.0, 1.0, 1.0), (2.0, 2.0, 2.0), (1.0, 1.0, 1.0)])
+    instancer.CreateIdsAttr([10, 11, 12])
+    return stage, instancer
+
+
+class TestInstanceBounds(unittest.TestCase):
+    def test_rotation_matrices_match_usd(self):
+        rotation = Gf.Rotation(Gf.Vec3d(1.0, 2.0, 3.0), 40.0)
+        quaternion = rotation.GetQuat()
+        orientation = [*quaternion.GetImaginary(), quaternion.GetReal()]
+        expected = np.array(Gf.Matrix4d().SetRotate(rotation))[:3, :3]
+        np.testing.assert_allclose(get_rotation_matrices([orientation])[0], expected, atol=1e-9)
+        # Quaternions that are not unit length are normalized.
+        np.testing.assert_allclose(get_rotation_matrices([np.multiply(orientation, 3.0)])[0], expected, atol=1e-9)
+
+    def test_instance_bounds(self):
+        _, instancer = build_instancer_stage()
+        mins, maxs = compute_instance_bounds(instancer, SceneBounds())
+        np.testing.assert_allclose(mins, [[-1, 4, -51], [4998, 3, -52], [-1, 4, 49]])
+        np.testing.assert_allclose(maxs, [[1, 6, -49], [5002, 7, -48], [1, 6, 51]])
+
+    def test_missing_prototype_is_never_culled(self):
+        _, instancer = build_instancer_stage()
+        instancer.GetProtoIndicesAttr().Set([0, 3, 0])
+        mins, maxs = compute_instance_bounds(instancer, SceneBounds())
+        self.assertTrue(np.all(np.isneginf(mins[1])) and np.all(np.isposinf(maxs[1])))
+
+
+class TestInstanceCulling(unittest.TestCase):
+    def test_instances_out_of_view_are_culled(self):
+        stage, _ = build_instancer_stage()
+        invisible_ids = find_culled_instances(stage, ["/Camera"], OptimizerSettings())
+        self.assertEqual(list(invisible_ids), [Sdf.Path("/World/Instancer")])
+        self.assertEqual(invisible_ids[Sdf.Path("/World/Instancer")].tolist(), [11, 12])
+
+    def test_authored_invisible_ids_are_kept(self):
+        stage, instancer = build_instancer_stage()
+        instancer.CreateInvisibleIdsAttr([10])
+        invisible_ids = find_culled_instances(stage, ["/Camera"], OptimizerSettings())
+        self.assertEqual(invisible_ids[Sdf.Path("/World/Instancer")].tolist(), [10, 11, 12])
+
+    def test_hidden_instancers_are_skipped(self):
+        stage, _ = build_instancer_stage()
+        hidden_paths = [Sdf.Path("/World/Instancer")]
+        self.assertEqual(find_culled_instances(stage, ["/Camera"], OptimizerSettings(), hidden_paths), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+from pxr import Gf, Sdf, Usd, UsdLux
+
+from karpenko.camera_view_optimizer.core.bounds import SceneBounds
+from karpenko.camera_view_optimizer.core.culling import find_hidden_paths
+from karpenko.camera_view_optimizer.core.incremental import IncrementalOptimizer
+from karpenko.camera_view_optimizer.core.lights import find_culled_lights, get_light_influence_bounds
+from karpenko.camera_view_optimizer.core.settings import OptimizerSettings
+from karpenko.camera_view_optimizer.tests.test_culling import build_light_group_stage
+
+
+class TestLightCulling(unittest.TestCase):
+    def test_light_under_hidden_group_is_culled_by_its_influence(self):
+        stage = build_light_group_stage()
+        settings = OptimizerSettings(process_lights=True, light_cutoff=1.0)
+        hidden_paths = find_hidden_paths(stage, ["/Camera"], settings)
+        self.assertEqual(hidden_paths, [Sdf.Path("/World/Group/Cube")])
+        culled_lights = find_culled_lights(stage, ["/Camera"], settings, hidden_paths)
+        self.assertEqual(culled_lights, [Sdf.Path("/World/Group/Light")])
+
+    def test_incremental_keeps_ancestors_of_lights(self):
+        stage = build_light_group_stage()
+        optimizer = IncrementalOptimizer(stage)
+        try:
+            hidden_paths = optimizer.update(["/Camera"], OptimizerSettings())
+        finally:
+            optimizer.revoke()
+        self.assertEqual(hidden_paths, [Sdf.Path("/World/Group/Cube")])
+
+    def test_cone_bounds_hold_the_cap(self):
+        stage = Usd.Stage.CreateInMemory()
+        light = UsdLux.SphereLight.Define(stage, "/Light")
+        light.CreateRadiusAttr(0.0)
+        light.CreateIntensityAttr(100.0)
+        light.CreateNormalizeAttr(True)
+        # The -Z axis is inside of the tilted cone, so the cap reaches further along it than its rim and its tip.
+        light.AddRotateXOp().Set(10.0)
+        light.GetPrim().CreateAttribute("inputs:shaping:cone:angle", Sdf.ValueTypeNames.Float).Set(30.0)
+        mins, maxs = get_light_influence_bounds([light.GetPrim()], SceneBounds(), 1.0)
+        self.assertAlmostEqual(mins[0, 2], -10.0)
+
+        # Directions on the boundary of the cone, around its axis.
+        angles = np.radians(np.arange(0.0, 360.0, 5.0))
+        cone = np.radians(30.0)
+        directions = np.stack(
+            [np.sin(cone) * np.cos(angles), np.sin(cone) * np.sin(angles), np.full(len(angles), -np.cos(cone))], axis=1
+        )
+        transform = light.ComputeLocalToWorldTransform(Usd.TimeCode.Default())
+        points = [np.array(transform.TransformDir(Gf.Vec3d(*direction))) * 10.0 for direction in directions]
+        self.assertTrue(np.all(np.asarray(points) >= mins[0] - 1e-6))
+        self.assertTrue(np.all(np.asarray(points) <= maxs[0] + 1e-6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+from pxr import Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core import namespace
+from karpenko.camera_view_optimizer.core.namespace import (delete_prim_specs, get_root_paths, restore_deleted_prims,
+                                                           split_deletable_paths)
+
+
+def build_children_stage(count=6):
+    """
+    It builds a stage with count cubes under /World, each with a child, and an opinion on the second cube in the
+    session layer
+
+    :param count: Number of cubes
+    :return: Usd.Stage
+    """
+    stage = Usd.Stage.CreateInMemory()
+    stage.SetDefaultPrim(UsdGeom.Xform.Define(stage, "/World").GetPrim())
+    for index in range(count):
+        UsdGeom.Cube.Define(stage, f"/World/Cube_{index}/Child")
+    with Usd.EditContext(stage, stage.GetSessionLayer()):
+        UsdGeom.Imageable(stage.GetPrimAtPath("/World/Cube_1")).MakeInvisible()
+    return stage
+
+
+def export_layers(stage):
+    return [layer.ExportToString() for layer in stage.GetLayerStack(includeSessionLayers=True)]
+
+
+class TestRootPaths(unittest.TestCase):
+    def test_paths_under_other_paths_are_removed(self):
+        paths = [Sdf.Path("/World/B/Child"), Sdf.Path("/World/A"), Sdf.Path("/World/B"), Sdf.Path("/World/A")]
+        self.assertEqual(get_root_paths(paths), [Sdf.Path("/World/A"), Sdf.Path("/World/B")])
+
+
+class TestDeletablePaths(unittest.TestCase):
+    def test_referenced_prims_are_not_deletable(self):
+        stage = build_children_stage()
+        referenced = stage.DefinePrim("/World/Referenced")
+        referenced.GetReferences().AddInternalReference("/World/Cube_0")
+        deletable, kept = split_deletable_paths(stage, ["/World/Cube_2", "/World/Referenced", "/World/Missing"])
+        self.assertEqual(deletable, [Sdf.Path("/World/Cube_2")])
+        self.assertEqual(kept, [Sdf.Path("/World/Referenced")])
+
+
+class TestDeletePrimSpecs(unittest.TestCase):
+    def delete_and_restore(self):
+        stage = build_children_stage()
+        before = export_layers(stage)
+        paths = ["/World/Cube_3/Child", "/World/Cube_1", "/World/Cube_3", "/World/Cube_4"]
+        undo_state = delete_prim_specs(stage, paths)
+        remaining = [child.GetName() for child in stage.GetPrimAtPath("/World").GetChildren()]
+        self.assertEqual(remaining, ["Cube_0", "Cube_2", "Cube_5"])
+        self.assertFalse(stage.GetSessionLayer().GetPrimAtPath("/World/Cube_1"))
+        restore_deleted_prims(undo_state)
+        self.assertEqual(export_layers(stage), before)
+        return stage, undo_state
+
+    def test_delete_and_restore(self):
+        stage, undo_state = self.delete_and_restore()
+        self.assertEqual(
+            [layer for layer, _, _ in undo_state.removed], [stage.GetSessionLayer(), stage.GetRootLayer()]
+        )
+        self.assertEqual(undo_state.rebuilt, [])
+
+    def test_delete_and_restore_by_rebuilding_the_parent(self):
+        # Removing children is made as slow as copying them, so /World is rebuilt in the root layer, where it holds
+        # little more than the removed children, and not in the session layer.
+        with mock.patch.object(namespace, "REBUILD_MIN_SIBLING_VISITS", 0), \
+                mock.patch.object(namespace, "SIBLING_VISITS_PER_SPEC", 1):
+            stage, undo_state = self.delete_and_restore()
+        self.assertEqual([layer for layer, _, _ in undo_state.removed], [stage.GetSessionLayer()])
+        self.assertEqual(
+            [(layer, parent_path) for layer, _, parent_path, _ in undo_state.rebuilt],
+            [(stage.GetRootLayer(), Sdf.Path("/World"))],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
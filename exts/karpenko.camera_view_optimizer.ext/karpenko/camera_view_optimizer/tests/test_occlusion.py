@@ -0,0 +1,97 @@
+import unittest
+
+import numpy as np
+from pxr import Gf, Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core.culling import find_hidden_paths
+from karpenko.camera_view_optimizer.core.occlusion import OcclusionBuffer, get_prim_triangles
+from karpenko.camera_view_optimizer.core.settings import OptimizerSettings
+
+
+def build_frustum():
+    """
+    It builds a perspective frustum at the origin looking down -Z, with a 90 degrees field of view
+
+    :return: Gf.Frustum
+    """
+    frustum = Gf.Frustum()
+    frustum.nearFar = Gf.Range1d(1.0, 1000.0)
+    return frustum
+
+
+def get_wall_triangles(half_size, z):
+    """
+    It returns the two triangles of a square facing the camera, centered on the view axis
+
+    :param half_size: Half of the width of the square
+    :param z: Depth of the square
+    :return: A (2, 3, 3) array.
+    """
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.float64) * half_size
+    points = np.column_stack((corners, np.full(4, z)))
+    return points[[[0, 1, 2], [0, 2, 3]]]
+
+
+class TestPrimTriangles(unittest.TestCase):
+    def test_cube_and_mesh_triangles(self):
+        stage = Usd.Stage.CreateInMemory()
+        cube = UsdGeom.Cube.Define(stage, "/Cube")
+        cube.CreateSizeAttr(4.0)
+        triangles = get_prim_triangles(cube.GetPrim())
+        self.assertEqual(triangles.shape, (12, 3, 3))
+        self.assertEqual(np.abs(triangles).max(), 2.0)
+        mesh = UsdGeom.Mesh.Define(stage, "/Mesh")
+        mesh.CreatePointsAttr([(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0), (2, 0, 0)])
+        mesh.CreateFaceVertexCountsAttr([4, 3])
+        mesh.CreateFaceVertexIndicesAttr([0, 1, 2, 3, 1, 4, 2])
+        self.assertEqual(get_prim_triangles(mesh.GetPrim()).shape, (3, 3, 3))
+        sphere = UsdGeom.Sphere.Define(stage, "/Sphere")
+        self.assertEqual(get_prim_triangles(sphere.GetPrim()).shape, (0, 3, 3))
+
+
+class TestOcclusionBuffer(unittest.TestCase):
+    def setUp(self):
+        self.mins = np.array([[-1.0, -1.0, -51.0], [-1.0, -1.0, -11.0], [-1.0, -1.0, -21.0]])
+        self.maxs = np.array([[1.0, 1.0, -49.0], [1.0, 1.0, -9.0], [1.0, 1.0, -19.0]])
+
+    def test_boxes_behind_an_occluder(self):
+        buffer = OcclusionBuffer(build_frustum(), width=64)
+        self.assertEqual(buffer.add_occluder(get_wall_triangles(5.0, -20.0)), 2)
+        # Behind the wall, in front of it, and across it.
+        self.assertEqual(buffer.test_boxes(self.mins, self.maxs).tolist(), [True, False, False])
+
+    def test_boxes_beside_an_occluder(self):
+        buffer = OcclusionBuffer(build_frustum(), width=64)
+        buffer.add_occluder(get_wall_triangles(5.0, -20.0))
+        self.assertEqual(buffer.test_boxes(self.mins + [30.0, 0.0, 0.0], self.maxs + [30.0, 0.0, 0.0]).tolist(),
+                         [False, False, False])
+
+    def test_empty_buffer_occludes_nothing(self):
+        buffer = OcclusionBuffer(build_frustum(), width=64)
+        self.assertFalse(buffer.test_boxes(self.mins, self.maxs).any())
+
+    def test_pyramid_keeps_the_farthest_depth(self):
+        buffer = OcclusionBuffer(build_frustum(), width=64)
+        buffer.add_occluder(get_wall_triangles(5.0, -20.0))
+        buffer.build_pyramid()
+        self.assertEqual(buffer.pyramid[-1].shape, (1, 1))
+        self.assertEqual(buffer.pyramid[-1][0, 0], np.inf)
+        self.assertAlmostEqual(buffer.pyramid[0][32, 32], 20.0)
+
+
+class TestOcclusionCulling(unittest.TestCase):
+    def test_prim_behind_a_wall_is_hidden(self):
+        stage = Usd.Stage.CreateInMemory()
+        stage.SetDefaultPrim(UsdGeom.Xform.Define(stage, "/World").GetPrim())
+        UsdGeom.Camera.Define(stage, "/Camera")
+        wall = UsdGeom.Cube.Define(stage, "/World/Wall")
+        wall.AddTranslateOp().Set(Gf.Vec3d(0.0, 0.0, -20.0))
+        wall.AddScaleOp().Set(Gf.Vec3f(200.0, 200.0, 1.0))
+        UsdGeom.Cube.Define(stage, "/World/Hidden").AddTranslateOp().Set(Gf.Vec3d(0.0, 0.0, -50.0))
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], OptimizerSettings(max_size=100.0)), [])
+        settings = OptimizerSettings(max_size=100.0, occlusion_culling=True, occlusion_resolution=64)
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], settings), [Sdf.Path("/World/Hidden")])
+
+
+if __name__ == "__main__":
+    unittest.main()
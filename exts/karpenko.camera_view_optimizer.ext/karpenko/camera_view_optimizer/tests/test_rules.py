@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pxr import Gf, Kind, Sdf, Usd, UsdGeom
+
+from karpenko.camera_view_optimizer.core.culling import find_hidden_paths
+from karpenko.camera_view_optimizer.core.rules import (HIDE, SHOW, CompiledRules, FilterRule, compile_rules,
+                                                       get_filter_rules, load_filter_rules)
+from karpenko.camera_view_optimizer.core.settings import OptimizerSettings
+
+
+def build_rules_stage():
+    """
+    It builds a stage with a camera looking down -Z, a component cube in front of it and a proxy sphere with a
+    "layer" attribute far to its side
+
+    :return: Usd.Stage
+    """
+    stage = Usd.Stage.CreateInMemory()
+    stage.SetDefaultPrim(UsdGeom.Xform.Define(stage, "/World").GetPrim())
+    UsdGeom.Camera.Define(stage, "/Camera")
+    cube = UsdGeom.Cube.Define(stage, "/World/Props/Crate")
+    cube.AddTranslateOp().Set(Gf.Vec3d(0.0, 0.0, -50.0))
+    Usd.ModelAPI(cube.GetPrim()).SetKind(Kind.Tokens.component)
+    sphere = UsdGeom.Sphere.Define(stage, "/World/Props/Proxy_Ball")
+    sphere.AddTranslateOp().Set(Gf.Vec3d(5000.0, 0.0, -50.0))
+    sphere.CreatePurposeAttr(UsdGeom.Tokens.proxy)
+    sphere.GetPrim().CreateAttribute("layer", Sdf.ValueTypeNames.String).Set("background")
+    return stage
+
+
+class TestFilterRule(unittest.TestCase):
+    def test_parse_attribute_field(self):
+        rule = FilterRule.parse(HIDE, "attribute:layer", "back")
+        self.assertEqual(rule, FilterRule(HIDE, "attribute", "back", "layer"))
+        self.assertEqual(
+            rule.to_dict(), {"action": HIDE, "field": "attribute", "pattern": "back", "attribute": "layer"}
+        )
+
+    def test_invalid_rules_are_refused(self):
+        with self.assertRaises(ValueError):
+            FilterRule("keep", "name", "Crate")
+        with self.assertRaises(ValueError):
+            FilterRule(SHOW, "color", "red")
+        with self.assertRaises(ValueError):
+            FilterRule(SHOW, "attribute", "red")
+
+    def test_load_filter_rules(self):
+        rules = [FilterRule(SHOW, "kind", "component"), FilterRule(HIDE, "attribute", "back", "layer")]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rules.json")
+            with open(path, "w", encoding="utf-8") as rules_file:
+                json.dump([rule.to_dict() for rule in rules], rules_file)
+            self.assertEqual(load_filter_rules(path), rules)
+
+
+class TestCompiledRules(unittest.TestCase):
+    def evaluate(self, rules, path):
+        stage = build_rules_stage()
+        return CompiledRules(rules).evaluate(stage.GetPrimAtPath(path))
+
+    def test_every_field_is_matched(self):
+        crate, ball = "/World/Props/Crate", "/World/Props/Proxy_Ball"
+        cases = [
+            (FilterRule(HIDE, "name", "crate"), crate, ball),
+            (FilterRule(HIDE, "path", r".*/Proxy_\w+$"), ball, crate),
+            (FilterRule(HIDE, "type", "Sphere"), ball, crate),
+            (FilterRule(HIDE, "kind", "component"), crate, ball),
+            (FilterRule(HIDE, "purpose", "proxy"), ball, crate),
+            (FilterRule(HIDE, "attribute", "back", "layer"), ball, crate),
+        ]
+        for rule, matched_path, other_path in cases:
+            with self.subTest(field=rule.field):
+                self.assertEqual(self.evaluate([rule], matched_path), HIDE)
+                self.assertIsNone(self.evaluate([rule], other_path))
+
+    def test_first_matching_rule_wins(self):
+        rules = [FilterRule(SHOW, "name", "Crate"), FilterRule(HIDE, "path", "/World/Props")]
+        self.assertEqual(self.evaluate(rules, "/World/Props/Crate"), SHOW)
+        self.assertEqual(self.evaluate(rules, "/World/Props/Proxy_Ball"), HIDE)
+
+    def test_rules_without_pattern_are_skipped(self):
+        compiled = CompiledRules([FilterRule(HIDE, "name", "")])
+        self.assertFalse(compiled)
+        self.assertFalse(compiled.has_hide_rules)
+
+    def test_invalid_regex_matches_as_text(self):
+        stage = build_rules_stage()
+        prim = stage.GetPrimAtPath("/World/Props/Proxy_Ball")
+        prim.GetAttribute("layer").Set("Sky (far")
+        self.assertEqual(CompiledRules([FilterRule(HIDE, "attribute", "sky (", "layer")]).evaluate(prim), HIDE)
+        self.assertIsNone(CompiledRules([FilterRule(HIDE, "attribute", "sea (", "layer")]).evaluate(prim))
+
+    def test_patterns_come_after_the_rules(self):
+        rule = FilterRule(HIDE, "type", "Cube")
+        settings = OptimizerSettings(rules=[rule], show_pattern="Crate", hide_pattern="Ball")
+        self.assertEqual(
+            get_filter_rules(settings), [rule, FilterRule(SHOW, "name", "Crate"), FilterRule(HIDE, "name", "Ball")]
+        )
+        compiled = compile_rules(settings)
+        self.assertTrue(compiled.has_show_rules and compiled.has_hide_rules)
+        stage = build_rules_stage()
+        self.assertEqual(compiled.evaluate(stage.GetPrimAtPath("/World/Props/Crate")), HIDE)
+
+
+class TestRuleCulling(unittest.TestCase):
+    def test_rules_override_the_cameras(self):
+        stage = build_rules_stage()
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], OptimizerSettings()),
+                         [Sdf.Path("/World/Props/Proxy_Ball")])
+        settings = OptimizerSettings(rules=[FilterRule(SHOW, "purpose", "proxy"), FilterRule(HIDE, "kind", "comp")])
+        self.assertEqual(find_hidden_paths(stage, ["/Camera"], settings), [Sdf.Path("/World/Props/Crate")])
+
+
+if __name__ == "__main__":
+    unittest.main()